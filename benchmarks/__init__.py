@@ -0,0 +1,5 @@
+"""
+__init__.py
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
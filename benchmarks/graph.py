@@ -0,0 +1,81 @@
+"""
+graph
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import random
+import string
+
+import arrow
+
+from neume_hq.api.edges import Knows, WorksAt
+from neume_hq.api.nodes import Department, Person
+
+INSERT = 'FOR doc IN @docs INSERT doc INTO @@collection RETURN NEW._id'
+REMOVE_ALL = 'FOR doc IN @@collection REMOVE doc IN @@collection'
+CHUNK_SIZE = 1000
+
+
+def _name(rnd: random.Random, size: int = 8) -> str:
+    return ''.join(rnd.choice(string.ascii_letters) for _ in range(size))
+
+
+async def insert(db, collection: str, docs: list) -> list:
+    ids = []
+    for offset in range(0, len(docs), CHUNK_SIZE):
+        ids.extend([
+            _id async for _id in db.query(
+                INSERT,
+                bind_vars={'@collection': collection,
+                           'docs': docs[offset:offset + CHUNK_SIZE]}
+            )
+        ])
+    return ids
+
+
+async def truncate(db, *collections: str):
+    for collection in collections:
+        async for _ in db.query(REMOVE_ALL, bind_vars={'@collection': collection}):
+            pass
+
+
+async def seed(db, people: int = 1000, friends: int = 10,
+               people_per_department: int = 50, seed: int = 0) -> dict:
+    """
+    Seeds a synthetic person graph: people that know up to `friends`
+    others and work at one of people / people_per_department departments.
+    Whatever a previous run left in these collections is removed first,
+    the seeded emails are unique, but the same for every run.
+    """
+    await truncate(db, Knows._collname_, WorksAt._collname_,
+                   Person._collname_, Department._collname_)
+    rnd = random.Random(seed)
+    now = arrow.utcnow().timestamp
+    person_ids = await insert(db, Person._collname_, [
+        {'name': _name(rnd),
+         'email': f'{_name(rnd)}.{i}@example.com',
+         'birthday': f'19{rnd.randint(50, 99)}-01-01',
+         '_created': now}
+        for i in range(people)
+    ])
+    department_ids = await insert(db, Department._collname_, [
+        {'title': _name(rnd, 12), 'description': _name(rnd, 64), '_created': now}
+        for _ in range(max(1, people // people_per_department))
+    ])
+    knows = [
+        {'_from': _from, '_to': _to, 'status': 'accepted', '_created': now}
+        for _from in person_ids
+        for _to in rnd.sample(person_ids, min(friends, len(person_ids)))
+        if _to != _from
+    ]
+    works_at = [
+        {'_from': _from, '_to': rnd.choice(department_ids),
+         'status': 'employed', '_created': now}
+        for _from in person_ids
+    ]
+    await insert(db, Knows._collname_, knows)
+    await insert(db, WorksAt._collname_, works_at)
+    return {'people': person_ids,
+            'departments': department_ids,
+            'knows': len(knows),
+            'works_at': len(works_at)}
@@ -0,0 +1,239 @@
+"""
+run
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+
+Benchmarks representative GraphQL queries against a seeded person graph:
+
+    python -m benchmarks.run --people 1000 --iterations 200 --out bench.json
+
+Results (p50/p99 latency, throughput, db round trips per request) are
+written as JSON, compare two runs with --compare old.json.
+--backend memory runs against the in-memory database, no server needed.
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import random
+import subprocess
+import time
+import uuid
+
+import arrow
+import ujson as json
+from graphql.execution.executors.asyncio import AsyncioExecutor
+
+from benchmarks.graph import seed
+from neume_hq.api.schema import schema
+from neume_hq.gql.cache import DocumentCache, TTLCache
+from neume_hq.gql.executor import NativeExecutor
+from neume_hq.gql.provision import IndexListing
+from neume_hq.gql.tracing import TracedDB, Tracer
+
+# created people must not collide with the unique email index,
+# neither within a run nor with people a previous run created
+RUN = uuid.uuid4().hex[:8]
+_created = itertools.count()
+
+SCENARIOS = {
+    'people': {
+        'query': '{ people(first: 100) { edges { node { id name email } } } }',
+    },
+    'friends': {
+        'query': ('{ people(first: 50) { edges { node { name '
+                  'friends { edges { status node { name } } } } } } }'),
+    },
+    'friends_compiled': {
+        'query': ('{ people(first: 50) { edges { node { name '
+                  'friends { edges { status node { name } } } } } } }'),
+        'context': {'compile': True},
+    },
+    'node': {
+        'query': ('query ($id: ID!) { node(id: $id) '
+                  '{ id ... on Person { name email employer { title } } } }'),
+        'variables': lambda graph, rnd: {'id': rnd.choice(graph['people'])},
+    },
+    'create_person': {
+        'query': ('mutation ($person: PersonInput) '
+                  '{ createPerson(person: $person) { Id } }'),
+        'variables': lambda graph, rnd: {'person': {
+            'name': f'bench{rnd.randint(0, 1 << 30)}',
+            'email': f'bench-{RUN}-{next(_created)}@example.com'}},
+    },
+}
+
+
+async def connect_arango(args):
+    from aio_arango.db import ArangoDB
+    db = ArangoDB(args.user, args.password, args.database, address=args.address)
+    await db.login()
+    return db
+
+
+async def connect_memory(args):
+    from neume_hq.testing.arango import MemoryArangoDB
+    return await MemoryArangoDB().login()
+
+
+BACKENDS = {
+    'arango': connect_arango,
+    'memory': connect_memory,
+}
+
+EXECUTORS = {
+    'asyncio': AsyncioExecutor,
+    'native': NativeExecutor,
+}
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p * len(ordered)) - 1)]
+
+
+class Runner:
+
+    def __init__(self, gql_schema, db, graph: dict, loop, executor: str = 'native'):
+        self._schema = gql_schema
+        self._db = db
+        self._graph = graph
+        self._executor = EXECUTORS[executor](loop=loop)
+        self._documents = TTLCache()
+
+    async def execute(self, query: str, variables: dict = None, context: dict = None):
+        tracer = Tracer()
+        result = await self._schema.execute(
+            query,
+            variable_values=variables,
+            context_value={'db': TracedDB(self._db, tracer),
+                           'cache': DocumentCache(self._documents),
+                           **(context or {})},
+            executor=self._executor,
+            return_promise=True
+        )
+        if result.errors:
+            raise RuntimeError(f'{query}: {result.errors}')
+        return tracer.finish()
+
+    async def scenario(self, name: str, iterations: int, concurrency: int,
+                       warmup: int, rnd: random.Random) -> dict:
+        cfg = SCENARIOS[name]
+        make_variables = cfg.get('variables', lambda *_: None)
+        latencies, round_trips = [], []
+
+        async def worker(count: int, record: bool):
+            for _ in range(count):
+                variables = make_variables(self._graph, rnd)
+                start = time.perf_counter()
+                tracer = await self.execute(cfg['query'], variables, cfg.get('context'))
+                if record:
+                    latencies.append(time.perf_counter() - start)
+                    round_trips.append(len(tracer.statements))
+
+        await worker(warmup, False)
+        per_worker = max(1, iterations // concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(per_worker, True) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return {
+            'requests': len(latencies),
+            'concurrency': concurrency,
+            'p50_ms': percentile(latencies, 0.5) * 1e3,
+            'p99_ms': percentile(latencies, 0.99) * 1e3,
+            'mean_ms': sum(latencies) / len(latencies) * 1e3,
+            'throughput_rps': len(latencies) / elapsed,
+            'round_trips': sum(round_trips) / len(round_trips),
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old: dict, new: dict) -> list:
+    lines = []
+    for name, result in new['scenarios'].items():
+        before = old['scenarios'].get(name, None)
+        if before is None:
+            continue
+        lines.append(
+            f'{name:<18} p50 {before["p50_ms"]:8.2f} -> {result["p50_ms"]:8.2f} ms'
+            f'  p99 {before["p99_ms"]:8.2f} -> {result["p99_ms"]:8.2f} ms'
+            f'  round trips {before["round_trips"]:6.1f} -> {result["round_trips"]:6.1f}'
+        )
+    return lines
+
+
+async def main(args, loop) -> dict:
+    db = await BACKENDS[args.backend](args)
+    # the in-memory database lists its indexes itself
+    listing = None
+    if args.backend == 'arango':
+        listing = IndexListing(args.address, args.database, args.user, args.password)
+    try:
+        gql_schema = await schema.setup(db, listing=listing)
+    finally:
+        if listing is not None:
+            await listing.close()
+    graph = await seed(db, people=args.people, friends=args.friends, seed=args.seed)
+    runner = Runner(gql_schema, db, graph, loop, args.executor)
+    rnd = random.Random(args.seed)
+    results = {}
+    for name in args.scenarios:
+        results[name] = await runner.scenario(
+            name, args.iterations, args.concurrency, args.warmup, rnd)
+        print(f'{name:<18} p50 {results[name]["p50_ms"]:8.2f} ms'
+              f'  p99 {results[name]["p99_ms"]:8.2f} ms'
+              f'  {results[name]["throughput_rps"]:8.1f} req/s'
+              f'  {results[name]["round_trips"]:6.1f} round trips')
+    close = getattr(db, 'close', None)
+    if close is not None:
+        await close()
+    return {
+        'revision': git_revision(),
+        'date': arrow.utcnow().for_json(),
+        'backend': args.backend,
+        'executor': args.executor,
+        'people': args.people,
+        'friends': args.friends,
+        'scenarios': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='neume-hq GraphQL benchmarks')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='arango')
+    parser.add_argument('--executor', choices=sorted(EXECUTORS), default='native')
+    parser.add_argument('--address', default='http://localhost:8529')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='user-pw')
+    parser.add_argument('--database', default='bench')
+    parser.add_argument('--people', type=int, default=1000)
+    parser.add_argument('--friends', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument('--out', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of a previous run')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    loop = asyncio.get_event_loop()
+    report = loop.run_until_complete(main(args, loop))
+    if args.out:
+        with open(args.out, 'w') as out:
+            out.write(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as old:
+            print('\n'.join(compare(json.loads(old.read()), report)))
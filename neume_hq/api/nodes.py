@@ -53,6 +53,7 @@ class Person(Node):
 
     class Config:
         indexes = (Index('email'),)
+        materialized = ('friends',)
 
 
 class Group(Node):
@@ -67,6 +68,7 @@ class Group(Node):
     )
     class Config:
         indexes = (Index('title'),)
+        materialized = ('members',)
 
 
 class Department(Node):
@@ -89,6 +91,7 @@ class Department(Node):
 
     class Config:
         indexes = (Index('title'),)
+        materialized = ('employees',)
 
 
 class Info(Node):
@@ -3,10 +3,9 @@ schema
 author: Tim "tjtimer" Jedro
 created: 31.01.19
 """
-from sanic_graphql import GraphQLView
-
 from neume_hq.gql.aql import Graph
-from neume_hq.gql.gql import GQLSchema
+from neume_hq.gql.cache import DocumentCache
+from neume_hq.gql.gql import GQLSchema, GQView as BaseView
 from neume_hq.api import nodes, edges
 
 
@@ -21,9 +20,8 @@ schema = GQLSchema(
     )
 )
 
-class GQView(GraphQLView):
+class GQView(BaseView):
     def get_context(self, request):
-        context = self.context or {}
-        if isinstance(context, dict) and 'request' not in context:
-            context.update({'request': request})
+        context = super().get_context(request)
+        context['cache'] = DocumentCache(context.pop('documents', None))
         return context
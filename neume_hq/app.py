@@ -5,33 +5,120 @@ created: 29.01.2019
 """
 import asyncio
 import sys
-from pprint import pprint
+from hashlib import sha256
+
 import ujson as json
 import jinja2
 import jinja2_sanic
-from graphql.execution import ExecutionResult
-from promise import Promise
 from sanic.exceptions import NotFound
 
 sys.path.append(__package__)
 
 from aio_arango.client import ArangoAdmin
 from aio_arango.db import ArangoDB
-from graphql.execution.executors.asyncio import AsyncioExecutor
 from sanic import Sanic, response
-from sanic_graphql.graphqlview import GraphQLView
-
-from neume_hq.api.schema import schema
+from sanic.log import logger
+
+from neume_hq.api.schema import GQView, schema
+from neume_hq.gql.backend import CachedBackend, PersistedQueries
+from neume_hq.gql.cache import shared_cache
+from neume_hq.gql.cost import CostAnalyzer
+from neume_hq.gql.executor import NativeExecutor
+from neume_hq.gql.materialized import MaterializedLists
+from neume_hq.gql.provision import IndexListing, read_stamp, write_stamp
+from neume_hq.gql.subscriptions import change_feed, subscription_server
+from neume_hq.gql.tracing import stats
+from neume_hq.pool import ArangoPool
 from neume_hq.utilities import Config
 
 STATIC_DIR = '/var/www/neume-hq/public/static'
+DEFAULT_COORDINATOR = 'http://localhost:8529'
 grants = {'admin': 'rw', 'reader': 'ro'}
 
-def gql_middleware(next, root, info, **kwargs):
-    print('gql_middleware before: ', next)
-    return_value = next(root, info, **kwargs)
-    print('gql_middleware after: ', return_value)
-    return return_value
+
+def fingerprint(app) -> str:
+    """
+    Hash of the provisioning input (users, databases, grants, schema).
+    """
+    return sha256(json.dumps({
+        'users': app.config.DB_USERS,
+        'databases': app.config.DATABASES,
+        'grants': grants,
+        'schema': schema.fingerprint()
+    }, sort_keys=True).encode()).hexdigest()
+
+
+def connect(app) -> ArangoPool:
+    return ArangoPool(
+        lambda address: ArangoDB('user', 'user-pw', 'public', address=address),
+        app.config.get('DB_COORDINATORS', None) or [DEFAULT_COORDINATOR],
+        size=app.config.get('DB_POOL_SIZE', None),
+        strategy=app.config.get('DB_BALANCE', None),
+        health_interval=app.config.get('DB_HEALTH_INTERVAL', None)
+    )
+
+
+def index_listing(app) -> IndexListing:
+    coordinators = app.config.get('DB_COORDINATORS', None) or [DEFAULT_COORDINATOR]
+    return IndexListing(coordinators[0], 'public', 'user', 'user-pw')
+
+
+def materialized_lists(app):
+    """
+    The store of materialized lists, None when several workers would
+    each keep one without a shared feed telling them about the writes
+    of the others.
+    """
+    if (app.config.get('WORKERS', 1) > 1
+            and app.config.get('CACHE_REDIS_URL', None) is None):
+        logger.warning('materialized lists disabled, several workers '
+                       'need CACHE_REDIS_URL to share changes')
+        return None
+    return MaterializedLists(
+        max_size=app.config.get('GQL_MATERIALIZED_SIZE', None),
+        ttl=app.config.get('GQL_MATERIALIZED_TTL', None),
+        max_items=app.config.get('GQL_MATERIALIZED_ITEMS', None))
+
+
+async def stamped(db, current: str) -> bool:
+    """
+    Logs db in and tells if it was provisioned for the current
+    fingerprint. False if the login fails, users and databases might
+    not exist yet, db has to be logged in after provisioning then.
+    """
+    try:
+        await db.login()
+    except Exception:
+        return False
+    return await read_stamp(db) == current
+
+
+async def provision(app):
+    async with ArangoAdmin('root', 'arango-pw') as admin:
+        dbs, users = await asyncio.gather(
+            admin.get_dbs(),
+            admin.get_users()
+        )
+        await asyncio.gather(
+                *(admin.create_user(name, pw)
+                  for name, pw in app.config.DB_USERS.items()
+                  if name not in [usr['user'] for usr in users])
+            )
+        for db_name, cfg in app.config.DATABASES.items():
+            if db_name not in dbs:
+                await admin.create_db(db_name)
+            await asyncio.gather(
+                *(admin.set_access_level(name,
+                                         db_name,
+                                         level=grants[role])
+                  for role, name in cfg['users'].items()),
+                *(admin.set_access_level(name,
+                                         db_name,
+                                         level='none')
+                  for name in app.config.DB_USERS.keys()
+                  if name not in cfg['users'].values())
+            )
+
 
 def get_app():
     app = Sanic('NEUME-HQ')
@@ -51,16 +138,10 @@ def get_app():
     app.render = jinja2_sanic.render_template
 
 
-    @app.middleware('request')
-    def request_mw(request):
-        print('before')
-        request.app.gq_db.count = 0
-        print(request.app.gq_db.count)
-
-    @app.middleware('response')
-    def response_mw(request, response):
-        print('after')
-        print(request.app.gq_db.count)
+    if app.config.get('GQL_TRACING', False):
+        @app.get('/_stats')
+        async def tracing_stats(request):
+            return response.json(stats.snapshot())
 
     @app.get('/')
     async def index(request):
@@ -75,43 +156,77 @@ def get_app():
 
     @app.listener('before_server_start')
     async def setup(app, loop):
-        app._executor = AsyncioExecutor(loop=loop)
-        async with ArangoAdmin('root', 'arango-pw') as admin:
-            dbs, users = await asyncio.gather(
-                admin.get_dbs(),
-                admin.get_users()
-            )
-            await asyncio.gather(
-                    *(admin.create_user(name, pw)
-                      for name, pw in app.config.DB_USERS.items()
-                      if name not in [usr['user'] for usr in users])
-                )
-            for db_name, cfg in app.config.DATABASES.items():
-                if db_name not in dbs:
-                    await admin.create_db(db_name)
-                await asyncio.gather(
-                    *(admin.set_access_level(name,
-                                             db_name,
-                                             level=grants[role])
-                      for role, name in cfg['users'].items()),
-                    *(admin.set_access_level(name,
-                                             db_name,
-                                             level='none')
-                      for name in app.config.DB_USERS.keys()
-                      if name not in cfg['users'].values())
-                )
-
-        app.gq_db = ArangoDB('user', 'user-pw', 'public')
-        await app.gq_db.login()
+        app._executor = NativeExecutor(loop=loop)
+        app.gq_db = connect(app)
+        current = fingerprint(app)
+        provisioned = await stamped(app.gq_db, current)
+        if not provisioned:
+            await provision(app)
+            await app.gq_db.login()
+        app.gq_cache = shared_cache(
+            app.config.get('CACHE_REDIS_URL', None),
+            max_size=app.config.get('CACHE_SIZE', None),
+            ttl=app.config.get('CACHE_TTL', None),
+            namespace='documents'
+        )
+        persisted = shared_cache(
+            app.config.get('CACHE_REDIS_URL', None),
+            max_size=app.config.get('GQL_PERSISTED_QUERIES_SIZE', 10000),
+            ttl=float('inf'),
+            namespace='persisted'
+        )
+        for cache in (app.gq_cache, persisted):
+            if hasattr(cache, 'close'):
+                app.on_close.append(cache.close)
+        app.gq_feed = change_feed(
+            app.config.get('CACHE_REDIS_URL', None),
+            max_queue=app.config.get('SUBSCRIPTION_QUEUE_SIZE', None)
+        )
+        app.on_close.append(app.gq_feed.close)
+        app.gq_materialized = materialized_lists(app)
+        if app.gq_materialized is not None:
+            app.gq_feed.add_listener(app.gq_materialized.apply)
+        listing = index_listing(app)
+        try:
+            gql_schema = await schema.setup(
+                app.gq_db, schema.fingerprint() if provisioned else None,
+                concurrency=app.config.get('PROVISION_CONCURRENCY', None),
+                listing=listing)
+        finally:
+            await listing.close()
+        context = {'db': app.gq_db,
+                   'feed': app.gq_feed,
+                   'compile': app.config.get('GQL_COMPILE', False),
+                   'batch_size': app.config.get('DB_BATCH_SIZE', None),
+                   'bulk_scalars': app.config.get('GQL_BULK_SCALARS', False),
+                   'materialized': app.gq_materialized}
         app.add_route(
-            GraphQLView.as_view(
-                schema=await schema.setup(app.gq_db),
-                context={'db': app.gq_db, 'cache': {}},
+            GQView.as_view(
+                schema=gql_schema,
+                context={**context, 'documents': app.gq_cache},
                 batch=True,
                 executor=app._executor,
+                backend=CachedBackend(
+                    max_size=app.config.get('GQL_DOCUMENT_CACHE_SIZE', None),
+                    analyzer=CostAnalyzer(
+                        max_cost=app.config.get('GQL_MAX_COST', None),
+                        max_depth=app.config.get('GQL_MAX_DEPTH', None))),
+                persisted_queries=PersistedQueries(store=persisted),
+                tracing=app.config.get('GQL_TRACING', False),
+                compress_min_size=app.config.get('GQL_COMPRESS_MIN_SIZE', 1024),
+                stream_chunk_size=app.config.get('GQL_STREAM_CHUNK_SIZE', None),
                 graphiql=True
             ), 'graphql'
         )
+        subscriptions = subscription_server(gql_schema, context, loop=loop)
+        if subscriptions is not None:
+            async def subscribe(request, ws):
+                await subscriptions.handle(ws)
+
+            app.add_websocket_route(subscribe, '/subscriptions',
+                                    subprotocols=['graphql-ws'])
+        if not provisioned:
+            await write_stamp(app.gq_db, current)
 
 
     @app.listener('after_server_stop')
@@ -3,92 +3,149 @@ aql
 author: Tim "tjtimer" Jedro
 created: 30.01.19
 """
+import re
+from copy import copy
+from functools import lru_cache
+
 from .models import node_registry
 
+STATEMENT_CACHE_SIZE = 2048
+# windowed traversals need a stable order for offset cursors
+WINDOW_SORT = 'SORT e._key, v._key'
+
+_tokens = re.compile(
+    r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')'
+    r'|(?<![\w@])@([A-Za-z_][A-Za-z0-9_]*)'
+    r'|(?<![\w.@])([A-Za-z_][A-Za-z0-9_]*)'
+)
+
+
+def rename(text: str, names: dict, bind_names: dict = None) -> str:
+    """
+    Renames AQL variables (and bind parameters) in text, string literals
+    and attribute access (doc.v) are left untouched.
+    """
+    bind_names = bind_names or {}
+
+    def _sub(match):
+        literal, bind, name = match.groups()
+        if literal is not None:
+            return literal
+        if bind is not None:
+            return f'@{bind_names.get(bind, bind)}'
+        return names.get(name, name)
+    return _tokens.sub(_sub, text)
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def compose(*parts: str) -> str:
+    """
+    Joins statement parts, values are always bound (@valueN) so the text
+    only depends on the shape of a query and is cached process wide.
+    """
+    return ' '.join(part for part in parts if part)
+
 
 class AGQuery:
+    """
+    Immutable query builder, every builder method returns a new query,
+    so a query can be shared between concurrent requests.
+    """
 
     def __init__(self):
-        self._expressions = []
-        self._docs = []
+        self._expressions = ()
+        self._docs = ()
+        self._bind_vars = {}
+        self._statements = {}
 
     @property
     def entities(self):
-        return {**self._docs}
+        return {**dict(self._docs)}
 
     @property
     def statement(self):
-        return ' '.join(self._expressions)
+        return self._compiled('statement', lambda: compose(*self._expressions))
+
+    @property
+    def bind_vars(self):
+        return {**self._bind_vars}
+
+    def _compiled(self, key, build):
+        statement = self._statements.get(key, None)
+        if statement is None:
+            statement = self._statements[key] = build()
+        return statement
+
+    def _add(self, expression: str, *values, first: bool = False):
+        query = copy(self)
+        query._bind_vars = {**self._bind_vars}
+        query._statements = {}
+        if len(values) > 0:
+            names = []
+            for value in values:
+                name = f'value{len(query._bind_vars)}'
+                query._bind_vars[name] = value
+                names.append(f'@{name}')
+            expression = expression.format(*names)
+        if first is True:
+            query._expressions = (expression, *self._expressions)
+        else:
+            query._expressions = (*self._expressions, expression)
+        return query
 
     def with_(self, collections):
-        self._expressions.insert(0, f'WITH {" ,".join(list(collections))}')
-        return self
+        return self._add(f'WITH {" ,".join(list(collections))}', first=True)
 
     def fi(self, identifier, collection):
-        self._expressions.append(f'FOR {identifier} IN {collection}')
-        self._docs.append((identifier, collection))
-        return self
+        query = self._add(f'FOR {identifier} IN {collection}')
+        query._docs = (*self._docs, (identifier, collection))
+        return query
 
     def f(self, field):
-        self._expressions.append(f'FILTER {field}')
-        return self
+        return self._add(f'FILTER {field}')
 
     def and_(self, field):
-        self._expressions.append(f'AND {field}')
-        return self
+        return self._add(f'AND {field}')
 
     def or_(self, field):
-        self._expressions.append(f'OR {field}')
-        return self
+        return self._add(f'OR {field}')
 
     def not_(self, field):
-        self._expressions.append(f'NOT {field}')
-        return self
+        return self._add(f'NOT {field}')
 
     def in_(self, list):
-        self._expressions.append(f'IN {list}')
-        return self
+        return self._add('IN {}', list)
 
     def lt(self, value):
-        self._expressions.append(f'< {value}')
-        return self
+        return self._add('< {}', value)
 
     def lte(self, value):
-        self._expressions.append(f'<= {value}')
-        return self
+        return self._add('<= {}', value)
 
     def eq(self, value):
-        self._expressions.append(f'== {value}')
-        return self
+        return self._add('== {}', value)
 
     def neq(self, value):
-        self._expressions.append(f'!= {value}')
-        return self
+        return self._add('!= {}', value)
 
     def like(self, value):
-        self._expressions.append(f'LIKE "{value}"')
-        return self
+        return self._add('LIKE {}', value)
 
     def limit(self, size: int, offset: int = None):
         if offset is None:
             offset = 0
-        self._expressions.append(f'LIMIT {abs(int(offset))}, {abs(int(size))}')
-        return self
+        return self._add('LIMIT {}, {}', abs(int(offset)), abs(int(size)))
 
     def asc(self, fields):
-        self._expressions.append(f'SORT {fields} ASC')
-        return self
+        return self._add(f'SORT {fields} ASC')
 
     def desc(self, fields):
-        self._expressions.append(f'SORT {fields} DESC')
-        return self
+        return self._add(f'SORT {fields} DESC')
 
     def ret(self, ret_str, distinct=None):
         if distinct is None:
-            self._expressions.append(f'RETURN {ret_str}')
-        else:
-            self._expressions.append(f'RETURN DISTINCT {ret_str}')
-        return self
+            return self._add(f'RETURN {ret_str}')
+        return self._add(f'RETURN DISTINCT {ret_str}')
 
 
 class GraphQuery(AGQuery):
@@ -103,25 +160,89 @@ class GraphQuery(AGQuery):
 
         if depth is None:
             depth = 1
-        elif isinstance(depth, (list, tuple)):
+        if isinstance(depth, (list, tuple)):
             start, stop = sorted([abs(int(v)) for v in depth])[:2]
+            self._depth_range = (start, stop)
             depth = f'{start}..{stop}'
         else:
             depth = abs(int(depth))
+            self._depth_range = (depth, depth)
         self._depth = depth
         direction = direction or 'ANY'
         self._direction = direction.upper()
         self._ret = ret or '{"node": v, "pId": startVertexId}'
-        self.start_vertex = None
 
     @property
-    def statement(self):
-        return (f'LET startVertexId = \"{self.start_vertex.split("/")[-1]}\" '
-                f'FOR v, e, p IN '
-                f'{self._depth} {self._direction} '
-                f' \"{self.start_vertex}\" '
-                f'GRAPH \"{self._graph_name}\" '
-                f'{" ".join(self._expressions)} RETURN {self._ret}')
+    def weight(self) -> int:
+        """
+        Relative cost of one traversal, every level of the depth range
+        is visited and ANY follows edges in both directions.
+        """
+        start, stop = self._depth_range
+        levels = sum(max(1, level) for level in range(start, stop + 1))
+        return levels * (2 if self._direction == 'ANY' else 1)
+
+    @property
+    def _traversal(self):
+        return (f'{self._depth} {self._direction}',
+                f'GRAPH "{self._graph_name}"')
+
+    def batch_statement(self, projected: bool = False, windowed: bool = False):
+        steps, graph = self._traversal
+        ret = self._ret
+        if projected is True:
+            ret = f'MERGE({ret}, {{"node": KEEP(v, @keep)}})'
+        if windowed is True:
+            return self._compiled(('batch', projected, windowed), lambda: compose(
+                'FOR start IN @ids',
+                'LET startVertexId = PARSE_IDENTIFIER(start).key',
+                f'FOR item IN (FOR v, e, p IN {steps} start {graph}',
+                *self._expressions,
+                f'{WINDOW_SORT} LIMIT @offset, @limit',
+                f'RETURN {ret})',
+                'RETURN {"start": start, "item": item}'
+            ))
+        return self._compiled(('batch', projected, windowed), lambda: compose(
+            'FOR start IN @ids',
+            'LET startVertexId = PARSE_IDENTIFIER(start).key',
+            f'FOR v, e, p IN {steps} start {graph}',
+            *self._expressions,
+            f'RETURN {{"start": start, "item": {ret}}}'
+        ))
+
+    def count_statement(self):
+        steps, graph = self._traversal
+        return self._compiled('count', lambda: compose(
+            'FOR start IN @ids',
+            f'RETURN {{"start": start, "item": FIRST(FOR v, e, p IN {steps} start {graph}',
+            *self._expressions,
+            'COLLECT WITH COUNT INTO n RETURN n)}'
+        ))
+
+    def subquery(self, start: str, suffix: str, node: str,
+                 single: bool = False, window: tuple = None) -> tuple:
+        steps, graph = self._traversal
+        names = {name: f'{name}{suffix}'
+                 for name in ('v', 'e', 'p', 'startVertexId')}
+        bind_names = {name: f'{name}_{suffix}' for name in self._bind_vars}
+        ret = rename(self._ret, names, bind_names)
+        expressions = rename(' '.join(self._expressions), names, bind_names)
+        bind_vars = {bind_names[k]: v for k, v in self._bind_vars.items()}
+        limit = ''
+        if single is True:
+            limit = 'LIMIT 1'
+        elif window is not None:
+            limit = (f'{rename(WINDOW_SORT, names)} '
+                     f'LIMIT @offset_{suffix}, @limit_{suffix}')
+            bind_vars[f'offset_{suffix}'], bind_vars[f'limit_{suffix}'] = window
+        statement = compose(
+            f'(LET startVertexId{suffix} = PARSE_IDENTIFIER({start}).key',
+            f'FOR v{suffix}, e{suffix}, p{suffix} IN {steps} {start} {graph}',
+            expressions,
+            limit,
+            f'RETURN MERGE({ret}, {{"node": {node}}}))'
+        )
+        return statement, bind_vars
 
 
 class EdgeConfig:
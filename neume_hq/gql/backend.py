@@ -0,0 +1,107 @@
+"""
+backend
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from functools import partial
+from hashlib import sha256
+
+from graphql import parse, validate
+from graphql.backend.base import GraphQLBackend, GraphQLDocument
+from graphql.execution import ExecutionResult, execute
+from graphql_server import HttpQueryError
+
+from neume_hq.gql.cache import TTLCache, resolved
+from neume_hq.gql.cost import CostAnalyzer
+
+PERSISTED_QUERY_NOT_FOUND = 'PersistedQueryNotFound'
+
+
+def query_hash(query: str) -> str:
+    return sha256(query.encode()).hexdigest()
+
+
+def _invalid(errors, *_, **__):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+def _analyzed(analyzer, schema, document_ast, *args, **kwargs):
+    # variables are only known now, page sizes may be passed as $first
+    error = analyzer.check(
+        schema, document_ast,
+        kwargs.get('variables', kwargs.get('variable_values', None)),
+        kwargs.get('operation_name', None)
+    )
+    if error is not None:
+        return ExecutionResult(errors=[error], invalid=True)
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+class CachedBackend(GraphQLBackend):
+    """
+    Parses and validates every distinct query text only once, documents
+    are kept in a bounded LRU keyed by the sha256 of the query. With a
+    CostAnalyzer, documents over its budget are rejected before they
+    are executed.
+    """
+
+    def __init__(self, max_size: int = None, analyzer: CostAnalyzer = None):
+        self._documents = TTLCache(
+            max_size=1024 if max_size is None else max_size,
+            ttl=float('inf')
+        )
+        self._analyzer = analyzer
+
+    def prepare(self, schema, document_string: str, document_ast) -> GraphQLDocument:
+        errors = validate(schema, document_ast)
+        if errors:
+            execute_fn = partial(_invalid, errors)
+        elif self._analyzer is not None:
+            execute_fn = partial(_analyzed, self._analyzer, schema, document_ast)
+        else:
+            execute_fn = partial(execute, schema, document_ast)
+        return GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=execute_fn
+        )
+
+    def document_from_string(self, schema, document_string: str) -> GraphQLDocument:
+        key = (id(schema), query_hash(document_string))
+        document = self._documents.get(key, None)
+        if document is None:
+            document = self.prepare(schema, document_string, parse(document_string))
+            self._documents.set(key, document)
+        return document
+
+
+class PersistedQueries:
+    """
+    Automatic persisted queries, clients send
+    {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": ...}}}
+    and only fall back to sending the query text if the hash is unknown.
+    """
+
+    def __init__(self, max_size: int = None, store=None):
+        self._store = store if store is not None else TTLCache(
+            max_size=10000 if max_size is None else max_size,
+            ttl=float('inf')
+        )
+
+    async def resolve(self, data: dict, extensions: dict = None) -> dict:
+        extensions = data.get('extensions', None) or extensions or {}
+        persisted = extensions.get('persistedQuery', None)
+        if not isinstance(persisted, dict):
+            return data
+        digest = persisted.get('sha256Hash', None)
+        query = data.get('query', None)
+        if query:
+            if query_hash(query) != digest:
+                raise HttpQueryError(400, 'provided sha does not match query')
+            await resolved(self._store.set(digest, query))
+            return data
+        query = await resolved(self._store.get(digest, None))
+        if query is None:
+            raise HttpQueryError(200, PERSISTED_QUERY_NOT_FOUND)
+        return {**data, 'query': query}
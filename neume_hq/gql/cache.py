@@ -0,0 +1,201 @@
+"""
+cache
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import time
+from collections import OrderedDict
+from inspect import isawaitable
+from typing import Optional
+
+import ujson
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return ujson.dumps(value, ensure_ascii=False).encode()
+
+
+def decode(value: bytes):
+    if orjson is not None:
+        return orjson.loads(value)
+    return ujson.loads(value)
+
+
+async def resolved(value):
+    """
+    value, awaited if it is awaitable: TTLCache answers right away,
+    RedisCache with a coroutine.
+    """
+    if isawaitable(value):
+        return await value
+    return value
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries expire after ttl seconds,
+    shared by all requests of a process.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = 10000 if max_size is None else max_size
+        self.ttl = 60.0 if ttl is None else ttl
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, None)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+
+class RedisCache:
+    """
+    TTLCache interface on a (local) redis, shared by all worker
+    processes of a host, every method is a coroutine on the asyncio
+    client. Size is bounded by redis' maxmemory policy, values are
+    stored as JSON, never unpickled. Needs the optional redis package
+    (>= 4.2).
+    """
+
+    def __init__(self, url: str, ttl: float = None, namespace: str = 'neume',
+                 client=None):
+        if client is None:
+            try:
+                from redis import asyncio as aioredis
+            except ImportError:
+                raise ImportError('RedisCache needs the redis package (>= 4.2), '
+                                  'pip install redis')
+            client = aioredis.Redis.from_url(url)
+        self._redis = client
+        self.ttl = 60.0 if ttl is None else ttl
+        self._prefix = f'{namespace}:'
+
+    def _key(self, key) -> str:
+        return f'{self._prefix}{key if isinstance(key, str) else repr(key)}'
+
+    async def size(self) -> int:
+        return len([key async for key in self._redis.scan_iter(match=f'{self._prefix}*')])
+
+    async def get(self, key, default=None):
+        value = await self._redis.get(self._key(key))
+        return default if value is None else decode(value)
+
+    async def set(self, key, value):
+        if self.ttl == float('inf'):
+            await self._redis.set(self._key(key), encode(value))
+        else:
+            await self._redis.set(self._key(key), encode(value),
+                                  px=max(1, int(self.ttl * 1000)))
+
+    async def pop(self, key, default=None):
+        pipe = self._redis.pipeline()
+        pipe.get(self._key(key))
+        pipe.delete(self._key(key))
+        value, _ = await pipe.execute()
+        return default if value is None else decode(value)
+
+    async def clear(self):
+        keys = [key async for key in self._redis.scan_iter(match=f'{self._prefix}*')]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def close(self):
+        await self._redis.close()
+
+
+def shared_cache(url: str = None, max_size: int = None, ttl: float = None,
+                 namespace: str = 'neume'):
+    """
+    A RedisCache when url is given, a process local TTLCache otherwise.
+    """
+    if url is None:
+        return TTLCache(max_size=max_size, ttl=ttl)
+    return RedisCache(url, ttl=ttl, namespace=namespace)
+
+
+class DocumentCache:
+    """
+    Request scoped identity map in front of an optional shared TTLCache
+    or RedisCache. Documents are keyed by _id, entries remember which
+    attributes were fetched (None meaning the whole document), so
+    projected documents only satisfy lookups for a subset of their
+    attributes.
+    """
+
+    def __init__(self, shared=None):
+        self._shared = shared
+        self._local = {}
+
+    async def _entry(self, _id: str):
+        entry = self._local.get(_id, None)
+        if entry is None and self._shared is not None:
+            shared = await resolved(self._shared.get(_id, None))
+            if shared is not None:
+                # shared entries are JSON: [fields or null, doc]
+                fields, doc = shared
+                entry = self._local[_id] = (
+                    None if fields is None else frozenset(fields), doc)
+        return entry
+
+    async def get(self, _id: str, keep: list = None) -> Optional[dict]:
+        entry = await self._entry(_id)
+        if entry is None:
+            return None
+        fields, doc = entry
+        if keep is None:
+            return None if fields is not None else doc
+        if fields is not None and not fields.issuperset(keep):
+            return None
+        return {k: doc[k] for k in keep if k in doc}
+
+    async def put(self, doc: dict, keep: list = None):
+        _id = doc.get('_id', None)
+        if _id is None:
+            return
+        fields = None if keep is None else frozenset(keep)
+        current = await self._entry(_id)
+        if (current is not None
+                and fields is not None
+                and current[1].get('_rev', None) == doc.get('_rev', None)):
+            if current[0] is None:
+                return
+            fields = fields | current[0]
+            doc = {**current[1], **doc}
+        self._local[_id] = (fields, doc)
+        if self._shared is not None:
+            await resolved(self._shared.set(
+                _id, [None if fields is None else sorted(fields), doc]))
+
+    async def invalidate(self, _id: str):
+        self._local.pop(_id, None)
+        if self._shared is not None:
+            await resolved(self._shared.pop(_id, None))
@@ -0,0 +1,104 @@
+"""
+compiler
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from graphene.utils.str_converters import to_camel_case
+
+from neume_hq.gql.selection import arguments, fields, projection, selection_sets
+
+PREFETCHED = '_prefetched_'
+
+
+class Row(dict):
+    """
+    A result document resolved in place of a model instance, fields
+    read from the mapping (row.name or row['name']) and no ObjectType
+    with its own __dict__ is created per row. Missing attributes are
+    None like unset fields of a model.
+    """
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self.get(name, None)
+
+
+def hydrate(data: dict) -> Row:
+    """
+    Row of a (compiled) result document, nested results of
+    GQField/GQList subqueries stay available as row._prefetched_.
+    """
+    return Row(data)
+
+
+def prefetched(inst, key: str):
+    """
+    Items a compiled query fetched for the field with response key
+    (alias or name) key.
+    """
+    return (getattr(inst, PREFETCHED, None) or {}).get(key, None)
+
+
+class QueryCompiler:
+    """
+    Translates a selection over a model and all GQField/GQList relations
+    selected below it into one AQL expression with nested subqueries.
+    """
+
+    def __init__(self, info):
+        self._info = info
+        self._count = 0
+        self.bind_vars = {}
+
+    def _suffix(self) -> str:
+        self._count += 1
+        return str(self._count)
+
+    def node(self, model, var: str, sets: list) -> str:
+        from neume_hq.gql.fields import GQField
+        from neume_hq.gql.pagination import list_window
+        suffix = self._suffix()
+        self.bind_vars[f'keep{suffix}'] = projection(
+            self._info, model, sets=sets)
+        expression = f'KEEP({var}, @keep{suffix})'
+
+        relations = {to_camel_case(attr): field
+                     for attr, field in model.__dict__.items()
+                     if isinstance(field, GQField)}
+        type_names = (model.__name__, 'Node')
+        # keyed by response key, aliases of one relation get their own
+        # window and projection
+        requested, args = {}, {}
+        for selection_set in sets:
+            for field in fields(self._info, selection_set, type_names):
+                relation = relations.get(field.name.value, None)
+                if field.selection_set is None or relation is None:
+                    continue
+                key = field.alias.value if field.alias else field.name.value
+                requested.setdefault(key, (relation, []))[1].append(field.selection_set)
+                args.setdefault(key, arguments(self._info, field))
+
+        subqueries = []
+        for key, (field, child_sets) in requested.items():
+            if field._store(self._info) is not None:
+                continue
+            window = None
+            if field._is_list is True:
+                child_sets = selection_sets(
+                    self._info, ('edges', 'node'), child_sets)
+                window = list_window(**{
+                    k: v for k, v in args[key].items()
+                    if k in ('first', 'after', 'last', 'before')})
+            child_suffix = self._suffix()
+            child = self.node(field.node_type, f'v{child_suffix}', child_sets)
+            statement, bind_vars = field._query.subquery(
+                f'{var}._id', child_suffix, child,
+                single=field._is_list is False, window=window)
+            self.bind_vars.update(**bind_vars)
+            subqueries.append(f'"{key}": {statement}')
+        if len(subqueries) > 0:
+            expression = (f'MERGE({expression}, '
+                          f'{{"{PREFETCHED}": {{{", ".join(subqueries)}}}}})')
+        return expression
@@ -0,0 +1,130 @@
+"""
+cost
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from types import SimpleNamespace
+from typing import Optional
+
+from graphene import Connection
+from graphene.utils.str_converters import to_camel_case
+from graphql import GraphQLError
+from graphql.language import ast
+from graphql.type.definition import get_named_type
+
+from neume_hq.gql.fields import GQField
+from neume_hq.gql.pagination import page_size
+from neume_hq.gql.selection import arguments
+
+DEFAULT_MAX_COST = 50000
+DEFAULT_MAX_DEPTH = 6
+
+_relations = {}
+
+
+def relations(model) -> dict:
+    """
+    GQField/GQList attributes of model by their GraphQL field name.
+    """
+    found = _relations.get(model, None)
+    if found is None:
+        found = _relations[model] = {
+            to_camel_case(attr): field
+            for attr, field in getattr(model, '__dict__', {}).items()
+            if isinstance(field, GQField)
+        }
+    return found
+
+
+def _is_connection(graphql_type) -> bool:
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return isinstance(graphene_type, type) and issubclass(graphene_type, Connection)
+
+
+class CostAnalyzer:
+    """
+    Static cost of a parsed document before it is executed. Every
+    GQField/GQList costs the weight of its traversal, connections multiply
+    the cost of their nodes by the requested page size (first/last), so
+    nested lists grow the way the traversals they cause do. Documents
+    over max_cost or nesting more than max_depth relations are rejected.
+    """
+
+    def __init__(self, max_cost: int = None, max_depth: int = None):
+        self.max_cost = DEFAULT_MAX_COST if max_cost is None else max_cost
+        self.max_depth = DEFAULT_MAX_DEPTH if max_depth is None else max_depth
+
+    def analyze(self, schema, document_ast, variables: dict = None,
+                operation_name: str = None) -> tuple:
+        """
+        (cost, depth) of the operation that would be executed.
+        """
+        operation, fragments = None, {}
+        for definition in document_ast.definitions:
+            if isinstance(definition, ast.FragmentDefinition):
+                fragments[definition.name.value] = definition
+            elif isinstance(definition, ast.OperationDefinition):
+                if operation_name is None or (definition.name is not None
+                                              and definition.name.value == operation_name):
+                    operation = operation or definition
+        if operation is None:
+            return 0, 0
+        root = {
+            'query': schema.get_query_type,
+            'mutation': schema.get_mutation_type,
+            'subscription': schema.get_subscription_type
+        }[operation.operation]()
+        request = SimpleNamespace(fragments=fragments,
+                                  variable_values=variables or {})
+        return self._cost(schema, request, root, operation.selection_set, 0)
+
+    def check(self, schema, document_ast, variables: dict = None,
+              operation_name: str = None) -> Optional[GraphQLError]:
+        cost, depth = self.analyze(schema, document_ast, variables, operation_name)
+        if depth > self.max_depth:
+            return GraphQLError(
+                f'Query nests {depth} relations, at most {self.max_depth} are allowed')
+        if cost > self.max_cost:
+            return GraphQLError(
+                f'Query costs {cost}, at most {self.max_cost} is allowed')
+        return None
+
+    def _fields(self, schema, request, parent_type, selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                yield parent_type, selection
+                continue
+            if isinstance(selection, ast.FragmentSpread):
+                selection = request.fragments[selection.name.value]
+            condition = selection.type_condition
+            fragment_type = (parent_type if condition is None
+                             else schema.get_type(condition.name.value))
+            yield from self._fields(schema, request, fragment_type,
+                                    selection.selection_set)
+
+    def _cost(self, schema, request, parent_type, selection_set, depth: int) -> tuple:
+        total, deepest = 0, depth
+        for owner, field in self._fields(schema, request, parent_type, selection_set):
+            name = field.name.value
+            if field.selection_set is None or name.startswith('__'):
+                continue
+            definition = getattr(owner, 'fields', {}).get(name, None)
+            if definition is None:
+                continue
+            field_type = get_named_type(definition.type)
+            relation = relations(getattr(owner, 'graphene_type', None)).get(name, None)
+            level = depth if relation is None else depth + 1
+            cost, child_depth = self._cost(schema, request, field_type,
+                                           field.selection_set, level)
+            deepest = max(deepest, child_depth)
+            if _is_connection(field_type):
+                args = arguments(request, field)
+                first = args.get('first', None)
+                items = page_size(args.get('last', None) if first is None else first)
+                cost = items * (1 + cost)
+            elif relation is not None:
+                cost += 1
+            if relation is not None:
+                cost += relation._query.weight
+            total += cost
+        return total, deepest
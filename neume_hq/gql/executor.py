@@ -0,0 +1,60 @@
+"""
+executor
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+import sys
+from inspect import isasyncgen, iscoroutine
+
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from graphql.execution.executors.asyncio_utils import asyncgen_to_observable
+from promise import Promise
+
+# asyncio can start a task eagerly, inside the task, since python 3.12
+EAGER = sys.version_info >= (3, 12)
+
+
+def run_eagerly(coro, loop=None):
+    """
+    Task running coro. Where asyncio supports eager tasks it runs up to
+    its first real wait right away and its result is returned if it
+    never waits. coro always runs as a task, timeouts and context
+    variables of the libraries it calls work as usual.
+    """
+    loop = asyncio.get_event_loop() if loop is None else loop
+    if not EAGER:
+        return loop.create_task(coro)
+    task = asyncio.Task(coro, loop=loop, eager_start=True)
+    if task.done() and not task.cancelled():
+        return task.result()
+    return task
+
+
+class NativeExecutor(AsyncioExecutor):
+    """
+    AsyncioExecutor without a Promise per resolver. Resolvers that have
+    their data on hand (prefetched relations, materialized lists) return
+    it and it is used as is, coroutine resolvers are started as (eager)
+    tasks, only tasks still running become a Promise. Tasks are only
+    kept when somebody waits for them, a shared executor would otherwise
+    hold every task it ever created.
+    """
+
+    def __init__(self, loop=None, track: bool = False):
+        super().__init__(loop=loop)
+        self.track = track
+
+    def execute(self, fn, *args, **kwargs):
+        result = fn(*args, **kwargs)
+        if iscoroutine(result):
+            result = run_eagerly(result, loop=self.loop)
+            if not isinstance(result, asyncio.Future):
+                return result
+        elif isasyncgen(result):
+            return asyncgen_to_observable(result, loop=self.loop)
+        if isinstance(result, asyncio.Future):
+            if self.track is True:
+                self.futures.append(result)
+            return Promise.resolve(result)
+        return result
@@ -3,22 +3,31 @@ app.py
 author: Tim "tjtimer" Jedro
 created: 29.01.2019
 """
-
-import arrow
-from graphene import Connection, Dynamic, Scalar, String, relay, Field
-from graphql.execution.tests.test_lists import ast
-
+from datetime import time
+
+from graphene import Dynamic, Scalar, String, relay, Field
+from graphql.language import ast
+
+from neume_hq.gql.compiler import Row, hydrate, prefetched
+from neume_hq.gql.loader import CountLoader, TraversalLoader
+from neume_hq.gql.pagination import (CountedConnection, list_slice, list_window,
+                                     to_offset_cursor)
+from neume_hq.gql.selection import projection
+from neume_hq.gql.temporal import (INVALID, Serialized, serialize_columns, serialize_date,
+                                   serialize_datetime, serialize_time, to_datetime)
 from neume_hq.utilities import ifl, pascal_case, snake_case
 
 
 class Date(Scalar):
+    bulk = True
 
     @staticmethod
     def serialize(value):
+        if type(value) is Serialized:
+            return value
         try:
-            dt = arrow.get(value)
-            return dt.format('YYYY-MM-DD')
-        except TypeError:
+            return serialize_date(value)
+        except INVALID:
             return None
 
     @classmethod
@@ -28,21 +37,21 @@ class Date(Scalar):
     @staticmethod
     def parse_value(value):
         try:
-            v = arrow.get(value).format('YYYY-MM-DD')
-            print('parse date: ', v)
-            return v
-        except TypeError:
+            return serialize_date(value)
+        except INVALID:
             return None
 
 
 class Time(Scalar):
+    bulk = True
 
     @staticmethod
     def serialize(value):
+        if type(value) is Serialized:
+            return value
         try:
-            dt = arrow.get(value).time()
-            return dt.for_json()
-        except TypeError:
+            return serialize_time(value)
+        except INVALID:
             return None
 
     @classmethod
@@ -53,19 +62,26 @@ class Time(Scalar):
     @staticmethod
     def parse_value(value):
         try:
-            return arrow.get(value).time()
-        except TypeError:
+            if isinstance(value, str):
+                try:
+                    return time.fromisoformat(value)
+                except ValueError:
+                    pass
+            return to_datetime(value).time()
+        except INVALID:
             return None
 
 
 class DateTime(Scalar):
+    bulk = True
 
     @staticmethod
     def serialize(value):
+        if type(value) is Serialized:
+            return value
         try:
-            dt = arrow.get(value)
-            return dt.for_json()
-        except TypeError:
+            return serialize_datetime(value)
+        except INVALID:
             return None
 
     @classmethod
@@ -76,10 +92,8 @@ class DateTime(Scalar):
     @staticmethod
     def parse_value(value):
         try:
-            v = arrow.get(value).timestamp
-            print('parse datetime: ', v)
-            return v
-        except TypeError:
+            return int(to_datetime(value).timestamp())
+        except INVALID:
             return None
 
 
@@ -113,9 +127,9 @@ class Password(Scalar):
     parse_value = coerce_string
 
     @staticmethod
-    def parse_literal(ast):
-        if isinstance(ast, ast.StringValue):
-            return ast.value
+    def parse_literal(node):
+        if isinstance(node, ast.StringValue):
+            return node.value
 
 
 connection_registry = {}
@@ -123,12 +137,13 @@ connection_registry = {}
 class GQField(Dynamic):
 
     _is_list = False
+    materialized = False
 
     def __init__(self, node_type: str, query, extra: dict=None):
 
         self._cls = None
-        query.f('v._id').like(f'{ifl.plural(snake_case(node_type))}/%')
-        self._query = query
+        self._query = query.f('v._id').like(
+            f'{ifl.plural(snake_case(node_type))}/%')
         self._extra = {
             'pId': String()}
         if isinstance(extra, dict):
@@ -169,31 +184,132 @@ class GQField(Dynamic):
         if  self._cls is None:
             self._cls = connection_registry[conn_name] = type(
                 conn_name,
-                (Connection,),
+                (CountedConnection,),
                 {'Meta': type('Meta', (), {'node': self.node_type}),
                  'Edge': type('Edge', (), self._extra)}
             )
         return self._cls
 
-    async def resolve(self, inst, info, id=None):
-        self._query.start_vertex = inst._id
-        data = {'_id': 'none'}
-        obj = await info.context['db'].fetch_one(self._query.statement)
-        data.update(**obj)
-        return self.node_type(**data)
+    def materialize(self):
+        start, stop = self._query._depth_range
+        if (start, stop) != (1, 1):
+            raise ValueError(f'{self.parent_name}.{self.field_name} traverses more '
+                             f'than one level, it can not be materialized')
+        self.materialized = True
+
+    @property
+    def key(self) -> str:
+        return f'{self.parent_name}.{self.field_name}'
+
+    def _store(self, info):
+        if self.materialized is False:
+            return None
+        return info.context.get('materialized', None)
+
+    def _stored(self, inst, info):
+        store = self._store(info)
+        if store is None:
+            return None
+        return store.get(self.key, inst._id)
+
+    async def _materialize(self, inst, info):
+        """
+        The whole list of a materialized field, kept for later reads.
+        None if the field is not materialized or the list is longer
+        than the store keeps, it is loaded window by window then.
+        """
+        store = self._store(info)
+        if store is None or store.too_long(self.key, inst._id):
+            return None
+        generation = store.generation
+        # whole documents, they serve every selection of later reads
+        items = await TraversalLoader.get(
+            info.context, self._query,
+            window=(0, store.max_items + 1)).load(inst._id)
+        store.put(self.key, inst._id, items, generation)
+        return items if len(items) <= store.max_items else None
+
+    async def _load(self, inst, info, path: tuple, window: tuple = None):
+        keep = projection(info, self.node_type, path)
+        return await TraversalLoader.get(
+            info.context, self._query, keep, window).load(inst._id)
+
+    def resolve(self, inst, info, id=None):
+        # data on hand is returned as is, no coroutine per resolved field
+        items = prefetched(inst, info.path[-1])
+        if items is None:
+            return self._resolve_loaded(inst, info)
+        return self._first(items)
+
+    async def _resolve_loaded(self, inst, info):
+        return self._first(await self._load(inst, info, ()))
+
+    @staticmethod
+    def _first(items: list):
+        if len(items) < 1:
+            return None
+        return hydrate(items[0]['node'])
 
 
 class GQList(GQField):
     _is_list = True
-    async def resolve(self,
-                      inst, info,
-                      **kwargs):
-        self._query.start_vertex, db = inst._id, info.context['db']
-        edges = [obj async for obj in db.query(self._query.statement)
-                if obj is not None]
-        return self._cls(edges=[
-            self._cls.Edge(
-                **{k: v for k, v in obj.items() if k!= 'node'},
-                node=self.node_type(**obj['node'])
-            ) for obj in edges
-        ])
+
+    def resolve(self, inst, info,
+                first=None, last=None, after=None, before=None,
+                **kwargs):
+        # data on hand is returned as is, no coroutine per resolved field
+        page = {'first': first, 'last': last, 'after': after, 'before': before}
+        items = prefetched(inst, info.path[-1])
+        if items is not None:
+            return self._connection(inst, info, items, list_window(**page), **page)
+        items = self._stored(inst, info)
+        if items is not None:
+            return self._connection(inst, info, items, None, **page)
+        return self._resolve_loaded(inst, info, **page)
+
+    async def _resolve_loaded(self, inst, info, **page):
+        items = await self._materialize(inst, info)
+        if items is not None:
+            return self._connection(inst, info, items, None, **page)
+        window = list_window(**page)
+        items = await self._load(inst, info, ('edges', 'node'), window)
+        return self._connection(inst, info, items, window, **page)
+
+    def _connection(self, inst, info, items: list, window: tuple,
+                    first=None, last=None, after=None, before=None):
+        if window is None:
+            start, end = list_slice(len(items), first=first, after=after,
+                                    last=last, before=before)
+            has_previous, has_next = start > 0, end < len(items)
+            items = items[start:end]
+        else:
+            start, limit = window
+            has_previous, has_next = start > 0, len(items) >= limit
+            items = items[:limit - 1]
+        if info.context.get('bulk_scalars', False) is True:
+            serialize_columns(self.node_type, [obj['node'] for obj in items])
+        # a list, edges can be selected more than once (aliases)
+        edges = [
+            Row(obj, node=hydrate(obj['node']), cursor=to_offset_cursor(start + i))
+            for i, obj in enumerate(items)
+        ]
+        connection = self._cls(
+            edges=edges,
+            page_info=relay.PageInfo(
+                has_next_page=has_next,
+                has_previous_page=has_previous,
+                start_cursor=to_offset_cursor(start) if items else None,
+                end_cursor=to_offset_cursor(start + len(items) - 1) if items else None
+            )
+        )
+        connection._count = lambda info: self._count(inst, info)
+        return connection
+
+    async def _count(self, inst, info) -> int:
+        items = self._stored(inst, info)
+        if items is None:
+            items = await self._materialize(inst, info)
+        if items is not None:
+            return len(items)
+        counts = await CountLoader.get(info.context, self._query).load(inst._id)
+        return counts[0] if counts else 0
@@ -3,19 +3,34 @@ app.py
 author: Tim "tjtimer" Jedro
 created: 29.01.2019
 """
-import asyncio
+from hashlib import sha256
 from typing import Optional
 
 import arrow
 import ujson as json
 from aio_arango.db import ArangoDB, DocumentType
-from graphene import (Field, InputObjectType, Mutation, ObjectType, Scalar, Schema, String, relay)
+from graphene import (ID, Boolean, Field, InputObjectType, Int, List, Mutation, ObjectType,
+                      Scalar, Schema, String, relay)
+from graphql_server import (HttpQueryError, default_format_error, format_execution_result,
+                            run_http_query)
+from promise import Promise
+from sanic.response import HTTPResponse
 from sanic_graphql import GraphQLView
 
 from neume_hq.gql.models import Node, connection_registry, node_registry, GQNode
+from neume_hq.gql.provision import Plan, provision
+from neume_hq.gql.response import json_response
+from neume_hq.gql.subscriptions import CREATE, UPDATE, change_field, change_field_name, publish
+from neume_hq.gql.tracing import TracedDB, Tracer, TracingMiddleware, stats
 from neume_hq.utilities import snake_case
 
 
+async def write_through(info, doc: dict):
+    cache = info.context.get('cache', None)
+    if cache is not None and doc is not None:
+        await cache.put(doc)
+
+
 def create(node, graph_name):
     if hasattr(node, 'create'):
         return node.create
@@ -26,6 +41,8 @@ def create(node, graph_name):
         data['_created'] = arrow.utcnow().timestamp
         new_data = await info.context['db'][graph_name].vertex_create(
             node._collname_, data)
+        await write_through(info, {**data, **new_data})
+        await publish(info, node, CREATE, {**data, **new_data})
         return node(**data, **new_data)
 
     async def _create_edge(_, info, **kwargs):
@@ -34,6 +51,8 @@ def create(node, graph_name):
         data['_created'] = arrow.utcnow().timestamp
         new_data = await info.context['db'][graph_name].edge_create(
             node._collname_, data)
+        await write_through(info, {**data, **new_data})
+        await publish(info, node, CREATE, {**data, **new_data})
         return node(**data, **new_data)
 
     if isinstance(node(), Node):
@@ -41,37 +60,151 @@ def create(node, graph_name):
     return _create_edge
 
 
+UPDATE_BY_KEY = ('FOR doc IN @@collection'
+                 ' FILTER doc._key == @key'
+                 ' LIMIT 1'
+                 ' UPDATE doc WITH @data IN @@collection'
+                 ' RETURN NEW')
+UPDATE_BY_RELATION = ('FOR doc IN @@collection'
+                      ' FILTER doc._from == @from AND doc._to == @to'
+                      ' LIMIT 1'
+                      ' UPDATE doc WITH @data IN @@collection'
+                      ' RETURN NEW')
+
+
 def update(node, graph_name):
     if hasattr(node, 'update'):
         return node.update
     async def _update(_, info, **kwargs):
-        q = f'FOR doc IN {node._collname_}'
         data = {**kwargs[snake_case(node.__name__)], '_updated': arrow.utcnow().timestamp}
-        _id = data.pop('_id', data.pop('id', None))
+        _id = data.pop('_id', data.pop('id', kwargs.get('id', None)))
+        bind_vars = {'@collection': node._collname_}
         if _id is None:
-            _from = data.pop('_from', None)
-            _to = data.pop('_to', None)
-            q = (f'{q}'
-                 f'  FILTER doc._from == \"{_from}\"'
-                 f'  AND doc._to == \"{_to}\"')
+            q = UPDATE_BY_RELATION
+            bind_vars['from'] = data.pop('_from', None)
+            bind_vars['to'] = data.pop('_to', None)
         else:
-            q = F'{q} FILTER doc._key == \"{_id}\"'
-        q = (f'{q}'
-             f'  LIMIT 1'
-             f'  UPDATE doc WITH {json.dumps(data)} IN {node._collname_}'
-             f'  RETURN NEW')
-        new_data = await info.context['db'].fetch_one(q)
-        return node(**list(new_data)[0])
+            q = UPDATE_BY_KEY
+            bind_vars['key'] = _id.split('/')[-1]
+        bind_vars['data'] = data
+        new_data = await info.context['db'].fetch_one(q, bind_vars=bind_vars)
+        await write_through(info, new_data)
+        await publish(info, node, UPDATE, new_data)
+        return node(**new_data)
 
     return _update
 
+INSERT_ITEM = 'INSERT item.doc INTO @@collection'
+UPDATE_ITEM = 'UPDATE item.key WITH item.doc IN @@collection'
+
+
+def write_statement(write: str, ignore_errors: bool) -> str:
+    return (f'FOR item IN @items {write}'
+            f' OPTIONS {{ignoreErrors: {"true" if ignore_errors else "false"}}}'
+            ' RETURN {"index": item.index, "new": NEW}')
+
+
+def _relation_errors(node, doc: dict) -> Optional[str]:
+    relations = node._config_.relations
+    for side in ('_from', '_to'):
+        allowed = [node_registry[name]._collname_
+                   for name in (*relations.get('_any', ()), *relations.get(side, ()))]
+        value = doc.get(side, None) or ''
+        if value.split('/')[0] not in allowed:
+            return f'{side} must point into one of {", ".join(allowed)}'
+    return None
+
+
+async def _written(info, node, event: str, row: dict) -> dict:
+    await write_through(info, row['new'])
+    await publish(info, node, event, row['new'])
+    return {'index': row['index'], 'ok': True, 'node': node(**row['new'])}
+
+
+async def _write_many(node, info, write: str, event: str,
+                      items: list, results: list):
+    """
+    Writes all items with one statement that skips failing documents,
+    the failed ones are written again one by one to report the error
+    the database gives for them.
+    """
+    db = info.context['db']
+    bind_vars = {'@collection': node._collname_}
+    if len(items) > 0:
+        written = db.query(write_statement(write, True),
+                           bind_vars={**bind_vars, 'items': items})
+        async for row in written:
+            results[row['index']] = await _written(info, node, event, row)
+    for item in items:
+        if results[item['index']] is not None:
+            continue
+        try:
+            row = await db.fetch_one(write_statement(write, False),
+                                     bind_vars={**bind_vars, 'items': [item]})
+        except Exception as error:
+            results[item['index']] = {'index': item['index'], 'ok': False,
+                                      'error': str(error)}
+        else:
+            results[item['index']] = await _written(info, node, event, row)
+    return results
+
+
+def create_many(node, graph_name):
+    is_edge = not isinstance(node(), Node)
+
+    async def _create_many(_, info, **kwargs):
+        now = arrow.utcnow().timestamp
+        items, results = [], []
+        for index, entry in enumerate(kwargs['input']):
+            doc = {k: v for k, v in entry.items()
+                   if k.lower() not in ['_id', 'id']}
+            doc['_created'] = now
+            error = _relation_errors(node, doc) if is_edge else None
+            if error is None:
+                items.append({'index': index, 'doc': doc})
+                results.append(None)
+            else:
+                results.append({'index': index, 'ok': False, 'error': error})
+        return await _write_many(node, info, INSERT_ITEM, CREATE, items, results)
+
+    return _create_many
+
+
+def update_many(node, graph_name):
+    async def _update_many(_, info, **kwargs):
+        now = arrow.utcnow().timestamp
+        items = []
+        for index, entry in enumerate(kwargs['input']):
+            doc = {**entry, '_updated': now}
+            _id = doc.pop('id')
+            items.append({'index': index, 'key': _id.split('/')[-1], 'doc': doc})
+        return await _write_many(node, info, UPDATE_ITEM, UPDATE,
+                                 items, [None] * len(items))
+
+    return _update_many
+
+
 mutators = {
     'create': create,
     'update': update
 }
 
+bulk_mutators = {
+    'create': create_many,
+    'update': update_many
+}
+
 registry = {}
 input_reg = {}
+result_reg = {}
+
+
+def _index_config(idx) -> dict:
+    cfg = {k: idx.__dict__[k] for k in ['type', 'fields', 'unique', 'sparse']}
+    cfg['fields'] = list(cfg['fields'])
+    return cfg
+
+
 class GQLSchema:
     def __init__(self,
                  graphs: Optional[tuple] = None,
@@ -98,40 +231,49 @@ class GQLSchema:
         if isinstance(subscriptions, (list, tuple)):
             self.register_subscriptions(*subscriptions)
 
-    async def setup(self, db: ArangoDB):
-        await asyncio.gather(*(
-            *(db.create_collection(name=node)
-              for node in self._nodes.keys()),
-            *(db.create_collection(name=name, doc_type=DocumentType.EDGE)
-              for name in self._edges.keys())
-        ))
-        await asyncio.gather(
-            *(asyncio.gather(
-                *(db.create_index(
-                    col._collname_,
-                    {k: idx.__dict__[k]
-                     for k in ['type', 'fields', 'unique', 'sparse']}
-                    )
-                    for idx in col._config_.indexes
-                )
-            ) for col in (*self._nodes.values(), *self._edges.values())),
-            *(db.create_graph(graph.name, graph.edge_definitions)
-              for graph in self._graphs.values())
-        )
+    def spec(self) -> dict:
+        """
+        Collections, indexes and graphs this schema needs in the database.
+        """
+        return {
+            'collections': {
+                **{name: False for name in self._nodes.keys()},
+                **{name: True for name in self._edges.keys()}
+            },
+            'indexes': {
+                col._collname_: [_index_config(idx) for idx in col._config_.indexes]
+                for col in (*self._nodes.values(), *self._edges.values())
+            },
+            'graphs': {name: graph.edge_definitions
+                       for name, graph in self._graphs.items()}
+        }
+
+    def fingerprint(self) -> str:
+        """
+        Hash of spec(), setup skips provisioning while it is unchanged.
+        """
+        return sha256(json.dumps(self.spec(), sort_keys=True).encode()).hexdigest()
+
+    async def provision(self, db: ArangoDB, dry_run: bool = False,
+                        concurrency: int = None, listing=None) -> Plan:
+        return await provision(db, self.spec(), DocumentType.EDGE,
+                               dry_run=dry_run, concurrency=concurrency,
+                               listing=listing)
 
+    async def setup(self, db: ArangoDB, fingerprint: str = None,
+                    concurrency: int = None, listing=None):
+        """
+        Provisions db unless fingerprint matches the current schema and
+        returns the graphene schema, which is only built once.
+        """
+        if fingerprint is None or fingerprint != self.fingerprint():
+            await self.provision(db, concurrency=concurrency, listing=listing)
         self._db = db
-        # queries = [
-        #     type(
-        #         f'{node.__name__}Query',
-        #         (ObjectType,),
-        #         {
-        #             snake_case(node.__name__): Field(
-        #                 node, id=ID(), resolver=node.find
-        #             ),
-        #             node._collname_: relay.ConnectionField(node)
-        #         }
-        #     ) for node in self._nodes.values()
-        # ]
+        return self.build()
+
+    def build(self) -> Schema:
+        if self._schema is not None:
+            return self._schema
         query_master = type(
             'Query',
             (ObjectType,),
@@ -147,14 +289,16 @@ class GQLSchema:
             {k: v.Field() for k, v in self._mutations.items()}
         )
         subscription_master = type(
-            'SubscriptionMaster',
-            (*self._subscriptions.values(), ObjectType),
-            {}
+            'Subscription',
+            (ObjectType,),
+            {k: v.Field() if hasattr(v, 'Field') else v
+             for k, v in self._subscriptions.items()}
         )
         # noinspection PyTypeChecker
         self._schema = Schema(
             query=query_master,
             mutation=mutation_master,
+            subscription=subscription_master,
             types=[*node_registry.values(), GQNode]
         )
         return self._schema
@@ -203,6 +347,39 @@ class GQLSchema:
                     'mutate': func(node, graph_name)
                 })
             self._mutations[snake_case(mutation_class.__name__)] = mutation_class
+        self.register_bulk_mutation(node, graph_name, input_reg[inp_name])
+        # everything written through the mutators can be subscribed to
+        self._subscriptions.setdefault(change_field_name(node), change_field(node))
+
+    def register_bulk_mutation(self, node, graph_name, inp_type):
+        res_name = f'{node.__name__}Result'
+        if result_reg.get(res_name, None) is None:
+            result_reg[res_name] = type(
+                res_name,
+                (ObjectType,),
+                {'index': Int(),
+                 'ok': Boolean(),
+                 'error': String(),
+                 'node': Field(node)}
+            )
+        # updates address their documents by id, the create input has none
+        upd_name = f'{node.__name__}UpdateInput'
+        if input_reg.get(upd_name, None) is None:
+            input_reg[upd_name] = type(upd_name, (inp_type,), {'id': ID(required=True)})
+        inputs = {'create': inp_type, 'update': input_reg[upd_name]}
+        for name, func in bulk_mutators.items():
+            # createManyPerson, a plural of the class name is no reliable API
+            mutation_class = type(
+                f'{name.title()}Many{node.__name__}',
+                (Mutation,),
+                {
+                    'Arguments': type(
+                        'Arguments', (), {'input': List(inputs[name], required=True)}
+                    ),
+                    'Output': List(result_reg[res_name]),
+                    'mutate': func(node, graph_name)
+                })
+            self._mutations[snake_case(mutation_class.__name__)] = mutation_class
 
     def register_subscription(self, subscription):
         self._subscriptions[snake_case(subscription.__name__)] = subscription
@@ -246,4 +423,108 @@ class GQLSchema:
 
 
 class GQView(GraphQLView):
-    pass
+    backend = None
+    persisted_queries = None
+    tracing = False
+    compress_min_size = None
+    stream_chunk_size = None
+
+    def get_backend(self, request):
+        return self.backend
+
+    def get_context(self, request):
+        # a fresh dict per request, request scoped state (loaders, ...)
+        # must never leak into concurrent requests
+        context = {**(self.context or {})}
+        context.setdefault('request', request)
+        if self.tracing is True:
+            context['tracer'] = Tracer()
+            context['db'] = TracedDB(context['db'], context['tracer'])
+        return context
+
+    def get_middleware(self, request):
+        middleware = list(self.middleware or [])
+        if self.tracing is True:
+            middleware.append(TracingMiddleware())
+        return middleware
+
+    async def resolve_persisted(self, request, data):
+        if self.persisted_queries is None:
+            return data
+        if isinstance(data, list):
+            return [await self.persisted_queries.resolve(entry) for entry in data]
+        extensions = request.args.get('extensions', None)
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpQueryError(400, 'extensions is not valid JSON')
+        return await self.persisted_queries.resolve(data, extensions)
+
+    def format_results(self, results: list, context: dict) -> tuple:
+        responses = [format_execution_result(result, self.format_error)
+                     for result in results]
+        bodies, status_codes = zip(*responses)
+        tracer = context.get('tracer', None)
+        if tracer is not None:
+            stats.add(tracer)
+            extensions = tracer.extensions()
+            bodies = [body if body is None else {**body, 'extensions': extensions}
+                      for body in bodies]
+        return bodies, max(status_codes)
+
+    async def dispatch_request(self, request, *args, **kwargs):
+        try:
+            request_method = request.method.lower()
+            if request_method == 'options':
+                return self.process_preflight(request)
+            data = await self.resolve_persisted(request, self.parse_body(request))
+            show_graphiql = (request_method == 'get'
+                             and self.should_display_graphiql(request))
+            pretty = self.pretty or show_graphiql or request.args.get('pretty')
+            context = self.get_context(request)
+            execution_results, all_params = run_http_query(
+                self.schema,
+                request_method,
+                data,
+                query_data=request.args,
+                batch_enabled=self.batch,
+                catch=show_graphiql,
+                backend=self.get_backend(request),
+                return_promise=self._enable_async,
+                root_value=self.get_root_value(request),
+                context_value=context,
+                middleware=self.get_middleware(request),
+                executor=self.get_executor(request)
+            )
+            results = await Promise.all(execution_results)
+            bodies, status_code = self.format_results(results, context)
+            if not pretty:
+                return json_response(
+                    request,
+                    bodies if isinstance(data, list) else bodies[0],
+                    status=status_code,
+                    compress_min_size=self.compress_min_size,
+                    chunk_size=self.stream_chunk_size
+                )
+            result = self.encode(
+                bodies if isinstance(data, list) else bodies[0],
+                pretty=pretty
+            )
+            if show_graphiql:
+                return await self.render_graphiql(
+                    params=all_params[0],
+                    result=result
+                )
+            return HTTPResponse(
+                result,
+                status=status_code,
+                content_type='application/json'
+            )
+        except HttpQueryError as e:
+            return HTTPResponse(
+                self.encode({'errors': [default_format_error(e)]}),
+                status=e.status_code,
+                headers=e.headers,
+                content_type='application/json'
+            )
@@ -0,0 +1,101 @@
+"""
+loader
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+
+
+class TraversalLoader:
+    """
+    Collects every start vertex requested for one GraphQuery during a
+    single tick of the event loop and resolves them with one AQL
+    traversal. Instances live in the request context, so results are
+    cached for the lifetime of a request only.
+    """
+
+    def __init__(self, db, query, keep: tuple = None, window: tuple = None,
+                 batch_size: int = None):
+        self._db = db
+        self._query = query
+        self._keep = keep
+        self._window = window
+        self._batch_size = batch_size
+        self._cache = {}
+        self._pending = {}
+        self._scheduled = False
+
+    @classmethod
+    def get(cls, context: dict, query, keep: list = None, window: tuple = None):
+        """
+        window (offset, limit) is applied to the items of every start
+        vertex separately.
+        """
+        if keep is not None:
+            keep = tuple(keep)
+        loaders = context.setdefault('loaders', {})
+        key = (cls, query, keep, window)
+        loader = loaders.get(key, None)
+        if loader is None:
+            loader = loaders[key] = cls(context['db'], query, keep, window,
+                                        context.get('batch_size', None))
+        return loader
+
+    def load(self, start_vertex: str) -> asyncio.Future:
+        future = self._cache.get(start_vertex, None)
+        if future is not None:
+            return future
+        loop = asyncio.get_event_loop()
+        future = self._cache[start_vertex] = loop.create_future()
+        self._pending[start_vertex] = future
+        if self._scheduled is False:
+            self._scheduled = True
+            loop.call_soon(self._dispatch)
+        return future
+
+    def _dispatch(self):
+        batch, self._pending, self._scheduled = self._pending, {}, False
+        asyncio.ensure_future(self._fetch(batch))
+
+    def _statement(self) -> tuple:
+        bind_vars = {**self._query.bind_vars}
+        if self._keep is not None:
+            bind_vars['keep'] = list(self._keep)
+        if self._window is not None:
+            bind_vars['offset'], bind_vars['limit'] = self._window
+        return (self._query.batch_statement(self._keep is not None,
+                                            self._window is not None),
+                bind_vars)
+
+    async def _fetch(self, batch: dict):
+        results = {start: [] for start in batch.keys()}
+        statement, bind_vars = self._statement()
+        bind_vars['ids'] = list(batch.keys())
+        options = {}
+        if self._batch_size is not None:
+            options['batch_size'] = self._batch_size
+        try:
+            async for row in self._db.query(
+                    statement, bind_vars=bind_vars, **options):
+                if row is None or row['item'] is None:
+                    continue
+                results[row['start']].append(row['item'])
+        except Exception as exc:
+            for start, future in batch.items():
+                self._cache.pop(start, None)
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for start, future in batch.items():
+            if not future.done():
+                future.set_result(results[start])
+
+
+class CountLoader(TraversalLoader):
+    """
+    Batches COLLECT WITH COUNT INTO traversals, every start vertex
+    resolves to [count].
+    """
+
+    def _statement(self) -> tuple:
+        return self._query.count_statement(), {**self._query.bind_vars}
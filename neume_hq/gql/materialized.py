@@ -0,0 +1,135 @@
+"""
+materialized
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class MaterializedLists:
+    """
+    Traversal results of GQList fields declared materialized in their
+    model's Config, kept per start vertex in a bounded LRU so a read is
+    a key lookup. The store listens to the ChangeFeed the mutators
+    publish to: a changed edge drops the lists of both of its vertices,
+    they are traversed again on the next read, a changed vertex is
+    patched into every list that contains it. Lists expire after ttl
+    seconds, changes written around the feed are seen after that. Only
+    lists of up to max_items are kept, longer ones are remembered as
+    too long and read window by window.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None,
+                 max_items: int = None):
+        self.max_size = 10000 if max_size is None else max_size
+        self.ttl = 60.0 if ttl is None else ttl
+        self.max_items = 100 if max_items is None else max_items
+        self.generation = 0
+        self._lists = OrderedDict()
+        self._starts = {}
+        self._members = {}
+        # _id -> generation of its last change, the oldest are forgotten
+        self._changed = OrderedDict()
+        self._forgotten = 0
+
+    def __len__(self):
+        return len(self._lists)
+
+    def _entry(self, key: tuple) -> Optional[tuple]:
+        entry = self._lists.get(key, None)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            return None
+        self._lists.move_to_end(key)
+        return entry
+
+    def get(self, field: str, start: str) -> Optional[list]:
+        entry = self._entry((field, start))
+        return None if entry is None else entry[1]
+
+    def too_long(self, field: str, start: str) -> bool:
+        entry = self._entry((field, start))
+        return entry is not None and entry[1] is None
+
+    def changed_since(self, generation: int, *ids: str) -> bool:
+        if generation < self._forgotten:
+            return True
+        return any(self._changed.get(_id, -1) > generation for _id in ids)
+
+    def put(self, field: str, start: str, items: list, generation: int = None):
+        """
+        Stores items unless start or one of them changed since
+        generation, the traversal that produced them might have missed
+        that change. Lists longer than max_items are only marked.
+        """
+        if generation is not None and self.changed_since(
+                generation, start, *(item['node']['_id'] for item in items)):
+            return
+        key = (field, start)
+        self._drop(key)
+        if len(items) > self.max_items:
+            items = None
+        self._lists[key] = (time.monotonic() + self.ttl, items)
+        self._starts.setdefault(start, set()).add(key)
+        for item in items or ():
+            self._members.setdefault(item['node']['_id'], set()).add(key)
+        while len(self._lists) > self.max_size:
+            self._drop(next(iter(self._lists)))
+
+    def _drop(self, key: tuple):
+        entry = self._lists.pop(key, None)
+        if entry is None:
+            return
+        _, items = entry
+        self._discard(self._starts, key[1], key)
+        for item in items or ():
+            self._discard(self._members, item['node']['_id'], key)
+
+    @staticmethod
+    def _discard(index: dict, _id: str, key: tuple):
+        keys = index.get(_id, None)
+        if keys is not None:
+            keys.discard(key)
+            if len(keys) == 0:
+                del index[_id]
+
+    def _touch(self, _id: str):
+        self._changed[_id] = self.generation
+        self._changed.move_to_end(_id)
+        while len(self._changed) > self.max_size:
+            _, self._forgotten = self._changed.popitem(last=False)
+
+    def invalidate(self, *starts: str):
+        self.generation += 1
+        for start in starts:
+            self._touch(start)
+            for key in tuple(self._starts.get(start, ())):
+                self._drop(key)
+
+    def patch(self, doc: dict):
+        self.generation += 1
+        self._touch(doc['_id'])
+        for key in tuple(self._members.get(doc['_id'], ())):
+            expires, items = self._lists[key]
+            self._lists[key] = (expires, [
+                {**item, 'node': {**item['node'], **doc}}
+                if item['node']['_id'] == doc['_id'] else item
+                for item in items
+            ])
+
+    def apply(self, change: dict):
+        """
+        ChangeFeed listener, mutators also apply their own changes
+        before they publish them. Applying a change twice does no harm.
+        """
+        doc = change['doc']
+        if doc is None or '_id' not in doc:
+            return
+        if '_from' in doc and '_to' in doc:
+            self.invalidate(doc['_from'], doc['_to'])
+        else:
+            self.patch(doc)
@@ -3,16 +3,19 @@ app.py
 author: Tim "tjtimer" Jedro
 created: 29.01.2019
 """
-from pprint import pprint
 
-from graphene import Connection, ObjectType, Scalar, String, relay, ID
+from graphene import ObjectType, Scalar, String, relay
 
+from neume_hq.gql.compiler import QueryCompiler, Row, hydrate
 from neume_hq.gql.fields import DateTime, GQField, GQList
+from neume_hq.gql.pagination import CountedConnection, fetch_page
+from neume_hq.gql.selection import projection, selection_sets
 from neume_hq.utilities import ifl, pascal_case, snake_case
 
 node_registry = {}
 edge_registry = {}
 connection_registry = {}
+collection_registry = {}
 
 __cache = {}
 
@@ -28,9 +31,11 @@ class ModelConfig:
     def __init__(self):
         self.indexes = ()
         self.relations = {}
+        self.materialized = ()
 
     def update(self, **cfg):
         self.indexes = (*self.indexes, *cfg.pop('indexes', ()))
+        self.materialized = (*self.materialized, *cfg.pop('materialized', ()))
         self.relations.update(
             **cfg.pop('relations', {}),
             **{'_from': cfg.pop('_from', ()),
@@ -50,6 +55,11 @@ class BaseModel(ObjectType):
         if hasattr(cls, 'Config'):
             cls._config_.update(**cls.Config.__dict__)
             delattr(cls, 'Config')
+        for name in cls._config_.materialized:
+            field = cls.__dict__.get(name, None)
+            if not isinstance(field, GQList):
+                raise ValueError(f'{cls.__name__}.{name} is no GQList, it can not be materialized')
+            field.materialize()
 
         cls._id = String()
         cls._key = String()
@@ -76,50 +86,69 @@ class BaseModel(ObjectType):
     def resolve_id(self, *_):
         return self._id
 
+    @classmethod
+    def compile(cls, info, path: tuple = ()):
+        if info.context.get('compile', False) is not True:
+            return None
+        compiler = QueryCompiler(info)
+        ret = compiler.node(cls, 'doc', selection_sets(info, path))
+        return ret, compiler.bind_vars
+
     @classmethod
     async def find(cls, _, info, **kwargs):
-        print('find: ', cls)
         _key = kwargs.pop('id', kwargs.pop('_id', '')).split('/')[-1]
-        resp = await info.context['db'][cls._collname_].get(_key)
-        return cls(**resp)
+        _id = f'{cls._collname_}/{_key}'
+        compiled = cls.compile(info)
+        if compiled is not None:
+            ret, bind_vars = compiled
+            resp = await info.context['db'].fetch_one(
+                f'FOR doc IN [DOCUMENT(@id)] FILTER doc != null RETURN {ret}',
+                bind_vars={**bind_vars, 'id': _id}
+            )
+            return None if resp is None else hydrate(resp)
+
+        keep = projection(info, cls)
+        cache = info.context.get('cache', None)
+        resp = None if cache is None else await cache.get(_id, keep)
+        if resp is None:
+            resp = await info.context['db'].fetch_one(
+                'RETURN KEEP(DOCUMENT(@id), @keep)',
+                bind_vars={'id': _id, 'keep': keep}
+            )
+            if resp is None:
+                return None
+            if cache is not None:
+                await cache.put(resp, keep)
+        return hydrate(resp)
 
     @classmethod
     async def all(cls, _, info, **kwargs):
-        print('model all ', cls)
-        #
-        # sets = [(0, f.name.value, f.selection_set) for f in info.field_asts]
-        # pprint(sets)
-        # cls_name = ''
-        # queries = {}
-        # while True:
-        #     if len(sets) <= 0:
-        #         break
-        #     depth, name, sel_set = sets.pop(0)
-        #     if sel_set is not None:
-        #         if name not in ['node', 'edges']:
-        #             cls_name = f'{depth}-{name}'
-        #             queries[cls_name] = set()
-        #             depth += 1
-        #         sets.extend([
-        #             (depth, f.name.value, f.selection_set)
-        #             for f in sel_set.selections])
-        #     else:
-        #         queries[cls_name].add(name)
-        # pprint(queries)
-        resp = await info.context['db'][cls._collname_].all()
-        return [cls(**obj) for obj in resp]
+        return await fetch_page(
+            info.context['db'], cls, connection_registry[cls._collname_],
+            keep=projection(info, cls, ('edges', 'node')),
+            compiled=cls.compile(info, ('edges', 'node')),
+            bulk=info.context.get('bulk_scalars', False) is True,
+            **{k: kwargs.get(k, None)
+               for k in ['first', 'last', 'after', 'before']}
+        )
 
 class GQNode(relay.Node):
     class Meta:
         name = 'Node'
 
+    @classmethod
+    def resolve_type(cls, instance, info):
+        # rows carry no type, their collection is the _id prefix
+        if isinstance(instance, Row):
+            return collection_registry[instance['_id'].split('/', 1)[0]]
+        return type(instance)
+
     @classmethod
     async def to_global_id(cls, type, id):
         return id
 
     @classmethod
     async def get_node_from_global_id(cls, info, global_id, only_type=None):
-        print('get from gid ', global_id)
         type, id = global_id.split('/')
         if only_type:
             # We assure that the node type that we want to retrieve
@@ -136,15 +165,15 @@ class Node(BaseModel):
         super().__init_subclass__(**kwargs)
         cls._collname_ = ifl.plural(snake_case(cls.__name__))
         node_registry[cls.__name__] = cls
+        collection_registry[cls._collname_] = cls
         connection_registry[cls._collname_] = type(
             f'{cls.__name__}Connection',
-            (Connection,),
+            (CountedConnection,),
             {'Meta': type('Meta', (), {'node': cls})}
         )
 
     @classmethod
     async def get_node(cls, info, id):
-        print('get node called', cls, id)
         return await cls.find(None, info, id=id)
 
 class Edge(BaseModel):
@@ -155,5 +184,6 @@ class Edge(BaseModel):
         super().__init_subclass__(**kwargs)
         cls._collname_ = snake_case(cls.__name__)
         edge_registry[cls.__name__] = cls
+        collection_registry[cls._collname_] = cls
 
 
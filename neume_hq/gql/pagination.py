@@ -0,0 +1,183 @@
+"""
+pagination
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as B64Error
+from functools import lru_cache
+from typing import Optional
+
+from graphene import Connection, Int, relay
+from graphql import GraphQLError
+
+from neume_hq.gql.compiler import Row, hydrate
+from neume_hq.gql.temporal import serialize_columns
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_CURSOR_PREFIX = 'key:'
+_OFFSET_PREFIX = 'offset:'
+
+
+COLLECTION_COUNT = 'RETURN LENGTH(@@collection)'
+
+
+class CountedConnection(Connection):
+    """
+    Connection with a totalCount, resolved lazily by the count function
+    (info -> awaitable int) the resolver attached as _count.
+    """
+
+    class Meta:
+        abstract = True
+
+    total_count = Int()
+
+    async def resolve_total_count(self, info):
+        count = getattr(self, '_count', None)
+        return None if count is None else await count(info)
+
+
+async def collection_count(db, model) -> int:
+    # LENGTH of a whole collection is answered from its count metadata
+    return await db.fetch_one(
+        COLLECTION_COUNT, bind_vars={'@collection': model._collname_})
+
+
+def to_cursor(key: str, prefix: str = _CURSOR_PREFIX) -> str:
+    return urlsafe_b64encode(f'{prefix}{key}'.encode()).decode()
+
+
+def from_cursor(cursor: Optional[str], prefix: str = _CURSOR_PREFIX) -> Optional[str]:
+    if cursor is None:
+        return None
+    try:
+        value = urlsafe_b64decode(cursor.encode()).decode()
+    except (B64Error, UnicodeError, ValueError):
+        value = ''
+    if not value.startswith(prefix):
+        raise GraphQLError(f'Invalid cursor: {cursor}')
+    return value[len(prefix):]
+
+
+def to_offset_cursor(offset: int) -> str:
+    return to_cursor(str(offset), _OFFSET_PREFIX)
+
+
+def from_offset_cursor(cursor: Optional[str]) -> Optional[int]:
+    value = from_cursor(cursor, _OFFSET_PREFIX)
+    if value is None:
+        return None
+    if not value.isdigit():
+        raise GraphQLError(f'Invalid cursor: {cursor}')
+    return int(value)
+
+
+def page_size(value: Optional[int]) -> int:
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    return min(abs(int(value)), MAX_PAGE_SIZE)
+
+
+def list_window(first: int = None, after: str = None,
+                last: int = None, before: str = None) -> Optional[tuple]:
+    """
+    (offset, limit) to push into a GQList traversal, limit fetches one
+    item more than requested to tell whether there is a next page.
+    Backward pagination is sliced after loading (None).
+    """
+    if last is not None or before is not None:
+        return None
+    after = from_offset_cursor(after)
+    return (0 if after is None else after + 1), page_size(first) + 1
+
+
+def list_slice(length: int, first: int = None, after: str = None,
+               last: int = None, before: str = None) -> tuple:
+    start, end = 0, length
+    after, before = from_offset_cursor(after), from_offset_cursor(before)
+    if after is not None:
+        start = min(after + 1, length)
+    if before is not None:
+        end = max(start, min(before, length))
+    if first is not None:
+        end = min(end, start + page_size(first))
+    if last is not None:
+        start = max(start, end - page_size(last))
+    return start, end
+
+
+@lru_cache(maxsize=1024)
+def page_statement(*, after: bool, before: bool, backward: bool,
+                   ret: str = 'doc') -> str:
+    filters = ''
+    if after:
+        filters += ' FILTER doc._key > @after'
+    if before:
+        filters += ' FILTER doc._key < @before'
+    # the cursor we start from tells us whether there is anything on the
+    # other side of the page, the database answers that in the same query
+    edge = 'false'
+    if backward and before:
+        condition = 'doc._key >= @before'
+    elif not backward and after:
+        condition = 'doc._key <= @after'
+    else:
+        condition = None
+    if condition is not None:
+        edge = (f'LENGTH(FOR doc IN @@collection FILTER {condition} '
+                f'LIMIT 1 RETURN 1) > 0')
+    return (f'LET page = (FOR doc IN @@collection{filters} '
+            f'SORT doc._key {"DESC" if backward else "ASC"} '
+            f'LIMIT @limit RETURN {ret}) '
+            f'RETURN {{"page": page, "edge": {edge}}}')
+
+
+async def fetch_page(db, model, connection_type, *,
+                     first: int = None, last: int = None,
+                     after: str = None, before: str = None,
+                     keep: list = None, compiled: tuple = None,
+                     bulk: bool = False):
+    after, before = from_cursor(after), from_cursor(before)
+    backward = last is not None and first is None
+    size = page_size(last if backward else first)
+    bind_vars = {'@collection': model._collname_, 'limit': size + 1}
+    if after is not None:
+        bind_vars['after'] = after
+    if before is not None:
+        bind_vars['before'] = before
+    ret = 'doc'
+    if compiled is not None:
+        ret, compiled_vars = compiled
+        bind_vars.update(**compiled_vars)
+    elif keep is not None:
+        ret = 'KEEP(doc, @keep)'
+        bind_vars['keep'] = keep
+    result = await db.fetch_one(
+        page_statement(after=after is not None,
+                       before=before is not None,
+                       backward=backward,
+                       ret=ret),
+        bind_vars=bind_vars
+    )
+    docs, edge = result['page'], result['edge']
+    has_more = len(docs) > size
+    docs = docs[:size]
+    if backward:
+        docs.reverse()
+    if bulk is True:
+        serialize_columns(model, docs)
+    edges = [Row(node=hydrate(doc), cursor=to_cursor(doc['_key'])) for doc in docs]
+    connection = connection_type(
+        edges=edges,
+        page_info=relay.PageInfo(
+            has_next_page=edge if backward else has_more,
+            has_previous_page=has_more if backward else edge,
+            start_cursor=edges[0]['cursor'] if edges else None,
+            end_cursor=edges[-1]['cursor'] if edges else None
+        )
+    )
+    connection._count = lambda info: collection_count(info.context['db'], model)
+    return connection
@@ -0,0 +1,257 @@
+"""
+provision
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+
+Diff based provisioning: reads the collections, indexes and graphs that
+exist in a database, compares them with a schema spec
+({'collections': {name: is_edge}, 'indexes': {collection: [config]},
+'graphs': {name: edge_definitions}}) and only applies what is missing.
+
+    python -m neume_hq.gql.provision --database public        # dry run
+    python -m neume_hq.gql.provision --database public --apply
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+
+COLLECTIONS = 'FOR c IN COLLECTIONS() RETURN c.name'
+GRAPHS = 'FOR g IN _graphs RETURN {"name": g._key, "edgeDefinitions": g.edgeDefinitions}'
+
+# the fingerprint a database was provisioned for is kept in the database,
+# a dropped or replaced database is provisioned again
+META = 'meta'
+STAMP_KEY = 'provisioned'
+READ_STAMP = 'FOR doc IN @@meta FILTER doc._key == @key RETURN doc.fingerprint'
+WRITE_STAMP = ('INSERT {_key: @key, fingerprint: @fingerprint} INTO @@meta'
+               ' OPTIONS {overwrite: true}')
+
+# arangodb >= 3.9 treats hash and skiplist as aliases of persistent
+_INDEX_TYPES = {'hash': 'persistent', 'skiplist': 'persistent'}
+# attributes arangodb fixes for these types, whatever was declared
+FIXED_ATTRIBUTES = {
+    'fulltext': {'unique': False, 'sparse': True},
+    'geo': {'unique': False, 'sparse': True},
+    'ttl': {'unique': False, 'sparse': True},
+}
+
+
+def _index_key(config: dict) -> tuple:
+    config = {**config, **FIXED_ATTRIBUTES.get(config['type'], {})}
+    return (_INDEX_TYPES.get(config['type'], config['type']),
+            tuple(config['fields']),
+            bool(config.get('unique', False)),
+            bool(config.get('sparse', False)))
+
+
+def _definitions(edge_definitions: list) -> dict:
+    return {d['collection']: (sorted(d.get('from', [])), sorted(d.get('to', [])))
+            for d in edge_definitions}
+
+
+async def bounded(limit: int, awaitables) -> list:
+    """
+    Like asyncio.gather, but with at most limit awaitables in flight.
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def _run(awaitable):
+        async with semaphore:
+            return await awaitable
+    return await asyncio.gather(*(_run(awaitable) for awaitable in awaitables))
+
+
+class Plan:
+    """
+    The DDL needed to bring a database in line with a spec.
+    Conflicts (graphs with different edge definitions) are reported
+    but never applied.
+    """
+
+    def __init__(self):
+        self.collections = []
+        self.indexes = []
+        self.graphs = []
+        self.conflicts = []
+
+    def __bool__(self):
+        return bool(self.collections or self.indexes or self.graphs)
+
+    def report(self) -> list:
+        return [
+            *(f'create {"edge " if edge else ""}collection {name}'
+              for name, edge in self.collections),
+            *(f'create {cfg["type"]} index on {name} {list(cfg["fields"])}'
+              f'{" unique" if cfg.get("unique", False) else ""}'
+              f'{" sparse" if cfg.get("sparse", False) else ""}'
+              for name, cfg in self.indexes),
+            *(f'create graph {name}' for name, _ in self.graphs),
+            *(f'conflict: {conflict}' for conflict in self.conflicts)
+        ]
+
+    async def apply(self, db, edge_type, concurrency: int = None):
+        limit = DEFAULT_CONCURRENCY if concurrency is None else concurrency
+        await bounded(limit, (
+            db.create_collection(name=name, doc_type=edge_type)
+            if edge else db.create_collection(name=name)
+            for name, edge in self.collections))
+        await bounded(limit, (
+            *(db.create_index(name, cfg) for name, cfg in self.indexes),
+            *(db.create_graph(name, definitions) for name, definitions in self.graphs)))
+
+
+class IndexListing:
+    """
+    Lists the indexes of a collection with GET /_api/index?collection=,
+    for clients that have no indexes() of their own. Logs in once and
+    keeps its session until closed.
+    """
+
+    def __init__(self, address: str, database: str, user: str, password: str):
+        self.address = address.rstrip('/')
+        self.database = database
+        self._credentials = {'username': user, 'password': password}
+        self._session = None
+        self._headers = None
+
+    async def _login(self):
+        import aiohttp
+        self._session = aiohttp.ClientSession()
+        async with self._session.post(f'{self.address}/_open/auth',
+                                      json=self._credentials) as resp:
+            resp.raise_for_status()
+            self._headers = {'Authorization': f'bearer {(await resp.json())["jwt"]}'}
+
+    async def __call__(self, collection: str) -> list:
+        if self._session is None:
+            await self._login()
+        async with self._session.get(
+                f'{self.address}/_db/{self.database}/_api/index',
+                params={'collection': collection},
+                headers=self._headers) as resp:
+            resp.raise_for_status()
+            return (await resp.json())['indexes']
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def existing_indexes(db, collection: str, listing=None):
+    """
+    Index keys of collection, None only if neither db nor listing can
+    list them, every index counts as missing then.
+    """
+    indexes = getattr(db, 'indexes', None) or listing
+    if indexes is None:
+        logger.warning(f'indexes of {collection} can not be listed, '
+                       f'all of them are created again')
+        return None
+    return {_index_key(cfg) for cfg in await indexes(collection)
+            if cfg.get('type', None) not in ('primary', 'edge')}
+
+
+async def diff(db, spec: dict, concurrency: int = None, listing=None) -> Plan:
+    """
+    listing(collection) lists indexes for clients without db.indexes(),
+    see IndexListing.
+    """
+    plan = Plan()
+    limit = DEFAULT_CONCURRENCY if concurrency is None else concurrency
+    collections = {name async for name in db.query(COLLECTIONS)}
+    graphs = {}
+    if '_graphs' in collections:
+        graphs = {g['name']: g['edgeDefinitions'] async for g in db.query(GRAPHS)}
+
+    for name, edge in sorted(spec['collections'].items()):
+        if name not in collections:
+            plan.collections.append((name, edge))
+
+    names = sorted(spec['indexes'])
+    known = await bounded(limit, (
+        existing_indexes(db, name, listing)
+        if name in collections and spec['indexes'][name] else asyncio.sleep(0, set())
+        for name in names))
+    for name, existing in zip(names, known):
+        for cfg in spec['indexes'][name]:
+            if existing is None or _index_key(cfg) not in existing:
+                plan.indexes.append((name, cfg))
+
+    for name, definitions in sorted(spec['graphs'].items()):
+        current = graphs.get(name, None)
+        if current is None:
+            plan.graphs.append((name, definitions))
+        elif _definitions(current) != _definitions(definitions):
+            plan.conflicts.append(f'graph {name} has different edge definitions')
+    return plan
+
+
+async def provision(db, spec: dict, edge_type, dry_run: bool = False,
+                    concurrency: int = None, listing=None) -> Plan:
+    plan = await diff(db, spec, concurrency, listing)
+    if plan and not dry_run:
+        await plan.apply(db, edge_type, concurrency)
+    return plan
+
+
+async def read_stamp(db) -> Optional[str]:
+    """
+    Fingerprint stored by the last write_stamp, None if db has none.
+    """
+    if META not in {name async for name in db.query(COLLECTIONS)}:
+        return None
+    return await db.fetch_one(READ_STAMP, bind_vars={'@meta': META, 'key': STAMP_KEY})
+
+
+async def write_stamp(db, fingerprint: str):
+    if META not in {name async for name in db.query(COLLECTIONS)}:
+        await db.create_collection(name=META)
+    await db.fetch_one(WRITE_STAMP, bind_vars={'@meta': META, 'key': STAMP_KEY,
+                                               'fingerprint': fingerprint})
+
+
+def load_schema(path: str):
+    module, _, attr = path.partition(':')
+    return getattr(importlib.import_module(module), attr or 'schema')
+
+
+async def main(args) -> Plan:
+    from aio_arango.db import ArangoDB, DocumentType
+    db = ArangoDB(args.user, args.password, args.database, address=args.address)
+    listing = IndexListing(args.address, args.database, args.user, args.password)
+    await db.login()
+    try:
+        return await provision(db, load_schema(args.schema).spec(),
+                               DocumentType.EDGE,
+                               dry_run=not args.apply,
+                               concurrency=args.concurrency,
+                               listing=listing)
+    finally:
+        await listing.close()
+        await db.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='neume-hq schema provisioning')
+    parser.add_argument('--schema', default='neume_hq.api.schema:schema')
+    parser.add_argument('--address', default='http://localhost:8529')
+    parser.add_argument('--user', default='user')
+    parser.add_argument('--password', default='user-pw')
+    parser.add_argument('--database', default='public')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--apply', action='store_true',
+                        help='apply the changes instead of only reporting them')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    plan = asyncio.get_event_loop().run_until_complete(main(args))
+    print('\n'.join(plan.report()) or 'nothing to do')
@@ -0,0 +1,91 @@
+"""
+selection
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from graphene import Dynamic
+from graphene.utils.str_converters import to_camel_case
+from graphql.language import ast
+
+# attributes every projection carries, ids are needed to resolve
+# relations, build cursors and cache documents
+ALWAYS = ('_id', '_key', '_rev')
+
+_field_names = {}
+
+
+def field_names(model) -> dict:
+    names = _field_names.get(model, None)
+    if names is None:
+        # the relay id is resolved from _id, documents have no id attribute
+        names = _field_names[model] = {
+            (field.name or to_camel_case(attr)): attr
+            for attr, field in model._meta.fields.items()
+            if not isinstance(field, Dynamic) and attr != 'id'
+        }
+    return names
+
+
+def _matches(type_condition, type_names) -> bool:
+    return (type_condition is None
+            or type_names is None
+            or type_condition.name.value in type_names)
+
+
+def fields(info, selection_set, type_names=None):
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = info.fragments[selection.name.value]
+            if _matches(fragment.type_condition, type_names):
+                yield from fields(info, fragment.selection_set, type_names)
+        elif isinstance(selection, ast.InlineFragment):
+            if _matches(selection.type_condition, type_names):
+                yield from fields(info, selection.selection_set, type_names)
+
+
+def selection_sets(info, path: tuple = (), sets: list = None) -> list:
+    if sets is None:
+        sets = [f.selection_set for f in info.field_asts
+                if f.selection_set is not None]
+    for name in path:
+        sets = [f.selection_set
+                for s in sets
+                for f in fields(info, s)
+                if f.name.value == name and f.selection_set is not None]
+    return sets
+
+
+def projection(info, model, path: tuple = (), sets: list = None) -> list:
+    names = field_names(model)
+    type_names = (model.__name__, 'Node')
+    keep = {*ALWAYS}
+    for selection_set in selection_sets(info, path, sets):
+        for field in fields(info, selection_set, type_names):
+            attr = names.get(field.name.value, None)
+            if attr is not None:
+                keep.add(attr)
+    return sorted(keep)
+
+
+def _value(info, node):
+    if isinstance(node, ast.Variable):
+        return (info.variable_values or {}).get(node.name.value, None)
+    if isinstance(node, ast.IntValue):
+        return int(node.value)
+    if isinstance(node, ast.FloatValue):
+        return float(node.value)
+    if isinstance(node, ast.ListValue):
+        return [_value(info, value) for value in node.values]
+    if isinstance(node, ast.ObjectValue):
+        return {f.name.value: _value(info, f.value) for f in node.fields}
+    return getattr(node, 'value', None)
+
+
+def arguments(info, field) -> dict:
+    """
+    Argument values of a field ast, variables taken from the request.
+    """
+    return {arg.name.value: _value(info, arg.value)
+            for arg in field.arguments or ()}
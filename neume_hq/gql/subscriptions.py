@@ -0,0 +1,286 @@
+"""
+subscriptions
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+import logging
+
+from graphene import ID, Field, ObjectType, String
+
+from neume_hq.gql.cache import decode, encode
+from neume_hq.gql.compiler import hydrate
+from neume_hq.gql.models import Node
+from neume_hq.utilities import snake_case
+
+CREATE = 'create'
+UPDATE = 'update'
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = object()
+
+change_types = {}
+
+
+class Subscription:
+    """
+    One subscriber of a ChangeFeed collection. Changes are queued up to
+    max_queue, a subscriber that falls behind loses its oldest changes
+    instead of slowing down publishers.
+    """
+
+    def __init__(self, feed, collection: str, predicate=None, max_queue: int = 100):
+        self._feed = feed
+        self.collection = collection
+        self.predicate = predicate
+        self.dropped = 0
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._closed = False
+
+    def put(self, change: dict):
+        if self._closed or (self.predicate is not None
+                            and not self.predicate(change)):
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(change)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._feed.unsubscribe(self)
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        change = await self._queue.get()
+        if change is _CLOSED:
+            raise StopAsyncIteration
+        return change
+
+
+class ChangeFeed:
+    """
+    In process fan-out of document changes. Mutators publish every
+    written document once, all subscriptions of its collection receive
+    it, so any number of websocket subscribers share one change source
+    instead of polling the database each.
+    """
+
+    def __init__(self, max_queue: int = None):
+        self.max_queue = 100 if max_queue is None else max_queue
+        self._subscribers = {}
+        self._listeners = []
+
+    def __len__(self):
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    async def publish(self, collection: str, event: str, doc: dict):
+        self._deliver({'collection': collection, 'event': event, 'doc': doc})
+
+    def _deliver(self, change: dict):
+        for listener in self._listeners:
+            listener(change)
+        for subscription in tuple(self._subscribers.get(change['collection'], ())):
+            subscription.put(change)
+
+    def subscribe(self, collection: str, predicate=None) -> Subscription:
+        subscription = Subscription(self, collection, predicate, self.max_queue)
+        self._subscribers.setdefault(collection, set()).add(subscription)
+        return subscription
+
+    def add_listener(self, listener):
+        """
+        listener(change) is called for every change of any collection,
+        before subscriptions receive it.
+        """
+        self._listeners.append(listener)
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.collection, set())
+        subscribers.discard(subscription)
+        if len(subscribers) == 0:
+            self._subscribers.pop(subscription.collection, None)
+
+    async def close(self):
+        for subscribers in tuple(self._subscribers.values()):
+            for subscription in tuple(subscribers):
+                subscription.close()
+
+
+class RedisFeed(ChangeFeed):
+    """
+    ChangeFeed relayed over a redis channel, so subscribers of every
+    worker process see changes published by any of them. Changes travel
+    as JSON on the asyncio client, a task of the worker's loop relays
+    them to local subscribers. Needs the optional redis package (>= 4.2).
+    """
+
+    def __init__(self, url: str, channel: str = 'neume:changes',
+                 max_queue: int = None, client=None):
+        super().__init__(max_queue)
+        if client is None:
+            try:
+                from redis import asyncio as aioredis
+            except ImportError:
+                raise ImportError('RedisFeed needs the redis package (>= 4.2), '
+                                  'pip install redis')
+            client = aioredis.Redis.from_url(url)
+        self._redis = client
+        self._channel = channel
+        self._relay = None
+        self._backoff = 0
+        self.max_backoff = 5.0
+
+    async def publish(self, collection: str, event: str, doc: dict):
+        # delivered to local subscribers when the message comes back
+        await self._redis.publish(self._channel, encode(
+            {'collection': collection, 'event': event, 'doc': doc}))
+
+    def subscribe(self, collection: str, predicate=None) -> Subscription:
+        self._listen()
+        return super().subscribe(collection, predicate)
+
+    def add_listener(self, listener):
+        self._listen()
+        super().add_listener(listener)
+
+    def _listen(self):
+        if self._relay is None:
+            self._relay = asyncio.ensure_future(self._receive())
+
+    async def _receive(self):
+        while True:
+            try:
+                await self._relay_messages()
+                logger.warning(f'{self._channel} closed, subscribing again')
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f'lost {self._channel}, subscribing again '
+                                 f'in {self._backoff:.1f}s')
+            # changes published meanwhile are lost, reconnecting quickly
+            # keeps that gap short without hammering a redis that is down
+            await asyncio.sleep(self._backoff)
+            self._backoff = min(self.max_backoff, max(0.1, self._backoff * 2))
+
+    async def _relay_messages(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self._channel)
+            self._backoff = 0
+            async for message in pubsub.listen():
+                if message.get('type', None) != 'message':
+                    continue
+                try:
+                    self._deliver(decode(message['data']))
+                except Exception:
+                    logger.exception(f'dropped a change from {self._channel}')
+        finally:
+            await pubsub.close()
+
+    async def close(self):
+        await super().close()
+        if self._relay is not None:
+            self._relay.cancel()
+            await asyncio.gather(self._relay, return_exceptions=True)
+            self._relay = None
+        await self._redis.close()
+
+
+def change_feed(url: str = None, max_queue: int = None) -> ChangeFeed:
+    """
+    A RedisFeed when url is given, a process local ChangeFeed otherwise.
+    """
+    if url is None:
+        return ChangeFeed(max_queue=max_queue)
+    return RedisFeed(url, max_queue=max_queue)
+
+
+async def publish(info, node, event: str, doc: dict):
+    if doc is None:
+        return
+    change = {'collection': node._collname_, 'event': event, 'doc': doc}
+    # a RedisFeed delivers after a round trip, this worker's reads must
+    # not see materialized lists older than its own writes until then
+    materialized = info.context.get('materialized', None)
+    if materialized is not None:
+        materialized.apply(change)
+    feed = info.context.get('feed', None)
+    if feed is not None:
+        await feed.publish(node._collname_, event, doc)
+
+
+def _predicate(event: str = None, **filters):
+    filters = {k: v for k, v in filters.items() if v is not None}
+
+    def predicate(change: dict) -> bool:
+        return ((event is None or change['event'] == event)
+                and all(change['doc'].get(k, None) == v for k, v in filters.items()))
+    return predicate
+
+
+def change_field_name(node) -> str:
+    return f'{snake_case(node.__name__)}_changed'
+
+
+def change_field(node) -> Field:
+    """
+    Subscription field streaming created and updated documents of node,
+    optionally narrowed to one event, one document or, for edges, one
+    side of the relation.
+    """
+    name = f'{node.__name__}Change'
+    change_type = change_types.get(name, None)
+    if change_type is None:
+        change_type = change_types[name] = type(
+            name,
+            (ObjectType,),
+            {'event': String(), 'node': Field(node)}
+        )
+    is_edge = not isinstance(node(), Node)
+
+    async def resolve(_, info, event=None, id=None, from_id=None, to_id=None):
+        subscription = info.context['feed'].subscribe(
+            node._collname_,
+            _predicate(event, _id=id, _from=from_id, _to=to_id)
+        )
+        try:
+            async for change in subscription:
+                # every change is executed like a request of its own,
+                # loaders must not serve results of the previous one
+                info.context.pop('loaders', None)
+                yield change_type(event=change['event'], node=hydrate(change['doc']))
+        finally:
+            subscription.close()
+
+    args = {'event': String(), 'id': ID()}
+    if is_edge:
+        args.update(from_id=String(), to_id=String())
+    return Field(change_type, resolver=resolve, **args)
+
+
+def subscription_server(schema, context: dict, loop=None):
+    """
+    graphql-ws protocol server for schema, every operation executes with
+    a copy of context. None without the optional graphql-ws package.
+    """
+    try:
+        from graphql_ws.websockets_lib import WsLibSubscriptionServer
+    except ImportError:
+        return None
+
+    class SubscriptionServer(WsLibSubscriptionServer):
+        def get_graphql_params(self, connection_context, payload):
+            params = super().get_graphql_params(connection_context, payload)
+            # the context is ours, never taken from the client payload
+            return {**params, 'context_value': {**context}}
+
+    return SubscriptionServer(schema, loop=loop)
@@ -0,0 +1,118 @@
+"""
+temporal
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from datetime import date, datetime, time, timezone
+from functools import lru_cache, wraps
+
+import arrow
+from arrow.parser import ParserError
+
+MEMO_SIZE = 8192
+# only these are memoized, equal datetimes and times of different
+# timezones compare and hash the same but serialize differently
+MEMOIZED = frozenset({int, float, str})
+
+# exceptions that make a value unusable for Date/Time/DateTime
+INVALID = (TypeError, ValueError, OverflowError, OSError, ParserError)
+
+
+class Serialized(str):
+    """
+    A value already serialized by serialize_columns, scalars return it
+    as it is.
+    """
+    __slots__ = ()
+
+
+def to_datetime(value) -> datetime:
+    """
+    Aware datetime for epoch numbers, ISO 8601 strings, dates and
+    datetimes without going through arrow, naive values are UTC like
+    arrow.get() treats them. Anything else is left to arrow.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, timezone.utc)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(
+                value[:-1] + '+00:00' if value.endswith('Z') else value)
+        except ValueError:
+            return arrow.get(value).datetime
+        value = parsed
+    if isinstance(value, datetime):
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+    return arrow.get(value).datetime
+
+
+def memoized(convert):
+    """
+    convert with an lru_cache for epoch numbers and ISO strings, other
+    values are converted every time.
+    """
+    cached = lru_cache(maxsize=MEMO_SIZE)(convert)
+
+    @wraps(convert)
+    def serialize(value):
+        if type(value) in MEMOIZED:
+            return cached(value)
+        return convert(value)
+    serialize.cache_info = cached.cache_info
+    serialize.cache_clear = cached.cache_clear
+    return serialize
+
+
+@memoized
+def serialize_date(value) -> str:
+    return to_datetime(value).date().isoformat()
+
+
+@memoized
+def serialize_time(value) -> str:
+    if isinstance(value, time):
+        return value.isoformat()
+    return to_datetime(value).time().isoformat()
+
+
+@memoized
+def serialize_datetime(value) -> str:
+    return to_datetime(value).isoformat()
+
+
+def serialize_columns(model, docs: list) -> list:
+    """
+    Serializes the bulk scalar attributes (Date, Time, DateTime) of
+    all docs column by column in place, every distinct epoch number or
+    string of a column is converted once. Invalid values become None.
+    """
+    for attr, serialize in bulk_fields(model).items():
+        memo = {}
+        for doc in docs:
+            value = doc.get(attr, None)
+            if value is None or type(value) is Serialized:
+                continue
+            if type(value) in MEMOIZED:
+                result = memo.get(value, None)
+                if result is None:
+                    result = memo[value] = serialize(value)
+            else:
+                result = serialize(value)
+            doc[attr] = None if result is None else Serialized(result)
+    return docs
+
+
+_bulk_fields = {}
+
+
+def bulk_fields(model) -> dict:
+    fields = _bulk_fields.get(model, None)
+    if fields is None:
+        fields = _bulk_fields[model] = {
+            attr: field.type.serialize
+            for attr, field in model._meta.fields.items()
+            if getattr(getattr(field, 'type', None), 'bulk', False) is True
+        }
+    return fields
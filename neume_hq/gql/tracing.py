@@ -0,0 +1,202 @@
+"""
+tracing
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import heapq
+import inspect
+import time
+from datetime import datetime, timezone
+
+SLOWEST_STATEMENTS = 5
+MAX_STATEMENT_STATS = 500
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+class Tracer:
+    """
+    Collects resolver and database timings of one request, rendered as
+    an Apollo tracing extension (durations in nanoseconds).
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.resolvers = []
+        self.statements = []
+
+    def offset(self) -> int:
+        return int((time.perf_counter() - self._start) * 1e9)
+
+    def resolved(self, info, start_offset: int):
+        self.resolvers.append({
+            'path': list(info.path),
+            'parentType': str(info.parent_type),
+            'fieldName': info.field_name,
+            'returnType': str(info.return_type),
+            'startOffset': start_offset,
+            'duration': self.offset() - start_offset
+        })
+
+    def queried(self, statement: str, start_offset: int):
+        self.statements.append((self.offset() - start_offset, statement))
+
+    async def timed(self, statement: str, awaitable):
+        start_offset = self.offset()
+        try:
+            return await awaitable
+        finally:
+            self.queried(statement, start_offset)
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = self.offset()
+        return self
+
+    @property
+    def db_duration(self) -> int:
+        return sum(duration for duration, _ in self.statements)
+
+    def slowest(self, n: int = SLOWEST_STATEMENTS) -> list:
+        return [{'statement': statement, 'duration': duration}
+                for duration, statement in heapq.nlargest(n, self.statements)]
+
+    def extensions(self) -> dict:
+        self.finish()
+        return {
+            'tracing': {
+                'version': 1,
+                'startTime': _iso(self.start_time),
+                'endTime': _iso(self.start_time + self.duration / 1e9),
+                'duration': self.duration,
+                'execution': {'resolvers': self.resolvers}
+            },
+            'db': {
+                'queries': len(self.statements),
+                'duration': self.db_duration,
+                'slowest': self.slowest()
+            }
+        }
+
+
+class TracingMiddleware:
+
+    def resolve(self, next, root, info, **kwargs):
+        tracer = info.context['tracer']
+        start_offset = tracer.offset()
+
+        def _done(value):
+            tracer.resolved(info, start_offset)
+            return value
+
+        def _failed(error):
+            tracer.resolved(info, start_offset)
+            raise error
+
+        result = next(root, info, **kwargs)
+        if hasattr(result, 'then'):
+            return result.then(_done, _failed)
+        return _done(result)
+
+
+class _Traced:
+    """
+    Proxies collections and graphs of a TracedDB, awaitable results of
+    their methods are timed.
+    """
+
+    def __init__(self, obj, tracer: Tracer, name: str):
+        self._obj = obj
+        self._tracer = tracer
+        self._name = name
+
+    def __getattr__(self, item):
+        attr = getattr(self._obj, item)
+        if not callable(attr):
+            return attr
+
+        def _call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if inspect.isawaitable(result):
+                return self._tracer.timed(f'{self._name}.{item}', result)
+            return result
+        return _call
+
+
+class TracedDB:
+
+    def __init__(self, db, tracer: Tracer):
+        self._db = db
+        self._tracer = tracer
+
+    def __getattr__(self, item):
+        return getattr(self._db, item)
+
+    def __getitem__(self, item):
+        return _Traced(self._db[item], self._tracer, item)
+
+    async def fetch_one(self, statement: str, **kwargs):
+        return await self._tracer.timed(
+            statement, self._db.fetch_one(statement, **kwargs))
+
+    async def query(self, statement: str, **kwargs):
+        start_offset = self._tracer.offset()
+        try:
+            async for row in self._db.query(statement, **kwargs):
+                yield row
+        finally:
+            self._tracer.queried(statement, start_offset)
+
+
+class Stats:
+    """
+    Process wide counters aggregated from finished tracers.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_duration = 0
+        self.duration = 0
+        self.fields = {}
+        self.statements = {}
+
+    def add(self, tracer: Tracer):
+        tracer.finish()
+        self.requests += 1
+        self.queries += len(tracer.statements)
+        self.db_duration += tracer.db_duration
+        self.duration += tracer.duration
+        for resolver in tracer.resolvers:
+            key = f'{resolver["parentType"]}.{resolver["fieldName"]}'
+            count, total = self.fields.get(key, (0, 0))
+            self.fields[key] = (count + 1, total + resolver['duration'])
+        for duration, statement in tracer.statements:
+            count, total = self.statements.get(statement, (0, 0))
+            if count == 0 and len(self.statements) >= MAX_STATEMENT_STATS:
+                continue
+            self.statements[statement] = (count + 1, total + duration)
+
+    def snapshot(self) -> dict:
+        slowest = heapq.nlargest(
+            SLOWEST_STATEMENTS, self.statements.items(), key=lambda i: i[1][1])
+        return {
+            'requests': self.requests,
+            'queries': self.queries,
+            'duration': self.duration,
+            'dbDuration': self.db_duration,
+            'fields': {k: {'count': c, 'duration': d}
+                       for k, (c, d) in self.fields.items()},
+            'slowest': [{'statement': s, 'count': c, 'duration': d}
+                        for s, (c, d) in slowest]
+        }
+
+
+stats = Stats()
@@ -0,0 +1,235 @@
+"""
+pool
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+
+Spreads database calls over several clients (size per coordinator,
+each with its own keep-alive session). Members that fail with a
+connection error, a timeout or a 5xx response are taken out of
+rotation until a health check succeeds again. Calls fail over to the next member when they could not
+have reached the database (no connection) or are safe to repeat (reads),
+a write whose connection broke might have been applied already.
+"""
+import asyncio
+import itertools
+import logging
+import re
+import socket
+
+try:
+    from aiohttp import ClientConnectionError, ClientConnectorError, ClientResponseError
+except ImportError:
+    ClientConnectionError = ConnectionError
+    ClientConnectorError = ConnectionRefusedError
+    ClientResponseError = ()
+
+logger = logging.getLogger(__name__)
+
+ROUND_ROBIN = 'round_robin'
+LEAST_BUSY = 'least_busy'
+HEALTH_CHECK = 'RETURN 1'
+
+# the request never left, repeating it elsewhere is always safe
+NOT_CONNECTED = (ConnectionRefusedError, socket.gaierror, ClientConnectorError)
+_WRITES = re.compile(r'\b(INSERT|UPDATE|REPLACE|REMOVE|UPSERT)\b', re.IGNORECASE)
+# collection / graph methods that only read
+READS = frozenset({'get', 'all', 'count', 'indexes'})
+
+
+def idempotent(statement: str) -> bool:
+    return _WRITES.search(statement) is None
+
+
+def unavailable(error: Exception) -> bool:
+    """
+    Tells if error means the coordinator is down, hung or restarting,
+    not that it refused the call.
+    """
+    if isinstance(error, ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, (OSError, asyncio.TimeoutError, ClientConnectionError))
+
+
+class NoHealthyMember(ConnectionError):
+    pass
+
+
+class Member:
+
+    def __init__(self, client, address: str):
+        self.client = client
+        self.address = address
+        self.busy = 0
+        self.healthy = True
+
+    def __repr__(self):
+        return f'<Member {self.address} busy={self.busy} healthy={self.healthy}>'
+
+
+class _Routed:
+    """
+    Collection or graph of a pool, every awaited method call runs on
+    the member picked for it.
+    """
+
+    def __init__(self, pool, name: str):
+        self._pool = pool
+        self._name = name
+
+    def __getattr__(self, item):
+        async def _call(*args, **kwargs):
+            return await self._pool.call(
+                lambda client: getattr(client[self._name], item)(*args, **kwargs),
+                idempotent=item in READS)
+        return _call
+
+
+class ArangoPool:
+
+    def __init__(self, factory, addresses: list, size: int = None,
+                 strategy: str = None, health_interval: float = None):
+        """
+        factory(address) creates one client, size clients are created
+        for every coordinator address.
+        """
+        size = 1 if size is None else size
+        self.strategy = ROUND_ROBIN if strategy is None else strategy
+        if self.strategy not in (ROUND_ROBIN, LEAST_BUSY):
+            raise ValueError(f'unknown strategy {self.strategy!r}')
+        self.health_interval = 5.0 if health_interval is None else health_interval
+        self.members = [Member(factory(address), address)
+                        for address in addresses for _ in range(size)]
+        self._cycle = itertools.cycle(range(len(self.members)))
+        self._health = None
+
+    def __getitem__(self, name: str):
+        return _Routed(self, name)
+
+    @property
+    def healthy(self) -> list:
+        return [member for member in self.members if member.healthy]
+
+    def pick(self, exclude=()) -> Member:
+        candidates = [m for m in self.healthy if m not in exclude]
+        if not candidates:
+            raise NoHealthyMember('no healthy database coordinator available')
+        if self.strategy == LEAST_BUSY:
+            return min(candidates, key=lambda m: m.busy)
+        for _ in range(len(self.members)):
+            member = self.members[next(self._cycle)]
+            if member in candidates:
+                return member
+        return candidates[0]
+
+    def failed(self, member: Member, error: Exception):
+        if member.healthy:
+            logger.warning(f'{member.address} taken out of rotation: {error!r}')
+        member.healthy = False
+
+    async def call(self, func, idempotent: bool = False):
+        """
+        Runs func(client) on a member, connection errors fail over to the
+        next healthy member, at most once per member. Calls that are not
+        idempotent only fail over if they never got a connection.
+        """
+        tried = []
+        while True:
+            member = self.pick(exclude=tried)
+            member.busy += 1
+            try:
+                return await func(member.client)
+            except Exception as error:
+                if not unavailable(error):
+                    raise
+                self.failed(member, error)
+                if not (idempotent or isinstance(error, NOT_CONNECTED)):
+                    raise
+                tried.append(member)
+            finally:
+                member.busy -= 1
+
+    async def fetch_one(self, statement: str, **kwargs):
+        return await self.call(lambda client: client.fetch_one(statement, **kwargs),
+                               idempotent=idempotent(statement))
+
+    async def query(self, statement: str, **kwargs):
+        retry = idempotent(statement)
+        tried = []
+        while True:
+            member = self.pick(exclude=tried)
+            member.busy += 1
+            started = False
+            try:
+                async for row in member.client.query(statement, **kwargs):
+                    started = True
+                    yield row
+                return
+            except Exception as error:
+                if not unavailable(error):
+                    raise
+                self.failed(member, error)
+                if started or not (retry or isinstance(error, NOT_CONNECTED)):
+                    raise
+                tried.append(member)
+            finally:
+                member.busy -= 1
+
+    async def create_collection(self, *args, **kwargs):
+        return await self.call(lambda client: client.create_collection(*args, **kwargs))
+
+    async def create_index(self, *args, **kwargs):
+        # an existing index with the same config is returned, not created
+        return await self.call(lambda client: client.create_index(*args, **kwargs),
+                               idempotent=True)
+
+    async def create_graph(self, *args, **kwargs):
+        return await self.call(lambda client: client.create_graph(*args, **kwargs))
+
+    async def check(self, member: Member) -> bool:
+        try:
+            await member.client.fetch_one(HEALTH_CHECK)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self.failed(member, error)
+            return False
+        if not member.healthy:
+            logger.info(f'{member.address} back in rotation')
+        member.healthy = True
+        return True
+
+    async def check_all(self) -> int:
+        results = await asyncio.gather(*(self.check(m) for m in self.members))
+        return sum(results)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('database health check failed')
+
+    async def login(self):
+        await asyncio.gather(*(m.client.login() for m in self.members),
+                             return_exceptions=True)
+        if await self.check_all() < 1:
+            raise NoHealthyMember('no healthy database coordinator available')
+        if self.health_interval > 0 and self._health is None:
+            self._health = asyncio.ensure_future(self._watch())
+        return self
+
+    async def close(self):
+        if self._health is not None:
+            self._health.cancel()
+            self._health = None
+        await asyncio.gather(*(m.client.close() for m in self.members),
+                             return_exceptions=True)
+
+    async def __aenter__(self):
+        return await self.login()
+
+    async def __aexit__(self, *args):
+        await self.close()
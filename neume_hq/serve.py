@@ -0,0 +1,97 @@
+"""
+serve
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+
+Production entry point, provisions once and then forks N workers that
+each bind their own SO_REUSEPORT socket, so the kernel balances
+connections over all of them:
+
+    python -m neume_hq.serve --workers 4 --port 7666
+
+Set CACHE_REDIS_URL (e.g. unix:///run/redis.sock) to share the document
+and persisted query caches between the workers and to relay subscription
+changes published in one worker to the subscribers of all others.
+Materialized lists are disabled for several workers without it.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import socket
+
+from neume_hq.api.schema import schema
+from neume_hq.app import app, connect, fingerprint, index_listing, provision
+from neume_hq.gql.provision import write_stamp
+
+
+def bind(host: str, port: int, backlog: int = 100) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+async def prepare(app):
+    """
+    Provisions users, databases and the schema and stamps the database
+    with the fingerprint, so the workers skip doing it again.
+    """
+    await provision(app)
+    db = connect(app)
+    listing = index_listing(app)
+    await db.login()
+    try:
+        await schema.provision(
+            db, concurrency=app.config.get('PROVISION_CONCURRENCY', None),
+            listing=listing)
+        await write_stamp(db, fingerprint(app))
+    finally:
+        await listing.close()
+        await db.close()
+
+
+def worker(host: str, port: int, backlog: int):
+    app.run(sock=bind(host, port, backlog), workers=1,
+            debug=False, access_log=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='neume-hq server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=7666)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--backlog', type=int, default=100)
+    args = parser.parse_args(argv)
+    # the workers inherit it, materialized lists need to know
+    app.config.WORKERS = max(1, args.workers)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(prepare(app))
+    loop.close()
+
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=worker, args=(args.host, args.port, args.backlog),
+                        daemon=True)
+        for _ in range(app.config.WORKERS)
+    ]
+
+    def stop(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
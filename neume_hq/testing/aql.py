@@ -0,0 +1,758 @@
+"""
+aql
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+
+A small AQL interpreter covering the statements neume_hq emits:
+FOR (collections, arrays and graph traversals), LET, FILTER, SORT, LIMIT,
+COLLECT, RETURN [DISTINCT], INSERT, UPDATE, REPLACE, REMOVE, subqueries,
+bind parameters and the common document functions.
+"""
+import re
+from functools import cmp_to_key
+
+from neume_hq.testing.functions import FUNCTIONS, AQLError, compare, equals, truthy
+
+_TOKENS = re.compile(r'''
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<bind>@@?[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<name>[A-Za-z_][A-Za-z0-9_]*|`[^`]+`)
+  | (?P<op>==|!=|<=|>=|&&|\|\||\.\.|[<>!?:.,()\[\]{}+\-*/%=])
+''', re.X | re.S)
+
+_ESCAPES = re.compile(r'\\(u[0-9a-fA-F]{4}|.)', re.S)
+_SIMPLE_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+OPERATIONS = ('FOR', 'LET', 'FILTER', 'SORT', 'LIMIT', 'COLLECT', 'RETURN',
+              'INSERT', 'UPDATE', 'REPLACE', 'REMOVE')
+DIRECTIONS = ('OUTBOUND', 'INBOUND', 'ANY')
+
+_MISSING = object()
+
+
+def _unescape(text: str) -> str:
+    def _sub(match):
+        code = match.group(1)
+        if code[0] == 'u' and len(code) == 5:
+            return chr(int(code[1:], 16))
+        return _SIMPLE_ESCAPES.get(code, code)
+    return _ESCAPES.sub(_sub, text)
+
+
+def tokenize(statement: str) -> list:
+    tokens, pos = [], 0
+    while pos < len(statement):
+        match = _TOKENS.match(statement, pos)
+        if match is None:
+            raise AQLError(f'syntax error, unexpected {statement[pos:pos + 10]!r}', 1501)
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'ws':
+            continue
+        if kind == 'string':
+            value = _unescape(value[1:-1])
+        elif kind == 'number':
+            value = float(value) if '.' in value or 'e' in value.lower() else int(value)
+        elif kind == 'name' and value.startswith('`'):
+            value = value[1:-1]
+        tokens.append((kind, value))
+    tokens.append(('eof', None))
+    return tokens
+
+
+class Context:
+
+    def __init__(self, db, bind_vars: dict):
+        self.db = db
+        self.bind_vars = bind_vars or {}
+        self.scopes = []
+
+    def bind(self, name: str):
+        if name not in self.bind_vars:
+            raise AQLError(f'no value specified for declared bind parameter {name!r}', 1552)
+        return self.bind_vars[name]
+
+
+class Parser:
+
+    def __init__(self, statement: str):
+        self._tokens = tokenize(statement)
+        self._pos = 0
+        self._no_in = 0
+        # names of bind_vars keys, @@collection is passed as '@collection'
+        self.declared = frozenset(value[1:] for kind, value in self._tokens
+                                  if kind == 'bind')
+
+    # -- token helpers ------------------------------------------------------
+
+    def _peek(self, offset: int = 0):
+        return self._tokens[min(self._pos + offset, len(self._tokens) - 1)]
+
+    def _next(self):
+        token = self._tokens[self._pos]
+        self._pos += 1
+        return token
+
+    def _is(self, *words, offset: int = 0) -> bool:
+        kind, value = self._peek(offset)
+        return kind == 'name' and value.upper() in words
+
+    def _is_op(self, *ops, offset: int = 0) -> bool:
+        kind, value = self._peek(offset)
+        return kind == 'op' and value in ops
+
+    def _expect_op(self, op: str):
+        kind, value = self._next()
+        if kind != 'op' or value != op:
+            raise AQLError(f'syntax error, expected {op!r} got {value!r}', 1501)
+
+    def _expect(self, word: str):
+        kind, value = self._next()
+        if kind != 'name' or value.upper() != word:
+            raise AQLError(f'syntax error, expected {word} got {value!r}', 1501)
+
+    def _name(self) -> str:
+        kind, value = self._next()
+        if kind != 'name':
+            raise AQLError(f'syntax error, expected a name got {value!r}', 1501)
+        return value
+
+    # -- queries ------------------------------------------------------------
+
+    def parse(self):
+        query = self._query()
+        if self._peek()[0] != 'eof':
+            raise AQLError(f'syntax error, unexpected {self._peek()[1]!r}', 1501)
+        return query
+
+    def _query(self):
+        if self._is('WITH'):
+            self._next()
+            self._collection()
+            while self._is_op(','):
+                self._next()
+                self._collection()
+        operations, ret = [], None
+        while self._is(*OPERATIONS):
+            word = self._next()[1].upper()
+            if word == 'RETURN':
+                ret = self._return()
+                break
+            operations.append(getattr(self, f'_{word.lower()}')())
+        if ret is None and len(operations) < 1:
+            raise AQLError('syntax error, query is empty', 1501)
+
+        def run(rows, ctx):
+            ctx.scopes.append(frozenset(rows[0]) if rows else frozenset())
+            try:
+                for operation in operations:
+                    rows = operation(rows, ctx)
+                if ret is None:
+                    return []
+                return ret(rows, ctx)
+            finally:
+                ctx.scopes.pop()
+        return run
+
+    def _collection(self):
+        kind, value = self._next()
+        if kind == 'bind' and value.startswith('@@'):
+            name = value[2:]
+            return lambda ctx: ctx.bind(f'@{name}')
+        if kind == 'bind':
+            name = value[1:]
+            return lambda ctx: ctx.bind(name)
+        if kind in ('name', 'string'):
+            return lambda ctx: value
+        raise AQLError(f'syntax error, expected a collection got {value!r}', 1501)
+
+    def _options(self):
+        if self._is('OPTIONS'):
+            self._next()
+            return self._expression()
+        return lambda scope, ctx: {}
+
+    def _for(self):
+        names = [self._name()]
+        while self._is_op(','):
+            self._next()
+            names.append(self._name())
+        self._expect('IN')
+        if self._is(*DIRECTIONS) or (
+                self._peek()[0] == 'number'
+                and (self._is(*DIRECTIONS, offset=1)
+                     or (self._is_op('..', offset=1) and self._is(*DIRECTIONS, offset=3)))):
+            return self._traversal(names)
+        source = self._expression()
+        self._options()
+        if len(names) > 1:
+            raise AQLError('syntax error, unexpected , in FOR', 1501)
+        name = names[0]
+
+        def op(rows, ctx):
+            out = []
+            for row in rows:
+                items = source(row, ctx)
+                if not isinstance(items, list):
+                    raise AQLError('collection or array expected as operand to FOR loop', 1563)
+                out.extend({**row, name: item} for item in items)
+            return out
+        return op
+
+    def _traversal(self, names):
+        min_depth = max_depth = 1
+        if self._peek()[0] == 'number':
+            min_depth = max_depth = self._next()[1]
+            if self._is_op('..'):
+                self._next()
+                max_depth = self._next()[1]
+        direction = self._next()[1].upper()
+        self._no_in += 1
+        start = self._expression()
+        self._no_in -= 1
+        self._expect('GRAPH')
+        graph = self._collection()
+        self._options()
+        names = (names + [None, None])[:3]
+
+        def op(rows, ctx):
+            out = []
+            for row in rows:
+                for vertex, edge, path in ctx.db.traverse(
+                        graph(ctx), start(row, ctx),
+                        int(min_depth), int(max_depth), direction):
+                    new = {**row, names[0]: vertex}
+                    if names[1] is not None:
+                        new[names[1]] = edge
+                    if names[2] is not None:
+                        new[names[2]] = path
+                    out.append(new)
+            return out
+        return op
+
+    def _let(self):
+        name = self._name()
+        self._expect_op('=')
+        value = self._expression()
+
+        def op(rows, ctx):
+            return [{**row, name: value(row, ctx)} for row in rows]
+        return op
+
+    def _filter(self):
+        condition = self._expression()
+
+        def op(rows, ctx):
+            return [row for row in rows if truthy(condition(row, ctx))]
+        return op
+
+    def _sort(self):
+        criteria = []
+        while True:
+            expression = self._expression()
+            descending = False
+            if self._is('ASC', 'DESC'):
+                descending = self._next()[1].upper() == 'DESC'
+            criteria.append((expression, descending))
+            if not self._is_op(','):
+                break
+            self._next()
+
+        def op(rows, ctx):
+            keyed = [([e(row, ctx) for e, _ in criteria], row) for row in rows]
+
+            def cmp(a, b):
+                for (value_a, value_b, (_, descending)) in zip(a[0], b[0], criteria):
+                    result = compare(value_a, value_b)
+                    if result != 0:
+                        return -result if descending else result
+                return 0
+            return [row for _, row in sorted(keyed, key=cmp_to_key(cmp))]
+        return op
+
+    def _limit(self):
+        first = self._expression()
+        second = None
+        if self._is_op(','):
+            self._next()
+            second = self._expression()
+
+        def op(rows, ctx):
+            if second is None:
+                offset, count = 0, first({}, ctx)
+            else:
+                offset, count = first({}, ctx), second({}, ctx)
+            return rows[int(offset):int(offset) + int(count)]
+        return op
+
+    def _collect(self):
+        groups, into, counter = [], None, None
+        if not self._is('WITH', 'INTO'):
+            while True:
+                name = self._name()
+                self._expect_op('=')
+                groups.append((name, self._expression()))
+                if not self._is_op(','):
+                    break
+                self._next()
+        if self._is('INTO'):
+            self._next()
+            into = self._name()
+        if self._is('WITH'):
+            self._next()
+            self._expect('COUNT')
+            self._expect('INTO')
+            counter = self._name()
+        self._options()
+
+        def op(rows, ctx):
+            buckets = []
+            for row in rows:
+                key = [expression(row, ctx) for _, expression in groups]
+                for bucket in buckets:
+                    if equals(bucket[0], key):
+                        bucket[1].append(row)
+                        break
+                else:
+                    buckets.append((key, [row]))
+            if len(groups) < 1 and len(buckets) < 1:
+                buckets.append(([], []))
+            buckets.sort(key=cmp_to_key(lambda a, b: compare(a[0], b[0])))
+            base = rows[0] if rows else {}
+            out = []
+            for key, members in buckets:
+                new = {k: v for k, v in base.items() if k in ctx.scopes[-1]}
+                new.update(zip([name for name, _ in groups], key))
+                if into is not None:
+                    new[into] = [{k: v for k, v in member.items()} for member in members]
+                if counter is not None:
+                    new[counter] = len(members)
+                out.append(new)
+            return out
+        return op
+
+    def _modification(self, kind: str):
+        self._no_in += 1
+        first = self._expression()
+        second = None
+        if kind in ('UPDATE', 'REPLACE') and self._is('WITH'):
+            self._next()
+            second = self._expression()
+        self._no_in -= 1
+        if kind == 'INSERT':
+            self._expect('INTO')
+        else:
+            if not self._is('IN', 'INTO'):
+                raise AQLError(f'syntax error, expected IN after {kind}', 1501)
+            self._next()
+        collection = self._collection()
+        options = self._options()
+
+        def op(rows, ctx):
+            out = []
+            for row in rows:
+                opts = options(row, ctx) or {}
+                try:
+                    old, new = ctx.db.modify(
+                        kind, collection(ctx),
+                        first(row, ctx),
+                        None if second is None else second(row, ctx),
+                        opts)
+                except AQLError:
+                    if opts.get('ignoreErrors', False) is True:
+                        continue
+                    raise
+                out.append({**row, 'OLD': old, 'NEW': new})
+            return out
+        return op
+
+    def _insert(self):
+        return self._modification('INSERT')
+
+    def _update(self):
+        return self._modification('UPDATE')
+
+    def _replace(self):
+        return self._modification('REPLACE')
+
+    def _remove(self):
+        return self._modification('REMOVE')
+
+    def _return(self):
+        distinct = False
+        if self._is('DISTINCT'):
+            self._next()
+            distinct = True
+        value = self._expression()
+
+        def op(rows, ctx):
+            results = [value(row, ctx) for row in rows]
+            if distinct is False:
+                return results
+            unique = []
+            for result in results:
+                if not any(equals(result, other) for other in unique):
+                    unique.append(result)
+            return unique
+        return op
+
+    # -- expressions --------------------------------------------------------
+
+    def _expression(self):
+        condition = self._or()
+        if not self._is_op('?'):
+            return condition
+        self._next()
+        if self._is_op(':'):
+            then = None
+        else:
+            then = self._expression()
+        self._expect_op(':')
+        otherwise = self._expression()
+
+        def ternary(scope, ctx):
+            value = condition(scope, ctx)
+            if truthy(value):
+                return value if then is None else then(scope, ctx)
+            return otherwise(scope, ctx)
+        return ternary
+
+    def _or(self):
+        left = self._and()
+        while self._is_op('||') or self._is('OR'):
+            self._next()
+            right, prev = self._and(), left
+
+            def left(scope, ctx, prev=prev, right=right):
+                value = prev(scope, ctx)
+                return value if truthy(value) else right(scope, ctx)
+        return left
+
+    def _and(self):
+        left = self._equality()
+        while self._is_op('&&') or self._is('AND'):
+            self._next()
+            right, prev = self._equality(), left
+
+            def left(scope, ctx, prev=prev, right=right):
+                value = prev(scope, ctx)
+                return right(scope, ctx) if truthy(value) else value
+        return left
+
+    def _equality(self):
+        left = self._relational()
+        while True:
+            negate = False
+            if self._is_op('==', '!='):
+                operator = self._next()[1]
+            elif self._is('LIKE') or (self._is('IN') and self._no_in == 0):
+                operator = self._next()[1].upper()
+            elif self._is('NOT') and (self._is('LIKE', offset=1)
+                                      or (self._is('IN', offset=1) and self._no_in == 0)):
+                self._next()
+                negate = True
+                operator = self._next()[1].upper()
+            else:
+                return left
+            right, prev = self._relational(), left
+            left = _binary(operator, prev, right, negate)
+
+    def _relational(self):
+        left = self._range()
+        while self._is_op('<', '<=', '>', '>='):
+            operator = self._next()[1]
+            left = _binary(operator, left, self._range())
+        return left
+
+    def _range(self):
+        left = self._additive()
+        if self._is_op('..'):
+            self._next()
+            right, low = self._additive(), left
+
+            def left(scope, ctx):
+                start, stop = int(low(scope, ctx)), int(right(scope, ctx))
+                step = 1 if stop >= start else -1
+                return list(range(start, stop + step, step))
+        return left
+
+    def _additive(self):
+        left = self._multiplicative()
+        while self._is_op('+', '-'):
+            operator = self._next()[1]
+            left = _binary(operator, left, self._multiplicative())
+        return left
+
+    def _multiplicative(self):
+        left = self._unary()
+        while self._is_op('*', '/', '%'):
+            operator = self._next()[1]
+            left = _binary(operator, left, self._unary())
+        return left
+
+    def _unary(self):
+        if self._is_op('!') or (self._is('NOT') and not self._is('LIKE', 'IN', offset=1)):
+            self._next()
+            operand = self._unary()
+            return lambda scope, ctx: not truthy(operand(scope, ctx))
+        if self._is_op('-'):
+            self._next()
+            operand = self._unary()
+            return lambda scope, ctx: -FUNCTIONS['TO_NUMBER'](ctx, operand(scope, ctx))
+        if self._is_op('+'):
+            self._next()
+            operand = self._unary()
+            return lambda scope, ctx: FUNCTIONS['TO_NUMBER'](ctx, operand(scope, ctx))
+        return self._postfix()
+
+    def _postfix(self):
+        value = self._primary()
+        while True:
+            if self._is_op('.'):
+                self._next()
+                kind, name = self._next()
+                if kind not in ('name', 'string'):
+                    raise AQLError(f'syntax error, unexpected {name!r}', 1501)
+                value = _attribute(value, name)
+            elif self._is_op('['):
+                self._next()
+                if self._is_op('*'):
+                    self._next()
+                    self._expect_op(']')
+                    value = _expand(value)
+                    continue
+                index = self._expression()
+                self._expect_op(']')
+                value = _index(value, index)
+            else:
+                return value
+
+    def _primary(self):
+        kind, value = self._peek()
+        if kind == 'number' or kind == 'string':
+            self._next()
+            return lambda scope, ctx: value
+        if kind == 'bind':
+            self._next()
+            if value.startswith('@@'):
+                name = f'@{value[2:]}'
+                return lambda scope, ctx: ctx.db.documents(ctx.bind(name))
+            name = value[1:]
+            return lambda scope, ctx: ctx.bind(name)
+        if kind == 'op' and value == '(':
+            self._next()
+            if self._is(*OPERATIONS, 'WITH'):
+                query = self._query()
+                self._expect_op(')')
+                return lambda scope, ctx: query([scope], ctx)
+            inner = self._expression()
+            self._expect_op(')')
+            return inner
+        if kind == 'op' and value == '[':
+            return self._array()
+        if kind == 'op' and value == '{':
+            return self._object()
+        if kind == 'name':
+            self._next()
+            upper = value.upper()
+            if upper == 'TRUE':
+                return lambda scope, ctx: True
+            if upper == 'FALSE':
+                return lambda scope, ctx: False
+            if upper == 'NULL':
+                return lambda scope, ctx: None
+            if self._is_op('('):
+                return self._call(value)
+            return _variable(value)
+        raise AQLError(f'syntax error, unexpected {value!r}', 1501)
+
+    def _array(self):
+        self._expect_op('[')
+        items = []
+        while not self._is_op(']'):
+            items.append(self._expression())
+            if not self._is_op(','):
+                break
+            self._next()
+        self._expect_op(']')
+        return lambda scope, ctx: [item(scope, ctx) for item in items]
+
+    def _object(self):
+        self._expect_op('{')
+        members = []
+        while not self._is_op('}'):
+            kind, value = self._next()
+            if kind == 'op' and value == '[':
+                key = self._expression()
+                self._expect_op(']')
+            elif kind in ('name', 'string', 'number'):
+                key = (lambda v: lambda scope, ctx: str(v))(value)
+            elif kind == 'bind':
+                key = (lambda n: lambda scope, ctx: ctx.bind(n))(value[1:])
+            else:
+                raise AQLError(f'syntax error, unexpected {value!r} in object', 1501)
+            if self._is_op(':'):
+                self._next()
+                member = self._expression()
+            elif kind == 'name':
+                member = _variable(value)
+            else:
+                raise AQLError('syntax error, expected :', 1501)
+            members.append((key, member))
+            if not self._is_op(','):
+                break
+            self._next()
+        self._expect_op('}')
+        return lambda scope, ctx: {str(k(scope, ctx)): m(scope, ctx) for k, m in members}
+
+    def _call(self, name: str):
+        function = FUNCTIONS.get(name.upper(), None)
+        if function is None:
+            raise AQLError(f'usage of unknown function {name!r}', 1540)
+        self._expect_op('(')
+        args = []
+        while not self._is_op(')'):
+            if self._is(*OPERATIONS):
+                query = self._query()
+                args.append(lambda scope, ctx, query=query: query([scope], ctx))
+            else:
+                args.append(self._expression())
+            if not self._is_op(','):
+                break
+            self._next()
+        self._expect_op(')')
+        return lambda scope, ctx: function(ctx, *(arg(scope, ctx) for arg in args))
+
+
+def _variable(name: str):
+    def variable(scope, ctx):
+        value = scope.get(name, _MISSING)
+        if value is _MISSING:
+            if ctx.db.has_collection(name):
+                return ctx.db.documents(name)
+            raise AQLError(f'variable {name!r} is not declared', 1512)
+        return value
+    return variable
+
+
+def _attribute(value, name: str):
+    def attribute(scope, ctx):
+        obj = value(scope, ctx)
+        return obj.get(name, None) if isinstance(obj, dict) else None
+    return attribute
+
+
+def _index(value, index):
+    def indexed(scope, ctx):
+        obj, key = value(scope, ctx), index(scope, ctx)
+        if isinstance(obj, list) and isinstance(key, (int, float)):
+            key = int(key)
+            return obj[key] if -len(obj) <= key < len(obj) else None
+        if isinstance(obj, dict):
+            return obj.get(str(key), None)
+        return None
+    return indexed
+
+
+def _expand(value):
+    def expanded(scope, ctx):
+        obj = value(scope, ctx)
+        return obj if isinstance(obj, list) else []
+    return expanded
+
+
+def _like(value, pattern) -> bool:
+    if not isinstance(pattern, str):
+        return False
+    regex = ''
+    escaped = False
+    for char in pattern:
+        if escaped:
+            regex += re.escape(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '%':
+            regex += '.*'
+        elif char == '_':
+            regex += '.'
+        else:
+            regex += re.escape(char)
+    text = value if isinstance(value, str) else FUNCTIONS['TO_STRING'](None, value)
+    return re.fullmatch(regex, text, re.S) is not None
+
+
+def _arithmetic(operator: str, a, b):
+    to_number = FUNCTIONS['TO_NUMBER']
+    a, b = to_number(None, a), to_number(None, b)
+    if operator == '+':
+        return a + b
+    if operator == '-':
+        return a - b
+    if operator == '*':
+        return a * b
+    if b == 0:
+        return None
+    if operator == '/':
+        result = a / b
+        return int(result) if result == int(result) else result
+    return a % b
+
+
+def _binary(operator: str, left, right, negate: bool = False):
+    if operator == '==':
+        return lambda s, c: equals(left(s, c), right(s, c))
+    if operator == '!=':
+        return lambda s, c: not equals(left(s, c), right(s, c))
+    if operator == '<':
+        return lambda s, c: compare(left(s, c), right(s, c)) < 0
+    if operator == '<=':
+        return lambda s, c: compare(left(s, c), right(s, c)) <= 0
+    if operator == '>':
+        return lambda s, c: compare(left(s, c), right(s, c)) > 0
+    if operator == '>=':
+        return lambda s, c: compare(left(s, c), right(s, c)) >= 0
+    if operator == 'LIKE':
+        return lambda s, c: _like(left(s, c), right(s, c)) is not negate
+    if operator == 'IN':
+        def contains(s, c):
+            haystack = right(s, c)
+            needle = left(s, c)
+            found = isinstance(haystack, list) and any(
+                equals(needle, item) for item in haystack)
+            return found is not negate
+        return contains
+    return lambda s, c: _arithmetic(operator, left(s, c), right(s, c))
+
+
+_cache = {}
+
+
+def compile_query(statement: str):
+    """
+    (query, names of the bind parameters it declares)
+    """
+    compiled = _cache.get(statement, None)
+    if compiled is None:
+        parser = Parser(statement)
+        compiled = _cache[statement] = (parser.parse(), parser.declared)
+        if len(_cache) > 1024:
+            _cache.pop(next(iter(_cache)))
+    return compiled
+
+
+def execute(db, statement: str, bind_vars: dict = None) -> list:
+    ctx = Context(db, bind_vars)
+    query, declared = compile_query(statement)
+    # checked before running, like ArangoDB, not only for evaluated branches
+    missing = declared - ctx.bind_vars.keys()
+    if missing:
+        raise AQLError(f'no value specified for declared bind parameter '
+                       f'{sorted(missing)[0]!r}', 1552)
+    unused = ctx.bind_vars.keys() - declared
+    if unused:
+        raise AQLError(f'bind parameter {sorted(unused)[0]!r} was not declared in the query', 1552)
+    return query([{}], ctx)
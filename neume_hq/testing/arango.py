@@ -0,0 +1,385 @@
+"""
+arango
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+
+In-memory stand-in for aio_arango's ArangoDB, for tests and benchmarks
+that should run without an ArangoDB server:
+
+    db = MemoryArangoDB()
+    await db.login()
+    schema = await gql_schema.setup(db)
+
+Implements the client surface neume_hq uses (query, fetch_one,
+create_collection, create_index, create_graph, collections and graphs
+by item access) on top of the AQL subset in neume_hq.testing.aql.
+"""
+from neume_hq.testing.aql import execute
+from neume_hq.testing.functions import AQLError
+
+EDGE = 3
+# like arangodb these types are never unique and always sparse
+_FIXED_ATTRIBUTES = {
+    'fulltext': {'unique': False, 'sparse': True},
+    'geo': {'unique': False, 'sparse': True},
+    'ttl': {'unique': False, 'sparse': True},
+}
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _merge(current: dict, patch: dict, keep_null: bool, merge_objects: bool) -> dict:
+    result = dict(current)
+    for key, value in patch.items():
+        if value is None and keep_null is False:
+            result.pop(key, None)
+        elif (merge_objects and isinstance(value, dict)
+              and isinstance(result.get(key, None), dict)):
+            result[key] = _merge(result[key], value, keep_null, merge_objects)
+        else:
+            result[key] = value
+    return result
+
+
+def _public(index: dict) -> dict:
+    return {k: v for k, v in index.items() if k != 'entries'}
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def _is_edge(doc_type) -> bool:
+    if doc_type is None:
+        return False
+    return (getattr(doc_type, 'value', doc_type) == EDGE
+            or str(getattr(doc_type, 'name', doc_type)).upper() == 'EDGE')
+
+
+class Collection:
+
+    def __init__(self, db, name: str, edge: bool = False):
+        self.db = db
+        self.name = name
+        self.edge = edge
+        self.docs = {}
+        self.indexes = []
+        self.outgoing = {}
+        self.incoming = {}
+        self._next_key = 0
+
+    def _key(self) -> str:
+        self._next_key += 1
+        while str(self._next_key) in self.docs:
+            self._next_key += 1
+        return str(self._next_key)
+
+    def _unique(self, doc: dict):
+        for index in self.indexes:
+            if index.get('unique', False) is not True:
+                continue
+            values = tuple(_hashable(doc.get(field, None)) for field in index['fields'])
+            if index.get('sparse', False) and None in values:
+                continue
+            yield index, values
+
+    def _check(self, doc: dict):
+        if self.edge and not (isinstance(doc.get('_from', None), str)
+                              and isinstance(doc.get('_to', None), str)):
+            raise AQLError('edge attribute missing or invalid', 1233)
+        for index, values in self._unique(doc):
+            owner = index['entries'].get(values, None)
+            if owner is not None and owner != doc['_key']:
+                raise AQLError(
+                    f'unique constraint violated - in index {index["id"]} '
+                    f'of type {index["type"]} over {index["fields"]}', 1210)
+
+    def _link(self, doc: dict):
+        for index, values in self._unique(doc):
+            index['entries'][values] = doc['_key']
+        if self.edge:
+            self.outgoing.setdefault(doc['_from'], {})[doc['_key']] = doc
+            self.incoming.setdefault(doc['_to'], {})[doc['_key']] = doc
+
+    def _unlink(self, doc: dict):
+        for index, values in self._unique(doc):
+            index['entries'].pop(values, None)
+        if self.edge:
+            self.outgoing.get(doc['_from'], {}).pop(doc['_key'], None)
+            self.incoming.get(doc['_to'], {}).pop(doc['_key'], None)
+
+    def insert(self, data: dict, options: dict = None) -> dict:
+        if not isinstance(data, dict):
+            raise AQLError('invalid document type', 1227)
+        options = options or {}
+        doc = _copy(data)
+        key = doc.get('_key', None)
+        if key is None:
+            key = self._key()
+        elif str(key) in self.docs:
+            if options.get('overwrite', False) is not True:
+                raise AQLError(f'unique constraint violated - in index primary '
+                               f'over ["_key"] ({key})', 1210)
+            return self.replace(key, doc)
+        doc['_key'] = str(key)
+        doc['_id'] = f'{self.name}/{doc["_key"]}'
+        doc['_rev'] = self.db.revision()
+        self._check(doc)
+        self.docs[doc['_key']] = doc
+        self._link(doc)
+        return doc
+
+    def _lookup(self, selector) -> dict:
+        key = selector.get('_key', None) if isinstance(selector, dict) else selector
+        if isinstance(key, str) and '/' in key:
+            collection, key = key.split('/', 1)
+            if collection != self.name:
+                raise AQLError(f'collection mismatch {collection} != {self.name}', 1226)
+        current = self.docs.get(str(key), None) if key is not None else None
+        if current is None:
+            raise AQLError(f'document not found ({self.name}/{key})', 1202)
+        return current
+
+    def _store(self, current: dict, doc: dict) -> dict:
+        doc['_key'] = current['_key']
+        doc['_id'] = current['_id']
+        doc['_rev'] = self.db.revision()
+        self._unlink(current)
+        try:
+            self._check(doc)
+        except AQLError:
+            self._link(current)
+            raise
+        self.docs[doc['_key']] = doc
+        self._link(doc)
+        return doc
+
+    def update(self, selector, data: dict, options: dict = None) -> tuple:
+        options = options or {}
+        current = self._lookup(selector)
+        if data is None:
+            data = {k: v for k, v in selector.items() if k not in ('_id', '_key', '_rev')}
+        if not isinstance(data, dict):
+            raise AQLError('invalid document type', 1227)
+        doc = _merge(current, _copy(data),
+                     options.get('keepNull', True) is not False,
+                     options.get('mergeObjects', True) is not False)
+        return current, self._store(current, doc)
+
+    def replace(self, selector, data: dict = None, options: dict = None) -> tuple:
+        current = self._lookup(selector)
+        if data is None:
+            data = selector
+        doc = {k: v for k, v in _copy(data).items() if k not in ('_id', '_key', '_rev')}
+        return current, self._store(current, doc)
+
+    def remove(self, selector, options: dict = None) -> dict:
+        current = self._lookup(selector)
+        del self.docs[current['_key']]
+        self._unlink(current)
+        return current
+
+    async def get(self, key: str) -> dict:
+        try:
+            return _copy(self._lookup(key))
+        except AQLError:
+            return None
+
+    async def all(self) -> list:
+        return [_copy(doc) for doc in self.docs.values()]
+
+    async def count(self) -> int:
+        return len(self.docs)
+
+    async def truncate(self):
+        for doc in list(self.docs.values()):
+            self.remove(doc)
+
+
+class Graph:
+
+    def __init__(self, db, name: str, edge_definitions: list):
+        self.db = db
+        self.name = name
+        self.edge_definitions = edge_definitions
+
+    @property
+    def edge_collections(self) -> list:
+        return [definition['collection'] for definition in self.edge_definitions]
+
+    async def vertex_create(self, collection: str, data: dict) -> dict:
+        doc = self.db.collection(collection).insert(data)
+        return {k: doc[k] for k in ('_id', '_key', '_rev')}
+
+    async def edge_create(self, collection: str, data: dict) -> dict:
+        if collection not in self.edge_collections:
+            raise AQLError(f'edge collection {collection} not used in graph {self.name}', 1930)
+        for side in ('_from', '_to'):
+            if self.db.document(data.get(side, None)) is None:
+                raise AQLError(f'{side} vertex {data.get(side, None)} not found', 1202)
+        doc = self.db.collection(collection).insert(data)
+        return {k: doc[k] for k in ('_id', '_key', '_rev')}
+
+
+class MemoryArangoDB:
+    """
+    Drop-in replacement for aio_arango.db.ArangoDB keeping all
+    collections in process memory.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._collections = {'_graphs': Collection(self, '_graphs')}
+        self._graphs = {}
+        self._revision = 0
+
+    async def login(self):
+        return self
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return await self.login()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __getitem__(self, name: str):
+        if name in self._graphs:
+            return self._graphs[name]
+        return self.collection(name)
+
+    def revision(self) -> str:
+        self._revision += 1
+        return f'_{self._revision:x}'
+
+    def has_collection(self, name: str) -> bool:
+        return name in self._collections
+
+    def collection(self, name: str) -> Collection:
+        collection = self._collections.get(name, None)
+        if collection is None:
+            raise AQLError(f'collection or view not found: {name}', 1203)
+        return collection
+
+    def graph(self, name: str) -> Graph:
+        graph = self._graphs.get(name, None)
+        if graph is None:
+            raise AQLError(f'graph {name!r} not found', 1924)
+        return graph
+
+    def collection_names(self) -> list:
+        return list(self._collections)
+
+    def documents(self, name: str) -> list:
+        return list(self.collection(name).docs.values())
+
+    def document(self, _id: str):
+        if not isinstance(_id, str) or '/' not in _id:
+            return None
+        name, key = _id.split('/', 1)
+        collection = self._collections.get(name, None)
+        return None if collection is None else collection.docs.get(key, None)
+
+    def modify(self, kind: str, name: str, first, second, options: dict) -> tuple:
+        collection = self.collection(name)
+        if kind == 'INSERT':
+            result = collection.insert(first, options)
+            return (None, result) if isinstance(result, dict) else result
+        if kind == 'UPDATE':
+            return collection.update(first, second, options)
+        if kind == 'REPLACE':
+            return collection.replace(first, second, options)
+        return collection.remove(first, options), None
+
+    def traverse(self, graph_name: str, start, min_depth: int, max_depth: int,
+                 direction: str):
+        edges = [self.collection(name) for name in self.graph(graph_name).edge_collections]
+        start = self.document(start.get('_id', None) if isinstance(start, dict) else start)
+        if start is None:
+            return
+
+        def neighbours(vertex_id: str):
+            for collection in edges:
+                if direction in ('OUTBOUND', 'ANY'):
+                    for edge in collection.outgoing.get(vertex_id, {}).values():
+                        yield edge, edge['_to']
+                if direction in ('INBOUND', 'ANY'):
+                    for edge in collection.incoming.get(vertex_id, {}).values():
+                        yield edge, edge['_from']
+
+        def walk(vertices: list, path_edges: list):
+            depth = len(path_edges)
+            if depth >= min_depth:
+                yield (vertices[-1], path_edges[-1] if path_edges else None,
+                       {'vertices': vertices, 'edges': path_edges})
+            if depth >= max_depth:
+                return
+            for edge, other in list(neighbours(vertices[-1]['_id'])):
+                if any(edge is seen for seen in path_edges):
+                    continue
+                vertex = self.document(other)
+                if vertex is not None:
+                    yield from walk([*vertices, vertex], [*path_edges, edge])
+
+        yield from walk([start], [])
+
+    async def create_collection(self, name: str, doc_type=None, **kwargs):
+        if name in self._collections:
+            raise AQLError(f'duplicate name: {name}', 1207)
+        self._collections[name] = Collection(self, name, edge=_is_edge(doc_type))
+        return {'name': name, 'type': EDGE if _is_edge(doc_type) else 2}
+
+    async def create_index(self, collection: str, config: dict):
+        target = self.collection(collection)
+        config = {**config, **_FIXED_ATTRIBUTES.get(config['type'], {})}
+        for index in target.indexes:
+            if all(index.get(k, None) == config.get(k, None)
+                   for k in ('type', 'fields', 'unique', 'sparse')):
+                return {**_public(index), 'isNewlyCreated': False}
+        index = {**config, 'id': f'{collection}/{len(target.indexes) + 1}', 'entries': {}}
+        target.indexes.append(index)
+        try:
+            for doc in target.docs.values():
+                target._check(doc)
+                target._link(doc)
+        except AQLError:
+            target.indexes.remove(index)
+            raise
+        return {**_public(index), 'isNewlyCreated': True}
+
+    async def indexes(self, collection: str) -> list:
+        return [{'id': f'{collection}/0', 'type': 'primary', 'fields': ['_key'],
+                 'unique': True, 'sparse': False},
+                *(_public(index) for index in self.collection(collection).indexes)]
+
+    async def create_graph(self, name: str, edge_definitions: list, **kwargs):
+        if name in self._graphs:
+            raise AQLError(f'graph already exists: {name}', 1925)
+        for definition in edge_definitions:
+            if definition['collection'] not in self._collections:
+                await self.create_collection(definition['collection'], doc_type=EDGE)
+            for vertex in (*definition.get('from', []), *definition.get('to', [])):
+                if vertex not in self._collections:
+                    await self.create_collection(vertex)
+        self._graphs[name] = Graph(self, name, edge_definitions)
+        self._collections['_graphs'].insert({'_key': name, 'edgeDefinitions': edge_definitions})
+        return {'name': name, 'edgeDefinitions': edge_definitions}
+
+    async def query(self, statement: str, bind_vars: dict = None, **kwargs):
+        for row in execute(self, statement, bind_vars):
+            yield _copy(row)
+
+    async def fetch_one(self, statement: str, bind_vars: dict = None, **kwargs):
+        results = execute(self, statement, bind_vars)
+        return _copy(results[0]) if results else None
@@ -0,0 +1,269 @@
+"""
+functions
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+
+Value semantics (type order, equality, truthiness) and the subset of
+AQL functions understood by the in-memory database.
+"""
+import json
+import time
+
+
+class AQLError(Exception):
+
+    def __init__(self, message: str, code: int = 1500):
+        super().__init__(message)
+        self.error_num = code
+        self.message = message
+
+
+def _rank(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, list):
+        return 4
+    return 5
+
+
+def compare(a, b) -> int:
+    rank_a, rank_b = _rank(a), _rank(b)
+    if rank_a != rank_b:
+        return -1 if rank_a < rank_b else 1
+    if rank_a == 0:
+        return 0
+    if rank_a == 4:
+        for item_a, item_b in zip(a, b):
+            result = compare(item_a, item_b)
+            if result != 0:
+                return result
+        return compare(len(a), len(b))
+    if rank_a == 5:
+        for key in sorted(set(a) | set(b)):
+            result = compare(a.get(key, None), b.get(key, None))
+            if result != 0:
+                return result
+        return 0
+    return (a > b) - (a < b)
+
+
+def equals(a, b) -> bool:
+    return compare(a, b) == 0
+
+
+def truthy(value) -> bool:
+    if value is None or value is False:
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value != 0
+    if isinstance(value, str):
+        return value != ''
+    return True
+
+
+def to_number(_, value):
+    if value is None or value is False:
+        return 0
+    if value is True:
+        return 1
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            number = float(value.strip() or 0)
+        except ValueError:
+            return 0
+        return int(number) if number.is_integer() else number
+    if isinstance(value, list):
+        return to_number(None, value[0]) if len(value) == 1 else 0
+    return 0
+
+
+def to_string(_, value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    return json.dumps(value, separators=(',', ':'))
+
+
+def _names(args) -> set:
+    names = set()
+    for arg in args:
+        if isinstance(arg, list):
+            names.update(_names(arg))
+        else:
+            names.add(arg)
+    return names
+
+
+def keep(_, doc, *names):
+    if not isinstance(doc, dict):
+        return None
+    wanted = _names(names)
+    return {k: v for k, v in doc.items() if k in wanted}
+
+
+def unset(_, doc, *names):
+    if not isinstance(doc, dict):
+        return None
+    unwanted = _names(names)
+    return {k: v for k, v in doc.items() if k not in unwanted}
+
+
+def merge(_, *docs):
+    if len(docs) == 1 and isinstance(docs[0], list):
+        docs = docs[0]
+    result = {}
+    for doc in docs:
+        if not isinstance(doc, dict):
+            raise AQLError('invalid argument type in call to function MERGE()', 1542)
+        result.update(doc)
+    return result
+
+
+def length(ctx, value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, (list, dict)):
+        return len(value)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return len(to_string(ctx, value))
+    return len(value)
+
+
+def parse_identifier(_, value):
+    if isinstance(value, dict):
+        value = value.get('_id', None)
+    if not isinstance(value, str) or '/' not in value:
+        return None
+    collection, key = value.split('/', 1)
+    return {'collection': collection, 'key': key}
+
+
+def document(ctx, *args):
+    if len(args) == 2:
+        collection, ids = args
+        if isinstance(ids, list):
+            return [doc for doc in (document(ctx, collection, i) for i in ids)
+                    if doc is not None]
+        if isinstance(ids, str) and '/' not in ids:
+            ids = f'{collection}/{ids}'
+        return ctx.db.document(ids)
+    ids = args[0]
+    if isinstance(ids, list):
+        return [doc for doc in (ctx.db.document(i) for i in ids) if doc is not None]
+    if isinstance(ids, dict):
+        ids = ids.get('_id', None)
+    return ctx.db.document(ids) if isinstance(ids, str) else None
+
+
+def _numbers(values: list) -> list:
+    return [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+
+
+def _aggregate(function):
+    def aggregate(_, values):
+        if not isinstance(values, list):
+            return None
+        return function([v for v in values if v is not None])
+    return aggregate
+
+
+def _average(values: list):
+    numbers = _numbers(values)
+    return sum(numbers) / len(numbers) if numbers else None
+
+
+def _flatten(values: list, depth: int = 1) -> list:
+    flat = []
+    for value in values:
+        if isinstance(value, list) and depth > 0:
+            flat.extend(_flatten(value, depth - 1))
+        else:
+            flat.append(value)
+    return flat
+
+
+def _unique(_, values) -> list:
+    unique = []
+    for value in values or []:
+        if not any(equals(value, other) for other in unique):
+            unique.append(value)
+    return unique
+
+
+def _slice(_, values, start, count=None):
+    start = int(start)
+    if count is None:
+        return values[start:]
+    return values[start:start + int(count)]
+
+
+FUNCTIONS = {
+    'KEEP': keep,
+    'UNSET': unset,
+    'MERGE': merge,
+    'LENGTH': length,
+    'COUNT': length,
+    'FIRST': lambda _, values: values[0] if isinstance(values, list) and values else None,
+    'LAST': lambda _, values: values[-1] if isinstance(values, list) and values else None,
+    'PARSE_IDENTIFIER': parse_identifier,
+    'DOCUMENT': document,
+    'HAS': lambda _, doc, name: isinstance(doc, dict) and name in doc,
+    'ATTRIBUTES': lambda _, doc, *__: list(doc) if isinstance(doc, dict) else None,
+    'VALUES': lambda _, doc, *__: list(doc.values()) if isinstance(doc, dict) else None,
+    'CONCAT': lambda ctx, *values: ''.join(
+        to_string(ctx, v) for v in _flatten(list(values))),
+    'TO_STRING': to_string,
+    'TO_NUMBER': to_number,
+    'TO_BOOL': lambda _, value: truthy(value),
+    'TO_ARRAY': lambda _, value: (
+        [] if value is None else value if isinstance(value, list)
+        else list(value.values()) if isinstance(value, dict) else [value]),
+    'IS_NULL': lambda _, value: value is None,
+    'NOT_NULL': lambda _, *values: next((v for v in values if v is not None), None),
+    'SUM': _aggregate(lambda values: sum(_numbers(values))),
+    'MIN': _aggregate(lambda values: min(values, default=None, key=_SortKey)),
+    'MAX': _aggregate(lambda values: max(values, default=None, key=_SortKey)),
+    'AVERAGE': _aggregate(_average),
+    'AVG': _aggregate(_average),
+    'APPEND': lambda _, values, other, unique=False: (values or []) + [
+        v for v in (other if isinstance(other, list) else [other])
+        if not unique or not any(equals(v, o) for o in values or [])],
+    'PUSH': lambda _, values, value, unique=False: (values or []) + (
+        [] if unique and any(equals(value, o) for o in values or []) else [value]),
+    'UNIQUE': _unique,
+    'FLATTEN': lambda _, values, depth=1: _flatten(values or [], int(depth)),
+    'SLICE': _slice,
+    'LOWER': lambda ctx, value: to_string(ctx, value).lower(),
+    'UPPER': lambda ctx, value: to_string(ctx, value).upper(),
+    'DATE_NOW': lambda _: int(time.time() * 1000),
+    'ZIP': lambda _, keys, values: dict(zip(keys, values)),
+    'COLLECTION_COUNT': lambda ctx, name: len(ctx.db.documents(name)),
+    'COLLECTIONS': lambda ctx: [{'_id': name, 'name': name}
+                                for name in ctx.db.collection_names()],
+}
+
+
+class _SortKey:
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return compare(self.value, other.value) < 0
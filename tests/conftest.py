@@ -16,6 +16,7 @@ import pytest
 from sanic.websocket import WebSocketProtocol
 
 from neume_hq.app import get_app
+from neume_hq.testing.arango import MemoryArangoDB
 
 @pytest.yield_fixture
 def app():
@@ -82,3 +83,15 @@ async def people_ids(loop):
             async for _id in client.query('FOR v in people RETURN v._id'):
                 yield _id
     return _get_ids
+
+
+@pytest.fixture
+async def memory_db(loop):
+    db = MemoryArangoDB()
+    await db.login()
+    await db.create_collection('people')
+    await db.create_index('people', {'type': 'hash', 'fields': ['email'],
+                                     'unique': True, 'sparse': True})
+    await db.create_graph('personGraph', [
+        {'collection': 'knows', 'from': ['people'], 'to': ['people']}])
+    return db
@@ -93,3 +93,56 @@ async def test_create_friends(people_ids, test_cli, url_builder, dumps):
             data = await resp.json()
             pprint(data)
             assert 'data' in data.keys()
+
+async def test_create_people_bulk(test_cli, url_builder, dumps, user_data):
+    people = [*user_data]
+    query = ('mutation '
+             'peopleCreation($people: [PersonInput]!) {'
+             '  createManyPerson(input: $people)'
+             '  { index, ok, error, node { Id, name } }'
+             '}')
+    resp = await test_cli.post(
+        url_builder(
+            query=query,
+            variables=dumps({'people': people})
+        )
+    )
+    assert resp.status == 200
+    data = await resp.json()
+    results = data['data']['createManyPerson']
+    assert [r['index'] for r in results] == list(range(len(people)))
+    for person, result in zip(people, results):
+        if result['ok']:
+            assert result['node']['name'] == person['name']
+        else:
+            assert result['error']
+
+
+async def test_update_people_bulk(test_cli, url_builder, dumps, user_data):
+    create = ('mutation '
+              'peopleCreation($people: [PersonInput]!) {'
+              '  createManyPerson(input: $people)'
+              '  { ok, node { Id } }'
+              '}')
+    resp = await test_cli.post(
+        url_builder(query=create, variables=dumps({'people': [*user_data]})))
+    created = [r['node']['Id'] for r in (await resp.json())['data']['createManyPerson']
+               if r['ok']]
+    assert len(created) > 0
+    update = ('mutation '
+              'peopleUpdate($people: [PersonUpdateInput]!) {'
+              '  updateManyPerson(input: $people)'
+              '  { index, ok, error, node { Id, name } }'
+              '}')
+    people = [{'id': _id, 'name': f'updated{i}'} for i, _id in enumerate(created)]
+    people.append({'id': 'people/does-not-exist', 'name': 'nobody'})
+    resp = await test_cli.post(
+        url_builder(query=update, variables=dumps({'people': people})))
+    assert resp.status == 200
+    results = (await resp.json())['data']['updateManyPerson']
+    assert [r['index'] for r in results] == list(range(len(people)))
+    for person, result in zip(people[:-1], results):
+        assert result['ok'] is True
+        assert result['node'] == {'Id': person['id'], 'name': person['name']}
+    assert results[-1]['ok'] is False
+    assert 'not found' in results[-1]['error']
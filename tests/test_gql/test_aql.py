@@ -0,0 +1,55 @@
+"""
+test_aql
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from neume_hq.gql.aql import AGQuery, GraphQuery, compose
+
+
+def test_values_are_bound():
+    q = AGQuery().fi('doc', 'people').f('doc.name').like('" OR true //')
+    assert q.statement == 'FOR doc IN people FILTER doc.name LIKE @value0'
+    assert q.bind_vars == {'value0': '" OR true //'}
+
+
+def test_same_shape_same_statement():
+    compose.cache_clear()
+    for name in ('a%', 'b%', 'c%'):
+        q = GraphQuery('personGraph').f('v.name').like(name)
+        q.batch_statement()
+    info = compose.cache_info()
+    assert info.misses == 1
+    assert info.hits == 2
+
+
+def test_subquery_renames_bind_vars():
+    q = GraphQuery('personGraph').f('e._id').like('knows/%')
+    statement, bind_vars = q.subquery('doc._id', '2', 'v2')
+    assert '@value0_2' in statement
+    assert bind_vars == {'value0_2': 'knows/%'}
+
+
+def test_graph_query_is_immutable():
+    base = GraphQuery('personGraph', direction='INBOUND')
+    messages = base.f('e._id').like('received/%')
+    assert base.bind_vars == {}
+    assert 'FILTER' not in base.batch_statement()
+    statement = messages.batch_statement()
+    assert 'FILTER e._id LIKE @value0' in statement
+    assert messages.bind_vars == {'value0': 'received/%'}
+    assert messages.batch_statement() is statement
+
+
+def test_windowed_statements_limit_per_start():
+    q = GraphQuery('personGraph').f('e._id').like('knows/%')
+    assert 'LIMIT @offset, @limit' in q.batch_statement(windowed=True)
+    statement, bind_vars = q.subquery('doc._id', '2', 'v2', window=(10, 21))
+    assert 'SORT e2._key, v2._key LIMIT @offset_2, @limit_2' in statement
+    assert bind_vars == {'value0_2': 'knows/%', 'offset_2': 10, 'limit_2': 21}
+
+
+def test_count_statement_collects_per_start():
+    q = GraphQuery('personGraph').f('e._id').like('knows/%')
+    statement = q.count_statement()
+    assert 'COLLECT WITH COUNT INTO n RETURN n' in statement
+    assert q.count_statement() is statement
@@ -0,0 +1,54 @@
+"""
+test_backend
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import pytest
+from graphql_server import HttpQueryError
+
+from neume_hq.gql.backend import (PERSISTED_QUERY_NOT_FOUND, CachedBackend,
+                                  PersistedQueries, query_hash)
+
+QUERY = '{ people { edges { node { name }}}}'
+
+
+def persisted(digest):
+    return {'persistedQuery': {'version': 1, 'sha256Hash': digest}}
+
+
+async def test_unknown_hash_is_reported():
+    with pytest.raises(HttpQueryError) as exc:
+        await PersistedQueries().resolve({'extensions': persisted(query_hash(QUERY))})
+    assert exc.value.status_code == 200
+    assert exc.value.message == PERSISTED_QUERY_NOT_FOUND
+
+
+async def test_registered_hash_resolves_query():
+    queries = PersistedQueries()
+    digest = query_hash(QUERY)
+    await queries.resolve({'query': QUERY, 'extensions': persisted(digest)})
+    data = await queries.resolve({'variables': {}}, persisted(digest))
+    assert data['query'] == QUERY
+
+
+async def test_mismatching_hash_is_rejected():
+    with pytest.raises(HttpQueryError):
+        await PersistedQueries().resolve({'query': QUERY, 'extensions': persisted('abc')})
+
+
+def test_documents_are_parsed_once(monkeypatch):
+    backend = CachedBackend()
+    prepared = []
+    prepare = backend.prepare
+    monkeypatch.setattr(backend, 'prepare',
+                        lambda *args: prepared.append(1) or prepare(*args))
+    from graphene import ObjectType, Schema, String
+
+    class Query(ObjectType):
+        name = String()
+
+    schema = Schema(query=Query)
+    first = backend.document_from_string(schema, '{ name }')
+    second = backend.document_from_string(schema, '{ name }')
+    assert first is second
+    assert len(prepared) == 1
@@ -0,0 +1,107 @@
+"""
+test_cache
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import time
+
+from neume_hq.gql.cache import DocumentCache, RedisCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_ttl_cache_expires():
+    cache = TTLCache(ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+async def test_projected_documents_only_serve_subsets():
+    shared = TTLCache()
+    cache = DocumentCache(shared)
+    await cache.put({'_id': 'people/1', '_rev': '1', 'name': 'a'}, ['_id', '_rev', 'name'])
+    assert await cache.get('people/1', ['_id', 'name']) == {'_id': 'people/1', 'name': 'a'}
+    assert await cache.get('people/1', ['_id', 'email']) is None
+    assert await cache.get('people/1') is None
+    # the next request only sees the shared level
+    assert await DocumentCache(shared).get('people/1', ['name']) == {'name': 'a'}
+
+
+async def test_write_through_and_invalidation():
+    shared = TTLCache()
+    cache = DocumentCache(shared)
+    await cache.put({'_id': 'people/1', '_rev': '1', 'name': 'a'}, ['_id', '_rev', 'name'])
+    await cache.put({'_id': 'people/1', '_rev': '2', 'name': 'b', 'email': 'x'})
+    assert await cache.get('people/1', ['name', 'email']) == {'name': 'b', 'email': 'x'}
+    await cache.invalidate('people/1')
+    assert await DocumentCache(shared).get('people/1', ['name']) is None
+
+
+class FakeRedis:
+    """
+    The part of redis.asyncio.Redis RedisCache uses.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.data.get(key, None)
+
+    async def set(self, key, value, px=None):
+        assert isinstance(value, bytes)
+        self.data[key] = value
+        self.expiry[key] = px
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def scan_iter(self, match):
+        for key in [k for k in self.data if k.startswith(match.rstrip('*'))]:
+            yield key
+
+    def pipeline(self):
+        redis, calls = self, []
+
+        class Pipeline:
+            def __getattr__(self, item):
+                return lambda *args: calls.append((item, args))
+
+            async def execute(self):
+                return [await getattr(redis, item)(*args) for item, args in calls]
+        return Pipeline()
+
+
+async def test_redis_cache():
+    client = FakeRedis()
+    cache = RedisCache(None, ttl=2, namespace='docs', client=client)
+    await cache.set('people/1', {'name': 'ada'})
+    assert await cache.get('people/1') == {'name': 'ada'}
+    assert client.data['docs:people/1'] == b'{"name":"ada"}'
+    assert client.expiry['docs:people/1'] == 2000
+    assert await cache.size() == 1
+    assert await cache.pop('people/1') == {'name': 'ada'}
+    assert await cache.get('people/1', 'missing') == 'missing'
+    await cache.set('people/2', 1)
+    await cache.clear()
+    assert await cache.size() == 0
+
+
+async def test_shared_documents_between_caches():
+    shared = RedisCache(None, namespace='docs', client=FakeRedis())
+    await DocumentCache(shared).put({'_id': 'people/1', '_rev': '1', 'name': 'ada'},
+                                    ['_id', '_rev', 'name'])
+    assert await DocumentCache(shared).get('people/1', ['name']) == {'name': 'ada'}
+    assert await DocumentCache(shared).get('people/1', ['email']) is None
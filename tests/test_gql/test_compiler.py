@@ -0,0 +1,75 @@
+"""
+test_compiler
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from neume_hq.api.nodes import Person
+from neume_hq.gql.aql import rename
+from neume_hq.gql.compiler import PREFETCHED, QueryCompiler, hydrate, prefetched
+from neume_hq.gql.models import GQNode
+from neume_hq.gql.selection import selection_sets
+
+from tests.test_gql.test_selection import Info
+
+
+def test_rename_skips_literals_and_attributes():
+    renamed = rename('{"v": v, "status": e.status, "x": doc.v}',
+                     {'v': 'v1', 'e': 'e1'})
+    assert renamed == '{"v": v1, "status": e1.status, "x": doc.v}'
+
+
+def test_compile_nested_selection():
+    Person.__dict__['friends'].get_type()
+    info = Info('{ people { edges { node { name, friends { edges { node { email }}}}}}}')
+    compiler = QueryCompiler(info)
+    ret = compiler.node(Person, 'doc', selection_sets(info, ('edges', 'node')))
+    assert ret.startswith('MERGE(KEEP(doc, @keep1)')
+    assert '"friends": (LET startVertexId2' in ret
+    assert 'GRAPH "personGraph"' in ret
+    keeps = [v for k, v in compiler.bind_vars.items() if k.startswith('keep')]
+    assert ['_id', '_key', '_rev', 'name'] in keeps
+    assert ['_id', '_key', '_rev', 'email'] in keeps
+
+
+def test_aliases_get_their_own_window_and_projection():
+    Person.__dict__['friends'].get_type()
+    info = Info('{ people { edges { node { '
+                'a: friends(first: 1) { edges { node { name }}} '
+                'b: friends(first: 10) { edges { node { email }}}}}}}')
+    compiler = QueryCompiler(info)
+    ret = compiler.node(Person, 'doc', selection_sets(info, ('edges', 'node')))
+    assert '"a": (LET startVertexId2' in ret
+    assert '"b": (LET startVertexId' in ret
+    assert compiler.bind_vars['limit_2'] == 2
+    assert sorted(v for k, v in compiler.bind_vars.items()
+                  if k.startswith('limit_')) == [2, 11]
+    keeps = [v for k, v in compiler.bind_vars.items() if k.startswith('keep')]
+    assert ['_id', '_key', '_rev', 'name'] in keeps
+    assert ['_id', '_key', '_rev', 'email'] in keeps
+
+
+def test_hydrate_attaches_prefetched():
+    person = hydrate({'_id': 'people/1', 'name': 'x',
+                      '_prefetched_': {'friends': []}})
+    assert person.name == 'x'
+    assert person._prefetched_ == {'friends': []}
+    assert prefetched(person, 'friends') == []
+
+
+def test_rows_resolve_like_models():
+    person = hydrate({'_id': 'people/1', 'name': 'x'})
+    assert person.email is None
+    assert prefetched(person, 'friends') is None
+    assert not hasattr(person, '__dict__')
+    assert GQNode.resolve_type(person, None) is Person
+
+
+def test_prefetched_relations_resolve_without_a_coroutine():
+    field = Person.__dict__['friends']
+    field.get_type()
+    info = Info('{ people { edges { node { friends { edges { node { name }}}}}}}')
+    info.path = ['people', 'edges', 0, 'node', 'friends']
+    person = hydrate({'_id': 'people/1', PREFETCHED: {
+        'friends': [{'node': {'_id': 'people/2', 'name': 'b'}}]}})
+    connection = field.resolve(person, info)
+    assert [edge.node.name for edge in connection.edges] == ['b']
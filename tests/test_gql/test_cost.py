@@ -0,0 +1,54 @@
+"""
+test_cost
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from graphql import parse
+
+from neume_hq.api.schema import schema
+from neume_hq.gql.aql import GraphQuery
+from neume_hq.gql.cost import CostAnalyzer
+
+FRIENDS = '''
+query ($first: Int) {
+  people(first: 10) {
+    edges { node { name friends(first: $first) { edges { node { name }}}}}
+  }
+}
+'''
+
+
+def analyze(query, variables=None, **kwargs):
+    return CostAnalyzer(**kwargs).analyze(schema.build(), parse(query), variables)
+
+
+def test_traversal_weight_grows_with_depth_and_direction():
+    assert GraphQuery('g', direction='OUTBOUND').weight == 1
+    assert GraphQuery('g').weight == 2
+    assert GraphQuery('g', depth=(1, 3)).weight == 12
+
+
+def test_page_sizes_multiply_nested_lists():
+    small, depth = analyze(FRIENDS, {'first': 2})
+    large, _ = analyze(FRIENDS, {'first': 20})
+    assert depth == 1
+    # 10 people, each one friends traversal (ANY) plus first friends
+    assert small == 10 * (1 + 2 + 2 * 1)
+    assert large > small
+
+
+def test_fragments_and_introspection_are_counted_right():
+    cost, _ = analyze('''
+        { __schema { types { name } }
+          people(first: 1) { edges { node { ...friends }}}}
+        fragment friends on Person { friends(first: 1) { edges { node { name }}}}
+    ''')
+    assert cost == 1 * (1 + 2 + 1)
+
+
+def test_queries_over_budget_are_rejected():
+    query = '{ people { edges { node { friends { edges { node { friends { edges { node { name }}}}}}}}}}'
+    assert CostAnalyzer().check(schema.build(), parse(query)) is not None
+    assert CostAnalyzer(max_cost=10 ** 9).check(schema.build(), parse(query)) is None
+    error = CostAnalyzer(max_cost=10 ** 9, max_depth=1).check(schema.build(), parse(query))
+    assert 'nests 2 relations' in error.message
@@ -0,0 +1,74 @@
+"""
+test_executor
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+
+import pytest
+
+from neume_hq.gql.executor import EAGER, NativeExecutor, run_eagerly
+
+
+async def immediate(value):
+    return value
+
+
+async def waiting(future):
+    return await future + 1
+
+
+async def failing(future):
+    await future
+    raise ValueError('resolver failed')
+
+
+async def in_task():
+    return asyncio.current_task()
+
+
+async def test_coroutines_without_waits_return_their_value():
+    result = run_eagerly(immediate(42))
+    if EAGER:
+        assert result == 42
+    else:
+        assert await result == 42
+
+
+async def test_coroutines_always_run_in_a_task():
+    # aiohttp timeouts and context variables need the current task
+    result = run_eagerly(in_task())
+    task = result if EAGER else await result
+    assert task is not None
+    assert task is not asyncio.current_task()
+
+
+async def test_waiting_coroutines_continue_as_task():
+    future = asyncio.get_event_loop().create_future()
+    task = run_eagerly(waiting(future))
+    assert isinstance(task, asyncio.Future)
+    future.set_result(1)
+    assert await task == 2
+
+
+async def test_errors_and_cancellation_reach_the_resolver():
+    future = asyncio.get_event_loop().create_future()
+    task = run_eagerly(failing(future))
+    future.set_result(None)
+    with pytest.raises(ValueError):
+        await task
+    task = run_eagerly(waiting(asyncio.get_event_loop().create_future()))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_executor_does_not_keep_tasks():
+    executor = NativeExecutor(loop=asyncio.get_event_loop())
+    future = asyncio.get_event_loop().create_future()
+    assert executor.execute(lambda value: value, 1) == 1
+    promise = executor.execute(waiting, future)
+    future.set_result(1)
+    assert await promise == 2
+    assert executor.futures == []
@@ -0,0 +1,62 @@
+"""
+test_loader
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+
+from neume_hq.gql.loader import CountLoader, TraversalLoader
+
+
+class Query:
+    bind_vars = {}
+
+    def batch_statement(self, projected=False, windowed=False):
+        return 'FOR start IN @ids RETURN start'
+
+    def count_statement(self):
+        return 'FOR start IN @ids RETURN 1'
+
+
+class CountingDB:
+    def __init__(self):
+        self.calls = []
+
+    async def query(self, statement, bind_vars=None):
+        self.calls.append(bind_vars['ids'])
+        for start in bind_vars['ids']:
+            yield {'start': start, 'item': {'node': {'_id': f'{start}-friend'}}}
+
+
+async def test_loader_batches_one_tick():
+    db = CountingDB()
+    context = {'db': db}
+    query = Query()
+    results = await asyncio.gather(*(
+        TraversalLoader.get(context, query).load(f'people/{i}')
+        for i in range(5)
+    ))
+    assert len(db.calls) == 1
+    assert sorted(db.calls[0]) == [f'people/{i}' for i in range(5)]
+    assert results[3] == [{'node': {'_id': 'people/3-friend'}}]
+
+
+async def test_loader_caches_per_request():
+    db = CountingDB()
+    context = {'db': db}
+    query = Query()
+    await TraversalLoader.get(context, query).load('people/1')
+    await TraversalLoader.get(context, query).load('people/1')
+    assert len(db.calls) == 1
+    await TraversalLoader.get({'db': db}, query).load('people/1')
+    assert len(db.calls) == 2
+
+
+async def test_count_loader_is_separate_from_items():
+    db = CountingDB()
+    context = {'db': db}
+    query = Query()
+    await TraversalLoader.get(context, query).load('people/1')
+    assert CountLoader.get(context, query) is not TraversalLoader.get(context, query)
+    await CountLoader.get(context, query).load('people/1')
+    assert len(db.calls) == 2
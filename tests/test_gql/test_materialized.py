@@ -0,0 +1,111 @@
+"""
+test_materialized
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from neume_hq.api.nodes import Person
+from neume_hq.gql.compiler import hydrate
+from neume_hq.gql.materialized import MaterializedLists
+
+from tests.test_gql.test_selection import Info
+
+FIELD = 'Department.employees'
+
+
+def employee(key, **doc):
+    return {'node': {'_id': f'people/{key}', **doc}, 'pId': 'd1'}
+
+
+def test_lists_are_served_until_an_edge_changes():
+    store = MaterializedLists()
+    store.put(FIELD, 'departments/d1', [employee(1)])
+    assert store.get(FIELD, 'departments/d1') == [employee(1)]
+    store.apply({'collection': 'works_at', 'event': 'create',
+                 'doc': {'_id': 'works_at/1', '_from': 'people/2',
+                         '_to': 'departments/d1'}})
+    assert store.get(FIELD, 'departments/d1') is None
+    assert len(store) == 0
+
+
+def test_vertex_updates_are_patched_into_lists():
+    store = MaterializedLists()
+    store.put(FIELD, 'departments/d1', [employee(1, name='a'), employee(2, name='b')])
+    store.apply({'collection': 'people', 'event': 'update',
+                 'doc': {'_id': 'people/1', 'name': 'c'}})
+    items = store.get(FIELD, 'departments/d1')
+    assert [item['node']['name'] for item in items] == ['c', 'b']
+
+
+def test_results_older_than_a_change_are_not_stored():
+    store = MaterializedLists()
+    generation = store.generation
+    store.invalidate('departments/d1')
+    store.put(FIELD, 'departments/d1', [employee(1)], generation)
+    assert store.get(FIELD, 'departments/d1') is None
+
+
+def test_least_recently_used_lists_are_evicted():
+    store = MaterializedLists(max_size=2)
+    for i in range(3):
+        store.put(FIELD, f'departments/d{i}', [employee(i)])
+    assert store.get(FIELD, 'departments/d0') is None
+    assert len(store) == 2
+    store.apply({'collection': 'people', 'event': 'update',
+                 'doc': {'_id': 'people/0', 'name': 'x'}})
+    assert store._members.get('people/0', None) is None
+
+
+def test_lists_expire_after_ttl():
+    store = MaterializedLists(ttl=0)
+    store.put(FIELD, 'departments/d1', [employee(1)])
+    assert store.get(FIELD, 'departments/d1') is None
+    assert len(store) == 0
+    assert store._members == {}
+
+
+def test_writes_only_discard_the_lists_they_touch():
+    store = MaterializedLists()
+    generation = store.generation
+    store.invalidate('departments/d2')
+    store.patch({'_id': 'people/3', 'name': 'x'})
+    store.put(FIELD, 'departments/d1', [employee(1)], generation)
+    assert store.get(FIELD, 'departments/d1') == [employee(1)]
+    store.put(FIELD, 'departments/d3', [employee(3)], generation)
+    assert store.get(FIELD, 'departments/d3') is None
+
+
+def test_long_lists_are_only_marked():
+    store = MaterializedLists(max_items=1)
+    store.put(FIELD, 'departments/d1', [employee(1), employee(2)])
+    assert store.get(FIELD, 'departments/d1') is None
+    assert store.too_long(FIELD, 'departments/d1')
+    store.invalidate('departments/d1')
+    assert not store.too_long(FIELD, 'departments/d1')
+
+
+async def test_materialized_lists_keep_the_window_order(memory_db):
+    field = Person.__dict__['friends']
+    field.get_type()
+    ada, *others = [(await memory_db['personGraph'].vertex_create(
+        'people', {'_key': key, 'name': key}))['_id'] for key in 'mzab']
+    for other in others:
+        await memory_db['personGraph'].edge_create(
+            'knows', {'_from': ada, '_to': other})
+    person = hydrate({'_id': ada})
+    # field_asts of a resolver are its own field
+    info = Info('{ friends { edges { node { name }}}}')
+    info.path = ['people', 'edges', 0, 'node', 'friends']
+    info.context = {'db': memory_db}
+    windowed = await field.resolve(person, info)
+    store = info.context['materialized'] = MaterializedLists(max_items=2)
+    long = await field.resolve(person, info)
+    assert store.too_long(field.key, ada)
+    store.max_items = 10
+    store.invalidate(ada)
+    info.context = {'db': memory_db, 'materialized': store}
+    materialized = await field.resolve(person, info)
+    assert store.get(field.key, ada) is not None
+    names = [[edge.node.name for edge in connection.edges]
+             for connection in (windowed, long, materialized)]
+    assert names[0] == names[1] == names[2]
+    assert sorted(names[0]) == ['a', 'b', 'z']
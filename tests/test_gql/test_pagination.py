@@ -0,0 +1,49 @@
+"""
+test_pagination
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import pytest
+from graphql import GraphQLError
+
+from neume_hq.gql.pagination import (MAX_PAGE_SIZE, from_cursor, list_slice,
+                                     list_window, page_size, page_statement,
+                                     to_cursor, to_offset_cursor)
+
+
+def test_cursor_round_trip():
+    assert from_cursor(to_cursor('12345')) == '12345'
+    assert from_cursor(None) is None
+
+
+def test_invalid_cursor():
+    with pytest.raises(GraphQLError):
+        from_cursor('not-a-cursor')
+
+
+def test_page_size_is_capped():
+    assert page_size(MAX_PAGE_SIZE * 2) == MAX_PAGE_SIZE
+    assert page_size(5) == 5
+
+
+def test_page_statement_shapes():
+    forward = page_statement(after=True, before=False, backward=False)
+    assert 'FILTER doc._key > @after' in forward
+    assert 'SORT doc._key ASC' in forward
+    assert 'doc._key <= @after' in forward
+    backward = page_statement(after=False, before=True, backward=True)
+    assert 'SORT doc._key DESC' in backward
+    assert 'doc._key >= @before' in backward
+    assert '"edge": false' in page_statement(after=False, before=False, backward=False)
+
+
+def test_list_window_pushes_first_and_after():
+    assert list_window(first=10) == (0, 11)
+    assert list_window(first=10, after=to_offset_cursor(9)) == (10, 11)
+    assert list_window(last=5) is None
+
+
+def test_list_slice_backward():
+    assert list_slice(20, last=5) == (15, 20)
+    assert list_slice(20, last=5, before=to_offset_cursor(10)) == (5, 10)
+    assert list_slice(3, after=to_offset_cursor(5)) == (3, 3)
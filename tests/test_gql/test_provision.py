@@ -0,0 +1,119 @@
+"""
+test_provision
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+
+from neume_hq.gql.provision import META, bounded, diff, provision, read_stamp, write_stamp
+from neume_hq.testing.arango import EDGE, MemoryArangoDB
+
+SPEC = {
+    'collections': {'people': False, 'knows': True},
+    'indexes': {'people': [{'type': 'hash', 'fields': ['email'],
+                            'unique': True, 'sparse': True}],
+                'knows': []},
+    'graphs': {'personGraph': [{'collection': 'knows',
+                                'from': ['people'], 'to': ['people']}]}
+}
+
+
+class CountingDB(MemoryArangoDB):
+    def __init__(self):
+        super().__init__()
+        self.ddl = []
+
+    async def create_collection(self, name, doc_type=None, **kwargs):
+        self.ddl.append(('collection', name))
+        return await super().create_collection(name, doc_type=doc_type, **kwargs)
+
+    async def create_index(self, collection, config):
+        self.ddl.append(('index', collection))
+        return await super().create_index(collection, config)
+
+    async def create_graph(self, name, edge_definitions, **kwargs):
+        self.ddl.append(('graph', name))
+        return await super().create_graph(name, edge_definitions, **kwargs)
+
+
+async def test_dry_run_reports_without_applying():
+    db = CountingDB()
+    plan = await provision(db, SPEC, EDGE, dry_run=True)
+    assert plan.report() == [
+        'create edge collection knows',
+        'create collection people',
+        "create hash index on people ['email'] unique sparse",
+        'create graph personGraph']
+    assert db.ddl == []
+
+
+async def test_provision_applies_only_the_diff():
+    db = CountingDB()
+    await db.create_collection('people')
+    db.ddl.clear()
+    await provision(db, SPEC, EDGE)
+    assert sorted(db.ddl) == [('collection', 'knows'), ('graph', 'personGraph'),
+                              ('index', 'people')]
+    assert db.collection('knows').edge is True
+    db.ddl.clear()
+    plan = await provision(db, SPEC, EDGE)
+    assert not plan
+    assert db.ddl == []
+
+
+async def test_conflicting_graph_is_reported():
+    db = MemoryArangoDB()
+    await provision(db, SPEC, EDGE)
+    spec = {**SPEC, 'graphs': {'personGraph': [
+        {'collection': 'knows', 'from': ['people'], 'to': ['departments']}]}}
+    plan = await diff(db, spec)
+    assert plan.conflicts == ['graph personGraph has different edge definitions']
+    assert not plan
+
+
+async def test_bounded_limits_concurrency():
+    running, peak = 0, 0
+
+    async def task():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0)
+        running -= 1
+
+    await bounded(2, (task() for _ in range(10)))
+    assert peak == 2
+
+
+async def test_stamp_lives_in_the_database():
+    db = CountingDB()
+    assert await read_stamp(db) is None
+    await write_stamp(db, 'a')
+    await write_stamp(db, 'b')
+    assert await read_stamp(db) == 'b'
+    assert db.ddl == [('collection', META)]
+    assert await read_stamp(MemoryArangoDB()) is None
+
+
+async def test_listing_stands_in_for_missing_indexes():
+    db = MemoryArangoDB()
+    await provision(db, SPEC, EDGE)
+
+    class Client:
+        query = db.query
+
+    plan = await diff(Client(), SPEC, listing=db.indexes)
+    assert plan.indexes == []
+    assert len((await diff(Client(), SPEC)).indexes) == 1
+
+
+async def test_fulltext_indexes_match_as_arangodb_reports_them():
+    db = CountingDB()
+    spec = {'collections': {'messages': False},
+            'indexes': {'messages': [{'type': 'fulltext', 'fields': ['body'],
+                                      'unique': True, 'sparse': False}]},
+            'graphs': {}}
+    await provision(db, spec, EDGE)
+    index = (await db.indexes('messages'))[1]
+    assert (index['unique'], index['sparse']) == (False, True)
+    assert not await provision(db, spec, EDGE, dry_run=True)
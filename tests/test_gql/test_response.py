@@ -0,0 +1,44 @@
+"""
+test_response
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import gzip
+from collections import OrderedDict
+
+import ujson as json
+
+from neume_hq.gql.response import accepted_encoding, iterencode, json_response
+
+DATA = {'data': OrderedDict(people={'edges': [
+    {'node': {'name': f'person {i}', 'email': None}, 'cursor': str(i)}
+    for i in range(50)
+]})}
+
+
+class Request:
+    def __init__(self, accept_encoding=None):
+        self.headers = {} if accept_encoding is None else {'accept-encoding': accept_encoding}
+
+
+def test_pieces_join_to_the_same_document():
+    assert json.loads(b''.join(iterencode(DATA))) == json.loads(json.dumps(DATA))
+
+
+def test_encoding_negotiation():
+    assert accepted_encoding('gzip, deflate') == 'gzip'
+    assert accepted_encoding('gzip;q=0, deflate') is None
+    assert accepted_encoding(None) is None
+
+
+def test_large_bodies_are_compressed():
+    response = json_response(Request('gzip'), DATA, compress_min_size=100)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.body)) == json.loads(json.dumps(DATA))
+    small = json_response(Request('gzip'), {'data': {}}, compress_min_size=100)
+    assert 'Content-Encoding' not in small.headers
+
+
+def test_small_bodies_are_not_streamed():
+    response = json_response(Request(), {'data': {}}, chunk_size=1024)
+    assert json.loads(response.body) == {'data': {}}
@@ -0,0 +1,40 @@
+"""
+test_schema
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from neume_hq.api.schema import schema
+from neume_hq.testing.arango import MemoryArangoDB
+
+
+class CountingDB(MemoryArangoDB):
+    def __init__(self):
+        super().__init__()
+        self.ddl = 0
+
+    async def create_collection(self, *args, **kwargs):
+        self.ddl += 1
+        return await super().create_collection(*args, **kwargs)
+
+
+async def test_setup_builds_schema_once():
+    db = CountingDB()
+    first = await schema.setup(db)
+    ddl = db.ddl
+    assert ddl > 0
+    assert await schema.setup(db, schema.fingerprint()) is first
+    assert db.ddl == ddl
+
+
+def test_fingerprint_is_stable():
+    assert schema.fingerprint() == schema.fingerprint()
+    assert len(schema.fingerprint()) == 64
+
+
+async def test_bulk_mutation_names():
+    gql_schema = await schema.setup(MemoryArangoDB())
+    names = gql_schema.get_mutation_type().fields.keys()
+    for node in ('Person', 'Media', 'ToDo', 'Knows', 'BelongsTo', 'SentTo', 'Created'):
+        assert f'createMany{node}' in names
+        assert f'updateMany{node}' in names
+    assert 'createKnowss' not in names and 'createToDoes' not in names
@@ -0,0 +1,32 @@
+"""
+test_selection
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from graphql import parse
+
+from neume_hq.api.nodes import Message, Person
+from neume_hq.gql.selection import ALWAYS, projection
+
+
+class Info:
+    def __init__(self, query):
+        document = parse(query)
+        operation, *fragments = document.definitions
+        self.field_asts = operation.selection_set.selections
+        self.fragments = {f.name.value: f for f in fragments}
+        self.context = {}
+
+
+def test_projection_keeps_requested_scalars_only():
+    info = Info('{ people { edges { node { id, name, friends { edges { node { name }}}}}}}')
+    keep = projection(info, Person, ('edges', 'node'))
+    assert keep == sorted({*ALWAYS, 'name'})
+
+
+def test_projection_follows_fragments():
+    info = Info('{ messages { edges { node { ...M }}}} '
+                'fragment M on Message { title, Created }')
+    keep = projection(info, Message, ('edges', 'node'))
+    assert 'title' in keep and '_created' in keep
+    assert 'body' not in keep
@@ -0,0 +1,149 @@
+"""
+test_subscriptions
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+import json
+
+from neume_hq.gql.materialized import MaterializedLists
+from neume_hq.gql.subscriptions import (CREATE, UPDATE, ChangeFeed, RedisFeed,
+                                        _predicate, publish)
+
+
+async def test_changes_fan_out_to_all_subscribers():
+    feed = ChangeFeed()
+    first, second = feed.subscribe('people'), feed.subscribe('people')
+    other = feed.subscribe('messages')
+    await feed.publish('people', CREATE, {'_id': 'people/1'})
+    assert (await first.__anext__())['doc'] == {'_id': 'people/1'}
+    assert (await second.__anext__())['event'] == CREATE
+    assert other._queue.empty()
+
+
+async def test_predicate_narrows_changes():
+    feed = ChangeFeed()
+    subscription = feed.subscribe(
+        'works_at', _predicate(UPDATE, _from='people/1'))
+    await feed.publish('works_at', CREATE, {'_from': 'people/1', 'status': 'new'})
+    await feed.publish('works_at', UPDATE, {'_from': 'people/2', 'status': 'left'})
+    await feed.publish('works_at', UPDATE, {'_from': 'people/1', 'status': 'left'})
+    change = await subscription.__anext__()
+    assert change['doc'] == {'_from': 'people/1', 'status': 'left'}
+    assert subscription._queue.empty()
+
+
+async def test_slow_subscribers_lose_oldest_changes():
+    feed = ChangeFeed(max_queue=2)
+    subscription = feed.subscribe('people')
+    for i in range(3):
+        await feed.publish('people', UPDATE, {'_id': f'people/{i}'})
+    assert subscription.dropped == 1
+    assert (await subscription.__anext__())['doc']['_id'] == 'people/1'
+
+
+async def test_close_ends_iteration_and_unsubscribes():
+    feed = ChangeFeed()
+    subscription = feed.subscribe('people')
+    assert len(feed) == 1
+    await feed.close()
+    assert len(feed) == 0
+    assert [change async for change in subscription] == []
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self._redis = redis
+        self.closed = False
+
+    async def subscribe(self, channel):
+        self._redis.channels[channel] = asyncio.Queue()
+        self.channel = channel
+
+    async def listen(self):
+        if self._redis.failures > 0:
+            self._redis.failures -= 1
+            raise ConnectionError('connection lost')
+        while True:
+            yield {'type': 'message',
+                   'data': await self._redis.channels[self.channel].get()}
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+        self.channels = {}
+        self.closed = False
+        self.failures = 0
+        self.subscriptions = 0
+
+    async def publish(self, channel, data):
+        self.published.append((channel, data))
+        if channel in self.channels:
+            self.channels[channel].put_nowait(data)
+
+    def pubsub(self, **kwargs):
+        self.pubsub_ = FakePubSub(self)
+        self.subscriptions += 1
+        return self.pubsub_
+
+    async def close(self):
+        self.closed = True
+
+
+async def test_redis_feed_publishes_json_to_channel():
+    client = FakeRedis()
+    feed = RedisFeed('redis://', client=client)
+    await feed.publish('people', CREATE, {'_id': 'people/1'})
+    channel, data = client.published[0]
+    assert channel == 'neume:changes'
+    assert json.loads(data)['doc'] == {'_id': 'people/1'}
+
+
+async def test_redis_feed_relays_changes_to_subscribers():
+    client = FakeRedis()
+    feed = RedisFeed('redis://', client=client)
+    subscription = feed.subscribe('people')
+    await asyncio.sleep(0)
+    await feed.publish('people', UPDATE, {'_id': 'people/1'})
+    change = await asyncio.wait_for(subscription.__anext__(), 1)
+    assert change == {'collection': 'people', 'event': UPDATE,
+                      'doc': {'_id': 'people/1'}}
+    await feed.close()
+    assert client.pubsub_.closed and client.closed
+
+
+async def test_listeners_see_every_change():
+    feed = ChangeFeed()
+    changes = []
+    feed.add_listener(changes.append)
+    await feed.publish('knows', CREATE, {'_from': 'people/1', '_to': 'people/2'})
+    assert changes[0]['collection'] == 'knows'
+
+
+async def test_redis_feed_subscribes_again_when_the_connection_drops():
+    client = FakeRedis()
+    client.failures = 1
+    feed = RedisFeed('redis://', client=client)
+    subscription = feed.subscribe('people')
+    while client.subscriptions < 2:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    await feed.publish('people', UPDATE, {'_id': 'people/1'})
+    change = await asyncio.wait_for(subscription.__anext__(), 1)
+    assert change['doc'] == {'_id': 'people/1'}
+    await feed.close()
+
+
+async def test_writes_invalidate_local_lists_before_the_feed_delivers():
+    store = MaterializedLists()
+    store.put('Person.friends', 'people/1', [{'node': {'_id': 'people/2'}}])
+    info = type('Info', (), {'context': {
+        'materialized': store, 'feed': RedisFeed('redis://', client=FakeRedis())}})
+    edge = type('Knows', (), {'_collname_': 'knows'})
+    await publish(info, edge, CREATE, {'_id': 'knows/1', '_from': 'people/1',
+                                       '_to': 'people/3'})
+    assert store.get('Person.friends', 'people/1') is None
@@ -0,0 +1,67 @@
+"""
+test_temporal
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+from datetime import datetime, timedelta, timezone
+
+import arrow
+
+from neume_hq.gql.temporal import (Serialized, serialize_columns, serialize_date,
+                                   serialize_datetime, serialize_time)
+
+VALUES = (1548758400, 1548758400.5, '2019-01-29T10:30:00', '2019-01-29T10:30:00Z',
+          '2019-01-29T10:30:00+02:00', '2019-01-29')
+
+
+def test_fast_path_matches_arrow():
+    for value in VALUES:
+        expected = arrow.get(value)
+        assert serialize_datetime(value) == expected.for_json()
+        assert serialize_date(value) == expected.format('YYYY-MM-DD')
+        assert serialize_time(value) == expected.time().isoformat()
+
+
+def test_repeated_values_are_memoized():
+    serialize_datetime.cache_clear()
+    for _ in range(3):
+        serialize_datetime(1548758400)
+    assert serialize_datetime.cache_info().hits == 2
+
+
+class Field:
+    def __init__(self, type):
+        self.type = type
+
+
+class Stamp:
+    bulk = True
+    serialize = staticmethod(serialize_datetime)
+
+
+class Model:
+    class _meta:
+        fields = {'_created': Field(Stamp), 'name': Field(str)}
+
+
+def test_columns_are_serialized_once_per_value():
+    docs = [{'_created': 1548758400, 'name': 'a'} for _ in range(3)]
+    docs.append({'_created': None, 'name': 'b'})
+    serialize_columns(Model, docs)
+    assert docs[0]['_created'] == '2019-01-29T10:40:00+00:00'
+    assert type(docs[2]['_created']) is Serialized
+    assert docs[3] == {'_created': None, 'name': 'b'}
+    assert docs[0]['name'] == 'a'
+
+
+def test_equal_datetimes_keep_their_timezone():
+    utc = datetime(2019, 1, 29, 23, 0, tzinfo=timezone.utc)
+    east = utc.astimezone(timezone(timedelta(hours=2)))
+    assert utc == east
+    assert serialize_datetime(utc) == '2019-01-29T23:00:00+00:00'
+    assert serialize_datetime(east) == '2019-01-30T01:00:00+02:00'
+    assert serialize_date(utc) == '2019-01-29'
+    assert serialize_date(east) == '2019-01-30'
+    docs = [{'_created': utc}, {'_created': east}]
+    serialize_columns(Model, docs)
+    assert docs[1]['_created'] == '2019-01-30T01:00:00+02:00'
@@ -0,0 +1,44 @@
+"""
+test_tracing
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+
+from neume_hq.gql.tracing import Stats, TracedDB, Tracer
+
+
+class DB:
+    async def fetch_one(self, statement, **kwargs):
+        return {'statement': statement}
+
+    async def query(self, statement, **kwargs):
+        for i in range(3):
+            yield i
+
+
+def test_traced_db_records_round_trips():
+    tracer = Tracer()
+    db = TracedDB(DB(), tracer)
+
+    async def run():
+        await db.fetch_one('RETURN 1')
+        return [row async for row in db.query('FOR i IN 0..2 RETURN i')]
+
+    assert asyncio.get_event_loop().run_until_complete(run()) == [0, 1, 2]
+    extensions = tracer.extensions()
+    assert extensions['db']['queries'] == 2
+    assert extensions['tracing']['version'] == 1
+    assert extensions['tracing']['duration'] >= extensions['db']['duration']
+
+
+def test_stats_aggregate_tracers():
+    stats = Stats()
+    for _ in range(2):
+        tracer = Tracer()
+        tracer.queried('RETURN 1', tracer.offset())
+        stats.add(tracer)
+    snapshot = stats.snapshot()
+    assert snapshot['requests'] == 2
+    assert snapshot['queries'] == 2
+    assert snapshot['slowest'][0]['count'] == 2
@@ -0,0 +1,132 @@
+"""
+test_pool
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import asyncio
+
+import pytest
+from aiohttp import ClientResponseError, ServerDisconnectedError
+
+from neume_hq.pool import LEAST_BUSY, ArangoPool, NoHealthyMember
+
+
+class Client:
+    def __init__(self, address):
+        self.address = address
+        self.down = False
+        self.reset = False
+        self.error = None
+        self.calls = 0
+
+    async def login(self):
+        return self
+
+    async def close(self):
+        pass
+
+    async def fetch_one(self, statement, **kwargs):
+        self.calls += 1
+        if self.down:
+            raise ConnectionRefusedError(self.address)
+        if self.reset:
+            raise ConnectionResetError(self.address)
+        if self.error is not None:
+            raise self.error
+        await asyncio.sleep(0)
+        return self.address
+
+    async def query(self, statement, **kwargs):
+        yield await self.fetch_one(statement, **kwargs)
+
+
+def _pool(**kwargs):
+    return ArangoPool(Client, ['a', 'b', 'c'], health_interval=0, **kwargs)
+
+
+async def test_round_robin():
+    pool = await _pool().login()
+    assert [await pool.fetch_one('RETURN 1') for _ in range(4)] == ['a', 'b', 'c', 'a']
+
+
+async def test_least_busy():
+    pool = await _pool(strategy=LEAST_BUSY).login()
+    pool.members[0].busy = 2
+    pool.members[1].busy = 1
+    assert await pool.fetch_one('RETURN 1') == 'c'
+
+
+async def test_failover_and_recovery():
+    pool = await _pool().login()
+    pool.members[0].client.down = True
+    assert [row async for row in pool.query('RETURN 1')] == ['b']
+    assert pool.members[0].healthy is False
+    assert {await pool.fetch_one('RETURN 1') for _ in range(4)} == {'b', 'c'}
+    pool.members[0].client.down = False
+    assert await pool.check_all() == 3
+    assert pool.members[0].healthy is True
+
+
+async def test_no_healthy_member():
+    pool = await _pool().login()
+    for member in pool.members:
+        member.client.down = True
+    with pytest.raises(NoHealthyMember):
+        await pool.fetch_one('RETURN 1')
+
+
+async def test_writes_only_fail_over_without_connection():
+    pool = await _pool().login()
+    for member in pool.members:
+        member.client.calls = 0
+    pool.members[0].client.reset = True
+    with pytest.raises(ConnectionResetError):
+        await pool.fetch_one('INSERT @doc INTO people RETURN NEW')
+    assert [member.client.calls for member in pool.members] == [1, 0, 0]
+    assert pool.members[0].healthy is False
+
+    pool = await _pool().login()
+    pool.members[0].client.reset = True
+    assert await pool.fetch_one('RETURN 1') == 'b'
+    pool = await _pool().login()
+    pool.members[0].client.down = True
+    assert await pool.fetch_one('INSERT @doc INTO people RETURN NEW') == 'b'
+
+
+async def test_watch_survives_unexpected_errors():
+    pool = ArangoPool(Client, ['a'], health_interval=0.001)
+    await pool.login()
+    calls = 0
+
+    async def check_all():
+        nonlocal calls
+        calls += 1
+        raise RuntimeError('boom')
+
+    pool.check_all = check_all
+    await asyncio.sleep(0.02)
+    assert calls > 1
+    assert not pool._health.done()
+    await pool.close()
+
+
+def _response_error(status):
+    return ClientResponseError(None, (), status=status)
+
+
+@pytest.mark.parametrize('error', [ServerDisconnectedError(), asyncio.TimeoutError(),
+                                   _response_error(503)])
+async def test_hung_or_restarting_members_are_failed_over(error):
+    pool = await _pool().login()
+    pool.members[0].client.error = error
+    assert await pool.fetch_one('RETURN 1') == 'b'
+    assert pool.members[0].healthy is False
+    assert [row async for row in pool.query('RETURN 1')] == ['c']
+
+
+async def test_refused_calls_keep_the_member():
+    pool = await _pool().login()
+    pool.members[0].client.error = _response_error(409)
+    with pytest.raises(ClientResponseError):
+        await pool.fetch_one('RETURN 1')
+    assert pool.members[0].healthy is True
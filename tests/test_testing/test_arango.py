@@ -0,0 +1,122 @@
+"""
+test_arango
+author: Tim "tjtimer" Jedro
+created: 18.10.26
+"""
+import pytest
+
+from neume_hq.gql.gql import UPDATE_BY_KEY
+from neume_hq.gql.pagination import page_statement
+from neume_hq.testing.aql import tokenize
+from neume_hq.testing.functions import AQLError
+
+
+async def _people(db, *names):
+    return [(await db['personGraph'].vertex_create(
+        'people', {'name': name, 'email': f'{name}@example.com'}))['_id']
+        for name in names]
+
+
+async def test_insert_and_filter(memory_db):
+    await _people(memory_db, 'ada', 'bob', 'cy')
+    names = [name async for name in memory_db.query(
+        'FOR doc IN @@collection FILTER doc.name IN @names '
+        'SORT doc.name DESC RETURN doc.name',
+        bind_vars={'@collection': 'people', 'names': ['ada', 'cy']})]
+    assert names == ['cy', 'ada']
+
+
+async def test_unique_index_and_ignore_errors(memory_db):
+    await _people(memory_db, 'ada')
+    rows = [row async for row in memory_db.query(
+        'FOR item IN @items INSERT item.doc INTO @@collection '
+        'OPTIONS {ignoreErrors: true} RETURN {"index": item.index, "new": NEW}',
+        bind_vars={'@collection': 'people', 'items': [
+            {'index': 0, 'doc': {'email': 'ada@example.com'}},
+            {'index': 1, 'doc': {'email': 'bob@example.com'}}]})]
+    assert [row['index'] for row in rows] == [1]
+    with pytest.raises(AQLError):
+        await memory_db.fetch_one(
+            'INSERT @doc INTO people RETURN NEW',
+            bind_vars={'doc': {'email': 'ada@example.com'}})
+
+
+async def test_update_merges_and_bumps_rev(memory_db):
+    ada, = await _people(memory_db, 'ada')
+    before = await memory_db['people'].get(ada)
+    after = await memory_db.fetch_one(
+        'FOR doc IN @@collection FILTER doc._key == @key LIMIT 1 '
+        'UPDATE doc WITH @data IN @@collection RETURN NEW',
+        bind_vars={'@collection': 'people', 'key': ada.split('/')[1],
+                   'data': {'name': 'Ada'}})
+    assert after['name'] == 'Ada'
+    assert after['email'] == 'ada@example.com'
+    assert after['_rev'] != before['_rev']
+
+
+async def test_traversal_and_subquery(memory_db):
+    ada, bob, cy = await _people(memory_db, 'ada', 'bob', 'cy')
+    await memory_db['personGraph'].edge_create('knows', {'_from': ada, '_to': bob})
+    await memory_db['personGraph'].edge_create('knows', {'_from': cy, '_to': ada})
+    row = await memory_db.fetch_one(
+        'FOR doc IN [DOCUMENT(@id)] FILTER doc != null '
+        'RETURN MERGE(KEEP(doc, @keep), {"friends": '
+        '(LET startVertexId1 = PARSE_IDENTIFIER(doc._id).key '
+        'FOR v1, e1, p1 IN 1 ANY doc._id GRAPH "personGraph" '
+        'FILTER e1._id LIKE @value0_1 SORT v1.name '
+        'RETURN {"node": KEEP(v1, "name"), "pId": startVertexId1})})',
+        bind_vars={'id': ada, 'keep': ['name'], 'value0_1': 'knows/%'})
+    assert row == {'name': 'ada', 'friends': [
+        {'node': {'name': 'bob'}, 'pId': ada.split('/')[1]},
+        {'node': {'name': 'cy'}, 'pId': ada.split('/')[1]}]}
+    outbound = [v async for v in memory_db.query(
+        'FOR v IN 1..2 OUTBOUND @start GRAPH "personGraph" RETURN v.name',
+        bind_vars={'start': cy})]
+    assert outbound == ['ada', 'bob']
+
+
+async def test_page_statement(memory_db):
+    await _people(memory_db, *'abcde')
+    page = await memory_db.fetch_one(
+        'LET page = (FOR doc IN @@collection FILTER doc._key > @after '
+        'SORT doc._key ASC LIMIT @limit RETURN KEEP(doc, @keep)) '
+        'RETURN {"page": page, "edge": LENGTH(FOR doc IN @@collection '
+        'FILTER doc._key <= @after LIMIT 1 RETURN 1) > 0}',
+        bind_vars={'@collection': 'people', 'after': '2', 'limit': 2,
+                   'keep': ['name']})
+    assert page == {'page': [{'name': 'c'}, {'name': 'd'}], 'edge': True}
+
+
+async def test_collect_with_count(memory_db):
+    await _people(memory_db, 'ada', 'bob')
+    assert await memory_db.fetch_one(
+        'FOR doc IN people COLLECT WITH COUNT INTO total RETURN total') == 2
+
+
+async def test_bind_vars_are_checked(memory_db):
+    with pytest.raises(AQLError):
+        await memory_db.fetch_one('RETURN @missing')
+    with pytest.raises(AQLError):
+        await memory_db.fetch_one('RETURN 1', bind_vars={'unused': 1})
+
+
+async def test_bind_vars_of_an_empty_page_are_declared(memory_db):
+    page = await memory_db.fetch_one(
+        page_statement(after=True, before=False, backward=False,
+                       ret='KEEP(doc, @keep)'),
+        bind_vars={'@collection': 'people', 'limit': 11, 'after': '1',
+                   'keep': ['name']})
+    assert page['page'] == []
+
+
+async def test_bind_vars_of_an_update_matching_nothing_are_declared(memory_db):
+    assert await memory_db.fetch_one(
+        UPDATE_BY_KEY, bind_vars={'@collection': 'people', 'key': 'unknown',
+                                  'data': {'name': 'x'}}) is None
+
+
+def test_tokenize():
+    assert tokenize('FOR x IN 1..3 RETURN "a\\"b"') == [
+        ('name', 'FOR'), ('name', 'x'), ('name', 'IN'), ('number', 1),
+        ('op', '..'), ('number', 3), ('name', 'RETURN'), ('string', 'a"b'),
+        ('eof', None)]